@@ -0,0 +1,297 @@
+"""
+Benchmarks of the trading cycle hot paths with stored baselines.
+
+Exchange and DB calls are served by the backtest SimulatedExchangeAdapter and
+InMemoryOrderStore, market data comes from the tests/data fixtures.
+
+    python benchmarks/hot_paths.py --update-baseline     # record baselines of this machine
+    python benchmarks/hot_paths.py                       # compare, exit 1 on a regression over threshold
+    python benchmarks/hot_paths.py -k trade --repeat 9   # only benchmarks with 'trade' in the name
+"""
+import copy
+import glob
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Callable, Dict
+
+import click
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'src')]
+
+from benchmarks.reference_indicators import reference_indicators  # noqa: E402
+from data.example_exchange_response import example_sell_order  # noqa: E402
+from src.backtest.engine import BacktestTurtleTrader, InMemoryOrderStore  # noqa: E402
+from src.backtest.simulated_exchange import SimulatedAccount, SimulatedExchangeAdapter  # noqa: E402
+from src.model.turtle_model import Order  # noqa: E402
+from src.schemas.order_mapper import load_order, order_values  # noqa: E402
+from src.schemas.turtle_schema import OrderSchema  # noqa: E402
+from scanner import OhlcPanel, panel_bars, scan_panel  # noqa: E402
+from ohlc_cache import OHLC_COLUMNS  # noqa: E402
+from turtle_indicators import TurtleIndicators  # noqa: E402
+from turtle_trader import TurtleParams, TurtleTrader  # noqa: E402
+
+BASELINES_PATH = os.path.join(ROOT, 'benchmarks', 'baselines.json')
+FIXTURES = sorted(glob.glob(os.path.join(ROOT, 'tests', 'data', 'test_ohlc_*.csv')))
+SYMBOL_COUNTS = (1, 10, 100, 1000)
+BAR_COUNTS = (100, 1_000, 10_000, 100_000)
+
+BENCHMARKS: Dict[str, Callable[[], Callable[[], None]]] = {}
+
+
+def benchmark(name: str, **params):
+    """Register `setup(**params) -> run` for every combination of one parameter"""
+
+    def register(setup):
+        (key, values), = params.items()
+        for value in values:
+            BENCHMARKS[f"{name}[{key}={value}]"] = lambda value=value: setup(value)
+        return setup
+
+    return register
+
+
+def synthetic_ohlc(bars: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.03, bars)))
+    open_ = np.r_[close[0], close[:-1]]
+    return pd.DataFrame({
+        'timeframe': 1_600_000_000_000 + np.arange(bars) * 86_400_000,
+        'O': open_,
+        'H': np.maximum(open_, close) * 1.01,
+        'L': np.minimum(open_, close) * 0.99,
+        'C': close,
+        'V': rng.random(bars) * 1e6,
+    })
+
+
+def turtle_indicators(ohlc, params: TurtleParams):
+    """What TurtleTrader.set_curr_market_conditions computes, closed candles committed and the running one peeked"""
+    indicators = TurtleIndicators.from_ohlc(ohlc.iloc[:-1], atr_period=params.atr_period,
+                                            entry_days=params.entry_days, exit_days=params.exit_days)
+    return indicators.peek(next(ohlc.iloc[-1:][OHLC_COLUMNS].itertuples(index=False, name=None)))
+
+
+def pandas_indicators(ohlc, params: TurtleParams):
+    return reference_indicators(ohlc, params.atr_period, params.entry_days, params.exit_days)
+
+
+def indicators_benchmarks(name: str, compute):
+    @benchmark(name, bars=BAR_COUNTS)
+    def indicators_bars(bars):
+        ohlc, params = synthetic_ohlc(bars), TurtleParams()
+        return lambda: compute(ohlc, params)
+
+    @benchmark(name, symbols=SYMBOL_COUNTS)
+    def indicators_symbols(symbols):
+        frames = [pd.read_csv(FIXTURES[i % len(FIXTURES)]) for i in range(symbols)]
+        params = TurtleParams()
+
+        def run():
+            for ohlc in frames:
+                compute(ohlc, params)
+
+        return run
+
+
+# the trader's streaming indicators, and the whole frame pandas implementation they replaced as a reference
+indicators_benchmarks('indicators', turtle_indicators)
+indicators_benchmarks('indicators_pandas_reference', pandas_indicators)
+
+
+@benchmark('universe_scan', symbols=SYMBOL_COUNTS)
+def universe_scan(symbols):
+    # same fixtures as indicators[symbols=...], panel build included
+    frames = {f"T{i}": pd.read_csv(FIXTURES[i % len(FIXTURES)]) for i in range(symbols)}
+    params = TurtleParams()
+    return lambda: scan_panel(OhlcPanel.from_frames(frames, panel_bars(params)), params)
+
+
+def order_loader(load):
+    def setup(orders):
+        payloads = [copy.deepcopy(example_sell_order) for _ in range(orders)]
+
+        def run():
+            for payload in payloads:
+                load(payload)
+
+        return run
+
+    return setup
+
+
+# marshmallow schema against the order mapper, fast and strict, to ORM objects and to column values.
+# The schema is built per order, as in OrderSchema().load(order) the mapper replaced
+benchmark('order_schema_load', orders=SYMBOL_COUNTS)(order_loader(lambda order: OrderSchema().load(order)))
+benchmark('order_mapper_load', orders=SYMBOL_COUNTS)(order_loader(lambda order: load_order(order, strict=False)))
+benchmark('order_mapper_strict', orders=SYMBOL_COUNTS)(order_loader(lambda order: load_order(order, strict=True)))
+benchmark('order_mapper_values', orders=SYMBOL_COUNTS)(order_loader(lambda order: order_values(order, strict=False)))
+
+
+class StubbedTurtleTrader(BacktestTurtleTrader):
+    """BacktestTurtleTrader loading its state like TurtleTrader (market data from a fixture file)"""
+
+    def __init__(self, exchange, store, fixture):
+        TurtleTrader.__init__(self, exchange, db=store, testing_file_path=fixture, load_state=True)
+
+
+def fixture_position(fixture: str, trader: TurtleTrader):
+    """Opened position matching the fixture condition, None for the entry and no condition fixtures"""
+    name = os.path.basename(fixture)
+    if 'exit' not in name and 'pyramid' not in name:
+        return None
+    close, atr = trader.curr_market_conditions.C, trader.curr_market_conditions.ATR
+    action = 'long' if 'long' in name else 'short'
+    sign = 1 if action == 'long' else -1
+    # pyramid fixtures: the price moved one ATR in favour of the position since entry
+    entry = close - sign * atr if 'pyramid' in name else close
+    return dict(id=f"{trader._exchange.market_futures}-1", agg_trade_id='bench', action=action, price=entry,
+                cost=entry, stop_loss_price=entry - sign * 2 * atr, atr=atr, free_balance=10_000.0, pl=None,
+                symbol=trader._exchange.market_futures, position_status='opened',
+                timestamp=trader.curr_market_conditions.timeframe)
+
+
+def stubbed_traders(symbols: int):
+    account, store = SimulatedAccount(), InMemoryOrderStore()
+    traders = []
+    for i in range(symbols):
+        exchange = SimulatedExchangeAdapter(account, f"S{i}")
+        traders.append(StubbedTurtleTrader(exchange, store, FIXTURES[i % len(FIXTURES)]))
+    return traders
+
+
+@benchmark('trader_construction', symbols=SYMBOL_COUNTS)
+def trader_construction(symbols):
+    return lambda: stubbed_traders(symbols)
+
+
+@benchmark('trade_decision', symbols=SYMBOL_COUNTS)
+def trade_decision(symbols):
+    traders = stubbed_traders(symbols)
+    positions = [fixture_position(FIXTURES[i % len(FIXTURES)], trader) for i, trader in enumerate(traders)]
+
+    def run():
+        # fresh account and order store, every repetition makes the same decisions
+        account, store = SimulatedAccount(), InMemoryOrderStore()
+        for trader, position in zip(traders, positions):
+            exchange = trader._exchange
+            exchange._account = account
+            exchange.balance = None
+            exchange.mark(trader.curr_market_conditions.timeframe, trader.curr_market_conditions.C)
+            trader._database = store
+            if position:
+                store.add(Order(**position))
+                account.positions[exchange.market_futures] = {
+                    'side': position['action'], 'contracts': 1.0, 'cost': position['cost']
+                }
+            trader.get_opened_positions()
+            trader.trade()
+
+    return run
+
+
+def measure(setup: Callable, repeat: int, min_time: float) -> float:
+    """Median seconds of one run, runs are looped until a measurement takes at least min_time"""
+    run = setup()
+    run()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 10
+
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        timings.append((time.perf_counter() - start) / number)
+    return statistics.median(timings)
+
+
+def machine():
+    return {'node': platform.node(), 'machine': platform.machine(), 'python': platform.python_version()}
+
+
+def load_baselines(path: str) -> dict:
+    with open(path) as ff:
+        return json.load(ff)
+
+
+def format_seconds(seconds) -> str:
+    if seconds is None:
+        return '-'
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+@click.command()
+@click.option('-k', '--keyword', type=str, default=None, help='run only benchmarks containing this string')
+@click.option('--repeat', type=int, default=5, help='measurements per benchmark, the median is reported')
+@click.option('--min-time', type=float, default=0.2, help='minimal seconds of one measurement')
+@click.option('--threshold', type=float, default=0.25, help='allowed slowdown against baseline, 0.25 = 25%')
+@click.option('--baselines', 'baselines_path', type=click.Path(dir_okay=False), default=BASELINES_PATH)
+@click.option('--update-baseline', is_flag=True, help='store the results as new baselines')
+@click.option('--json-out', type=click.Path(dir_okay=False), default=None)
+def main(keyword, repeat, min_time, threshold, baselines_path, update_baseline, json_out):
+    if not os.path.exists(baselines_path):
+        if not update_baseline:
+            raise click.ClickException(f"No baselines in {baselines_path}, record them with --update-baseline")
+        stored = {}
+    else:
+        stored = load_baselines(baselines_path)
+    baselines = stored.get('results', {})
+    if stored and stored.get('machine') != machine():
+        click.echo(f"Baselines were recorded on {stored.get('machine')}, comparison may not be meaningful")
+
+    logging.disable(logging.WARNING)
+
+    results, regressions, missing = {}, [], []
+    click.echo(f"{'benchmark':<40}{'median':>12}{'baseline':>12}{'change':>9}")
+    for name, setup in BENCHMARKS.items():
+        if keyword and keyword not in name:
+            continue
+        results[name] = measure(setup, repeat, min_time)
+        baseline = baselines.get(name)
+        change = results[name] / baseline - 1 if baseline else None
+        regressed = change is not None and change > threshold
+        if regressed:
+            regressions.append(name)
+        if baseline is None:
+            missing.append(name)
+        click.echo(f"{name:<40}{format_seconds(results[name]):>12}{format_seconds(baseline):>12}"
+                   f"{'' if change is None else f'{change:+.0%}':>9}{'  REGRESSION' if regressed else ''}")
+
+    if json_out:
+        with open(json_out, 'w') as ff:
+            ff.write(json.dumps(results, indent=4))
+
+    if update_baseline:
+        baselines.update(results)
+        with open(baselines_path, 'w') as ff:
+            ff.write(json.dumps({'machine': machine(), 'results': baselines}, indent=4))
+        click.echo(f"Baselines saved to {baselines_path}")
+    else:
+        if missing:
+            click.echo(f"{len(missing)} benchmarks have no baseline, record them with --update-baseline: {missing}")
+        if regressions:
+            click.echo(f"{len(regressions)} benchmarks regressed over {threshold:.0%}: {regressions}")
+        if missing or regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Turtle indicators computed with pandas over a whole OHLC DataFrame.
+
+The trader keeps them incrementally in turtle_indicators.TurtleIndicators, this is the
+reference it is tested and benchmarked against.
+"""
+import pandas as pd
+
+
+def calculate_atr(df, period):
+    """
+    Calculate the Average True Range (ATR) for given OHLCV DataFrame.
+
+    Parameters:
+    - df: pandas DataFrame with columns 'H', 'L', and 'C'.
+    - period: the period over which to calculate the ATR.
+
+    Returns:
+    - df with the 'ATR' column added.
+    """
+    # Calculate true ranges
+    df['High-Low'] = df['H'] - df['L']
+    df['High-PrevClose'] = abs(df['H'] - df['C'].shift(1))
+    df['Low-PrevClose'] = abs(df['L'] - df['C'].shift(1))
+
+    # Find the max of the true ranges
+    df['TrueRange'] = df[['High-Low', 'High-PrevClose', 'Low-PrevClose']].max(axis=1)
+
+    # Calculate the ATR
+    df['ATR'] = df['TrueRange'].rolling(window=period, min_periods=1).mean()
+
+    # Clean up the DataFrame by removing the intermediate columns
+    df.drop(['High-Low', 'High-PrevClose', 'Low-PrevClose', 'TrueRange'], axis=1, inplace=True)
+
+    return df
+
+
+def turtle_trading_signals_adjusted(df, entry_days, exit_days):
+    """
+    Identify Turtle Trading entry and exit signals for both long and short positions, adjusting for early rows.
+
+    Parameters:
+    - df: pandas DataFrame with at least 'H' and 'L' columns.
+    - entry_days: window of the entry channel.
+    - exit_days: window of the exit channel.
+
+    Adds columns to df:
+    - 'd20_High': Highest high over the previous entry_days, adjusting for early rows.
+    - 'd20_Low': Lowest low over the previous entry_days, adjusting for early rows.
+    - 'd10_High': Highest high over the previous exit_days, adjusting for early rows.
+    - 'd10_Low': Lowest low over the previous exit_days, adjusting for early rows.
+    - 'Long_Entry': Signal for entering a long position.
+    - 'Long_Exit': Signal for exiting a long position.
+    - 'Short_Entry': Signal for entering a short position.
+    - 'Short_Exit': Signal for exiting a short position.
+    """
+    df['datetime'] = pd.to_datetime(df['timeframe'], unit='ms')
+    # Calculate rolling max/min for the required windows with min_periods=1
+    df['d20_High'] = df['H'].rolling(window=entry_days, min_periods=1).max()
+    df['d20_Low'] = df['L'].rolling(window=entry_days, min_periods=1).min()
+    df['d10_High'] = df['H'].rolling(window=exit_days, min_periods=1).max()
+    df['d10_Low'] = df['L'].rolling(window=exit_days, min_periods=1).min()
+
+    # Entry signals
+    df['Long_Entry'] = df['H'] > df['d20_High'].shift(1)
+    df['Short_Entry'] = df['L'] < df['d20_Low'].shift(1)
+
+    # Exit signals
+    df['Long_Exit'] = df['L'] < df['d10_Low'].shift(1)
+    df['Short_Exit'] = df['H'] > df['d10_High'].shift(1)
+
+    return df
+
+
+def reference_indicators(df, atr_period, entry_days, exit_days):
+    """Copy of df with the ATR, channels and signals of every row"""
+    return turtle_trading_signals_adjusted(calculate_atr(df.copy(), atr_period), entry_days, exit_days)
@@ -0,0 +1,182 @@
+import logging
+import traceback
+
+import ccxt
+import ccxt.async_support as ccxt_async
+import pandas as pd
+
+from config import app_config, SLACK_URL
+from exchange_adapter import (ExchangeAdapter,
+                              EXCHANGE_READ_POLICY,
+                              EXCHANGE_ORDER_POLICY,
+                              EXCHANGE_CLOSE_POLICY)
+from src.utils.metrics import span
+from src.utils.notifier import QueuedNotifier
+from src.utils.rate_limiter import share_rate_limit
+
+_notifier = QueuedNotifier(url=SLACK_URL, username='Async exchange adapter')
+_logger = logging.getLogger(__name__)
+
+
+def create_async_exchange(exchange_id: str) -> ccxt_async.Exchange:
+    """Async ccxt exchange object, share it between adapters to reuse one connection pool"""
+    _logger.info(f"creating async exchange object")
+    _exchange_class = getattr(ccxt_async, exchange_id)
+    _exchange = _exchange_class(app_config.EXCHANGES[exchange_id])
+
+    if app_config.USE_SANDBOX:
+        _logger.info(f"using SANDBOX")
+        _exchange.set_sandbox_mode(True)
+    return share_rate_limit(exchange_id, _exchange)
+
+
+class AsyncExchangeAdapter(ExchangeAdapter):
+    """ExchangeAdapter with awaitable network calls built on ccxt.async_support.
+
+    Properties and `order()` dispatch are inherited, `order()` returns a coroutine.
+    Pass `exchange` to share one async ccxt object (and its aiohttp session) between adapters.
+    """
+
+    def __init__(self,
+                 exchange_id,
+                 market: str = None,
+                 collateral: str = 'USDT',
+                 exchange: ccxt_async.Exchange = None):
+        self._shared_exchange = exchange
+        super().__init__(exchange_id, market, collateral)
+
+    def _create_exchange_object(self) -> ccxt_async.Exchange:
+        if self._shared_exchange is not None:
+            return self._shared_exchange
+        return create_async_exchange(self._exchange_id)
+
+    async def close(self):
+        await self._exchange.close()
+
+    async def load_exchange(self, force_refresh=True):
+        if force_refresh or not self._exchange.markets:
+            _logger.info(f"Loading markets on {self._exchange.id}")
+            with span('exchange.load_markets'):
+                self.markets = await self._exchange.load_markets(True)
+        else:
+            self.markets = self._exchange.markets
+        _logger.info("Markets loaded successfully")
+
+    @property
+    def free_balance(self):
+        # balance has to be awaited by fetch_balance() before
+        if self.balance:
+            return self.balance['free'][self._collateral]
+        return 0
+
+    @property
+    def total_balance(self):
+        if self.balance:
+            return self.balance['total'][self._collateral]
+        return 0
+
+    @EXCHANGE_READ_POLICY.retry('exchange.fetch_ohlcv')
+    async def fetch_ohlc(self, since, timeframe: str = '1d'):
+        candles = await self._exchange.fetchOHLCV(self._market, timeframe=timeframe, since=since)
+        candles_df = pd.DataFrame(candles, columns=['timeframe', 'O', 'H', 'L', 'C', 'V'])
+        candles_df['datetime'] = pd.to_datetime(candles_df['timeframe'], unit='ms')
+        return candles_df
+
+    @EXCHANGE_READ_POLICY.retry('exchange.fetch_balance')
+    async def fetch_balance(self, min_balance=50):
+        _logger.info(f"getting balance")
+        self.balance = await self._exchange.fetch_balance()
+
+    @EXCHANGE_READ_POLICY.retry('exchange.fetch_ticker')
+    async def close_price(self):
+        _logger.info(f"getting close price")
+        ticker = await self._exchange.fetch_ticker(symbol=self.market_futures)
+        return ticker['close']
+
+    @EXCHANGE_READ_POLICY.retry('exchange.fetch_positions')
+    async def opened_position(self):
+        _logger.info(f"getting open positions")
+
+        if self._exchange_id == 'binance':
+            open_positions = await self._exchange.fetch_account_positions(
+                symbols=[self.market_futures]
+            )
+        else:
+            open_positions = await self._exchange.fetchPositions(
+                symbols=[self.market_futures]
+            )
+
+        if open_positions:
+            self._open_position = open_positions[0]
+
+    @EXCHANGE_ORDER_POLICY.retry('exchange.enter_position')
+    async def enter_position(self, side, amount):
+        _logger.info(f"entering {str.upper(side)} position")
+
+        try:
+            _logger.info(f"creating order: {side}, "
+                         f"amount: {amount}, "
+                         f"params: {self.params}")
+            with span('exchange.create_order'):
+                order = await self._exchange.create_order(
+                    symbol=self.market_futures,
+                    type='market',
+                    side=side,
+                    amount=amount,
+                    params=self.params
+                )
+
+            _notifier.info(f"{str.upper(side)} {self.market} | amount: {amount}")
+            return order
+
+        except (ccxt.NetworkError, ccxt.ExchangeError) as e:
+            msg = (f"{self._exchange.id} enter_position failed "
+                   f"due to a Network or Exchange error: {e}")
+            _logger.error(msg)
+            raise
+
+        except Exception as e:
+            msg = f"{self._exchange.id} enter_position failed with: {traceback.format_exc()}"
+            _logger.error(msg)
+            raise
+
+    @EXCHANGE_CLOSE_POLICY.retry('exchange.close_position')
+    async def close_position(self):
+        _logger.info(f"closing position")
+
+        params = {'reduceOnly': True}
+        try:
+            await self.opened_position()
+
+            if not self.open_position_side:
+                _logger.warning(f"no open position to close: {self.open_position_side}")
+                _notifier.warning(f"no open position to close: {self.open_position_side}")
+                return None
+
+            side = 'buy' if self.open_position_side == 'sell' else 'sell'
+
+            _logger.info(f"creating order: {side}, "
+                         f"amount: {self.open_position_amount}, "
+                         f"params: {params}")
+            with span('exchange.create_order'):
+                order = await self._exchange.create_order(
+                    symbol=self.market_futures,
+                    type='market',
+                    side=side,
+                    amount=self.open_position_amount,
+                    params=params
+                )
+
+            _notifier.info(f"order CLOSE {str.upper(side)}")
+            return order
+
+        except (ccxt.NetworkError, ccxt.ExchangeError) as e:
+            msg = (f"{self._exchange.id} close_position failed "
+                   f"due to a Network or Exchange error: {e}")
+            _logger.error(msg)
+            raise
+
+        except Exception as e:
+            msg = f"{self._exchange.id} close_position failed with: {traceback.format_exc()}"
+            _logger.error(msg)
+            raise
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+
+from async_exchange_adapter import AsyncExchangeAdapter
+from src.model.database import PooledDatabase
+from turtle_trader import TurtleTrader
+
+_logger = logging.getLogger(__name__)
+
+
+class AsyncTurtleTrader(TurtleTrader):
+    """TurtleTrader driven from an event loop.
+
+    Trading decisions are shared with TurtleTrader, exchange calls are awaited on the
+    AsyncExchangeAdapter and the blocking DB calls run in the default thread executor.
+    Create it and `await trader.load_state()` before `await trader.trade()`.
+    Traders of one cycle share `entry_lock`, their entries run one at a time (see get_entry_lock).
+    """
+
+    def __init__(self, exchange: AsyncExchangeAdapter, db: PooledDatabase = None, entry_lock: asyncio.Lock = None):
+        super().__init__(exchange, db, load_state=False)
+        self._entry_lock = entry_lock or asyncio.Lock()
+
+    async def load_state(self):
+        await asyncio.to_thread(self.get_opened_positions)
+        ohlc = await self._exchange.fetch_ohlc(since=self.ohlc_since_timestamp())
+        self.set_curr_market_conditions(ohlc)
+
+    async def log_total_pl(self):
+        asset_pl, total_pl = await asyncio.to_thread(self.get_pl)
+        self.report_pl(asset_pl, total_pl)
+
+    async def save_order(self, order, action, position_status='opened'):
+        _logger.info('Saving order to file and DB')
+        await asyncio.to_thread(self.save_raw_order, order)
+        await self._exchange.fetch_balance()
+        order_object = self.build_order_object(order, action, position_status)
+        await asyncio.to_thread(self.commit_order_to_db, order_object)
+
+    async def entry_position(self, action):
+        async with self._entry_lock:
+            await self._exchange.fetch_balance()
+            amount = self.calc_entry_amount()
+            if amount is None:
+                return
+
+            _logger.info(f'Creating {action} order. '
+                         f'Adjusted Amount with Precision {self._exchange.amount_precision}: {amount}')
+            order = await self._exchange.order(action, amount)
+
+        if order:
+            await self.save_order(order, action)
+
+    async def exit_position(self):
+        action = 'close'
+        order = await self._exchange.order(action)
+        if order:
+            _logger.info('Saving close order to file and DB')
+            await asyncio.to_thread(self.save_raw_order, order)
+            await self._exchange.fetch_balance()
+            order_object = self.build_order_object(order, action, position_status='closed')
+            pl = await asyncio.to_thread(self.commit_close_order, order_object)
+            self.report_pl(*pl)
+
+    async def execute_action(self, action):
+        if action == 'close':
+            await self.exit_position()
+        elif action:
+            await self.entry_position(action)
+
+    async def process_opened_position(self):
+        await self.execute_action(self.opened_position_action())
+
+    async def trade(self):
+        await self.execute_action(self.next_action())
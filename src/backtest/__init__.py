@@ -0,0 +1,2 @@
+from src.backtest.engine import Backtester, BacktestResult, load_ohlc_dir
+from src.backtest.sweep import ParameterSweep
@@ -0,0 +1,266 @@
+import glob
+import heapq
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass, fields
+from typing import Dict
+
+import pandas as pd
+
+from ohlc_cache import OHLC_COLUMNS
+from src.backtest.simulated_exchange import SimulatedAccount, SimulatedExchangeAdapter
+from turtle_indicators import TurtleIndicators
+from turtle_trader import (TurtleTrader,
+                           TurtleParams,
+                           CurrMarketConditions,
+                           LastOpenedPosition,
+                           AssetAllocationOverRiskLimit)
+
+_logger = logging.getLogger(__name__)
+
+MARKET_CONDITIONS_FIELDS = [field.name for field in fields(CurrMarketConditions)]
+
+
+class InMemoryOrderStore:
+    """Orders of a backtest run, stands in for the turtle_strategy.orders table"""
+
+    def __init__(self):
+        self.orders = []
+        self._opened = defaultdict(list)
+        self._pl = defaultdict(float)
+
+    def add(self, order):
+        self.orders.append(order)
+        self._pl[order.symbol] += order.pl or 0.0
+        if order.position_status == 'opened':
+            self._opened[order.symbol].append(order)
+
+    def opened(self, symbol):
+        return self._opened[symbol]
+
+    def close(self, symbol, ids):
+        for order in self._opened[symbol]:
+            if order.id in ids:
+                order.position_status = 'closed'
+        self._opened[symbol] = [order for order in self._opened[symbol] if order.position_status == 'opened']
+
+    def pl(self, symbol=None):
+        if symbol is None:
+            return sum(self._pl.values())
+        return self._pl[symbol]
+
+
+class BacktestTurtleTrader(TurtleTrader):
+    """TurtleTrader with its DB calls served by an InMemoryOrderStore"""
+
+    def __init__(self, exchange: SimulatedExchangeAdapter, store: InMemoryOrderStore, params: TurtleParams = None):
+        super().__init__(exchange, db=store, load_state=False, params=params)
+
+    def get_opened_positions(self):
+        orders = self._database.opened(self._exchange.market_futures)
+        self.set_opened_positions(tuple(LastOpenedPosition.from_order(order) for order in orders))
+
+    def get_pl(self):
+        return self._database.pl(self._exchange.market_futures), self._database.pl()
+
+    def log_total_pl(self):
+        pass
+
+    def report_pl(self, asset_pl, total_pl):
+        pass
+
+    def save_raw_order(self, order):
+        pass
+
+    def commit_order_to_db(self, order_object):
+        self._database.add(order_object)
+        if order_object.position_status == 'opened':
+            self.get_opened_positions()
+
+    def update_closed_orders(self):
+        self._database.close(self._exchange.market_futures, self.opened_positions_ids)
+        self.get_opened_positions()
+
+    def commit_close_order(self, order_object):
+        self._database.add(order_object)
+        self.update_closed_orders()
+        return self.get_pl()
+
+
+@dataclass
+class BacktestResult:
+    trades: pd.DataFrame
+    equity: pd.DataFrame
+    summary: dict
+
+    def save(self, out_dir: str):
+        os.makedirs(out_dir, exist_ok=True)
+        self.trades.to_csv(os.path.join(out_dir, 'trades.csv'), index=False)
+        self.equity.to_csv(os.path.join(out_dir, 'equity.csv'), index=False)
+        with open(os.path.join(out_dir, 'summary.json'), 'w') as ff:
+            ff.write(json.dumps(self.summary, indent=4))
+
+
+def load_ohlc_dir(path: str) -> Dict[str, pd.DataFrame]:
+    """OHLCV history per ticker from <TICKER>.csv files or ohlc cache parquet files"""
+    ohlc = {}
+    for file_path in sorted(glob.glob(os.path.join(path, '*.csv')) + glob.glob(os.path.join(path, '*.parquet'))):
+        name = os.path.basename(file_path).rsplit('.', 1)[0]
+        if file_path.endswith('.csv'):
+            ohlc[name] = pd.read_csv(file_path)
+        else:
+            # ohlc cache file name: <TICKER>-<COLLATERAL>_<timeframe>
+            ohlc[name.split('-')[0]] = pd.read_parquet(file_path)
+    return ohlc
+
+
+def streamed_conditions(ticker: str, ohlc: pd.DataFrame, params: TurtleParams):
+    indicators = TurtleIndicators(params.atr_period, params.entry_days, params.exit_days)
+    for candle in ohlc.sort_values('timeframe')[OHLC_COLUMNS].itertuples(index=False, name=None):
+        yield candle[0], ticker, CurrMarketConditions(**indicators.update(candle))
+
+
+def precomputed_conditions(ticker: str, conditions: pd.DataFrame):
+    for row in conditions[MARKET_CONDITIONS_FIELDS].itertuples(index=False, name=None):
+        yield row[0], ticker, CurrMarketConditions(*row)
+
+
+def summarize(trades: pd.DataFrame, equity: pd.DataFrame, initial_balance: float) -> dict:
+    closed = trades.dropna(subset=['pl'])
+    wins = closed[closed['pl'] > 0]['pl'].sum()
+    losses = -closed[closed['pl'] < 0]['pl'].sum()
+
+    curve = equity['equity']
+    returns = curve.pct_change().dropna()
+    bar_ms = equity['timeframe'].diff().median() if len(equity) > 1 else None
+    periods_per_year = 365 * 86_400_000 / bar_ms if bar_ms else 0
+    sharpe = (returns.mean() / returns.std() * periods_per_year ** 0.5
+              if len(returns) > 1 and returns.std() > 0 else 0.0)
+
+    final_equity = float(curve.iloc[-1]) if len(curve) else initial_balance
+    return {
+        'initial_balance': initial_balance,
+        'final_equity': round(final_equity, 2),
+        'total_return_pct': round((final_equity / initial_balance - 1) * 100, 2),
+        'max_drawdown_pct': round(float((curve / curve.cummax() - 1).min() * 100), 2) if len(curve) else 0.0,
+        'sharpe': round(float(sharpe), 2),
+        'n_trades': int(len(closed)),
+        'n_open_trades': int(len(trades) - len(closed)),
+        'win_rate_pct': round(len(closed[closed['pl'] > 0]) / len(closed) * 100, 2) if len(closed) else 0.0,
+        'profit_factor': round(float(wins / losses), 2) if losses else None,
+        'avg_trade_pl': round(float(closed['pl'].mean()), 2) if len(closed) else 0.0,
+    }
+
+
+class Backtester:
+    """
+    Replays OHLCV history bar by bar through TurtleTrader decisions.
+
+    Every ticker gets a BacktestTurtleTrader on a SimulatedExchangeAdapter, all of them
+    share one SimulatedAccount and one InMemoryOrderStore. Candles of all tickers are
+    merged by time, each closed candle updates the streaming indicators and runs `trade()`,
+    orders are filled at the candle close.
+    Market conditions computed up front (columns of CurrMarketConditions per ticker)
+    can be passed in `market_conditions` instead of streaming them from ohlc.
+    """
+
+    def __init__(self,
+                 ohlc: Dict[str, pd.DataFrame],
+                 initial_balance: float = 10_000,
+                 fee_rate: float = 0.0004,
+                 amount_precision: int = 3,
+                 min_cost: float = 5,
+                 warmup_bars: int = None,
+                 params: TurtleParams = None,
+                 market_conditions: Dict[str, pd.DataFrame] = None):
+        self.ohlc = ohlc
+        self.params = params if params else TurtleParams()
+        self.market_conditions = market_conditions or {}
+        self.initial_balance = initial_balance
+        self.fee_rate = fee_rate
+        self.amount_precision = amount_precision
+        self.min_cost = min_cost
+        self.warmup_bars = warmup_bars if warmup_bars is not None else self.params.entry_days
+
+    def run(self) -> BacktestResult:
+        start = time.perf_counter()
+        account = SimulatedAccount(self.initial_balance, self.fee_rate)
+        store = InMemoryOrderStore()
+
+        adapters, traders, bars = {}, {}, defaultdict(int)
+        streams = []
+        for ticker, ohlc in self.ohlc.items():
+            adapters[ticker] = SimulatedExchangeAdapter(
+                account, ticker, amount_precision=self.amount_precision, min_cost=self.min_cost
+            )
+            traders[ticker] = BacktestTurtleTrader(adapters[ticker], store, self.params)
+            if ticker in self.market_conditions:
+                streams.append(precomputed_conditions(ticker, self.market_conditions[ticker]))
+            else:
+                streams.append(streamed_conditions(ticker, ohlc, self.params))
+
+        equity = []
+        last_ts = None
+        trader_logger = logging.getLogger(TurtleTrader.__module__)
+        trader_log_level = trader_logger.level
+        trader_logger.setLevel(logging.WARNING)
+        try:
+            for ts, ticker, conditions in heapq.merge(*streams, key=lambda event: event[0]):
+                if last_ts is not None and ts != last_ts:
+                    equity.append((last_ts, account.equity))
+                last_ts = ts
+
+                adapters[ticker].mark(ts, conditions.C)
+                bars[ticker] += 1
+                if bars[ticker] <= self.warmup_bars:
+                    continue
+
+                trader = traders[ticker]
+                trader.curr_market_conditions = conditions
+                try:
+                    trader.trade()
+                except AssetAllocationOverRiskLimit:
+                    _logger.debug(f"{ticker} {ts}: asset allocation over risk limit, skipping")
+        finally:
+            trader_logger.setLevel(trader_log_level)
+
+        if last_ts is not None:
+            equity.append((last_ts, account.equity))
+
+        equity = pd.DataFrame(equity, columns=['timeframe', 'equity'])
+        equity['datetime'] = pd.to_datetime(equity['timeframe'], unit='ms')
+        trades = self.trades(store)
+        summary = summarize(trades, equity, self.initial_balance)
+        summary['symbols'] = len(self.ohlc)
+        summary['bars'] = int(sum(bars.values()))
+        summary['elapsed_seconds'] = round(time.perf_counter() - start, 3)
+        return BacktestResult(trades, equity, summary)
+
+    @staticmethod
+    def trades(store: InMemoryOrderStore) -> pd.DataFrame:
+        trades = {}
+        for order in store.orders:
+            trade = trades.setdefault(order.agg_trade_id, {
+                'agg_trade_id': order.agg_trade_id,
+                'symbol': order.symbol,
+                'side': order.action,
+                'entry_time': pd.to_datetime(order.timestamp, unit='ms'),
+                'exit_time': None,
+                'entries': 0,
+                'cost': 0.0,
+                'pl': None,
+                'pl_percent': None
+            })
+            if order.action == 'close':
+                trade['exit_time'] = pd.to_datetime(order.timestamp, unit='ms')
+                trade['pl'] = order.pl
+                trade['pl_percent'] = order.pl_percent
+            else:
+                trade['entries'] += 1
+                trade['cost'] += order.cost
+        return pd.DataFrame(list(trades.values()), columns=[
+            'agg_trade_id', 'symbol', 'side', 'entry_time', 'exit_time', 'entries', 'cost', 'pl', 'pl_percent'
+        ])
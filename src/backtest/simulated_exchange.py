@@ -0,0 +1,198 @@
+from datetime import datetime, timezone
+
+from exchange_adapter import POSITIONS_MAPPING
+
+COLLATERAL = 'USDT'
+
+
+class SimulatedAccount:
+    """
+    USDT margined futures account shared by all simulated markets.
+
+    Orders are filled immediately at the last marked price of the market,
+    fees are charged on the order cost.
+    """
+
+    def __init__(self, initial_balance: float = 10_000, fee_rate: float = 0.0004, leverage: float = 1):
+        self.initial_balance = initial_balance
+        self.fee_rate = fee_rate
+        self.leverage = leverage
+
+        self.wallet = initial_balance
+        self.positions = {}  # symbol -> {'side', 'contracts', 'cost'}
+        self.prices = {}
+        self.timestamp = None
+        self._order_id = 0
+
+    def mark(self, symbol: str, timestamp: int, price: float):
+        self.prices[symbol] = price
+        self.timestamp = timestamp
+
+    def unrealized_pl(self, symbol: str) -> float:
+        position = self.positions.get(symbol)
+        if not position:
+            return 0.0
+        value = position['contracts'] * self.prices[symbol]
+        if position['side'] == 'long':
+            return value - position['cost']
+        return position['cost'] - value
+
+    @property
+    def equity(self) -> float:
+        return self.wallet + sum(self.unrealized_pl(symbol) for symbol in self.positions)
+
+    @property
+    def used_margin(self) -> float:
+        return sum(position['cost'] for position in self.positions.values()) / self.leverage
+
+    def balance(self) -> dict:
+        total = self.equity
+        return {
+            'free': {COLLATERAL: total - self.used_margin},
+            'total': {COLLATERAL: total}
+        }
+
+    def position(self, symbol: str):
+        position = self.positions.get(symbol)
+        if not position:
+            return None
+        return {
+            'symbol': symbol,
+            'side': position['side'],
+            'contracts': position['contracts'],
+            'initialMargin': position['cost'] / self.leverage,
+            'unrealizedPnl': self.unrealized_pl(symbol),
+        }
+
+    def create_order(self, symbol: str, side: str, amount: float, reduce_only: bool = False) -> dict:
+        price = self.prices[symbol]
+        cost = price * amount
+        fee = cost * self.fee_rate
+        self.wallet -= fee
+
+        position = self.positions.get(symbol)
+        if reduce_only:
+            self.wallet += self.unrealized_pl(symbol)
+            del self.positions[symbol]
+        elif position:
+            position['contracts'] += amount
+            position['cost'] += cost
+        else:
+            self.positions[symbol] = {
+                'side': 'long' if side == 'buy' else 'short',
+                'contracts': amount,
+                'cost': cost
+            }
+
+        self._order_id += 1
+        order_id = str(self._order_id)
+        fee_info = {'cost': fee, 'currency': COLLATERAL}
+        return {
+            'info': {},
+            'id': order_id,
+            'clientOrderId': f"backtest-{order_id}",
+            'timestamp': self.timestamp,
+            'datetime': datetime.fromtimestamp(self.timestamp / 1000, tz=timezone.utc).isoformat(),
+            'lastTradeTimestamp': self.timestamp,
+            'lastUpdateTimestamp': self.timestamp,
+            'symbol': symbol,
+            'type': 'market',
+            'timeInForce': 'GTC',
+            'postOnly': False,
+            'reduceOnly': reduce_only,
+            'side': side,
+            'price': price,
+            'triggerPrice': None,
+            'amount': amount,
+            'cost': cost,
+            'average': price,
+            'filled': amount,
+            'remaining': 0.0,
+            'status': 'closed',
+            'fee': fee_info,
+            'trades': [],
+            'fees': [fee_info],
+            'stopPrice': None,
+            'takeProfitPrice': None,
+            'stopLossPrice': None
+        }
+
+
+class SimulatedExchangeAdapter:
+    """Stand-in for ExchangeAdapter of one market, backed by a SimulatedAccount"""
+    _exchange_id = 'backtest'
+    # the simulated balance is always current
+    balance_stale = False
+
+    def __init__(self,
+                 account: SimulatedAccount,
+                 market: str,
+                 collateral: str = COLLATERAL,
+                 amount_precision: int = 3,
+                 min_cost: float = 5,
+                 min_amount: float = 0.001):
+        self._account = account
+        self._collateral = collateral
+        self._market = f"{market}/{collateral}"
+        self.market_futures = f"{self._market}:{collateral}"
+        self.amount_precision = amount_precision
+        self.min_cost = min_cost
+        self.min_amount = min_amount
+        self.balance = None
+        self._open_position = None
+
+    @property
+    def market(self) -> str:
+        return self._market
+
+    @property
+    def market_info(self):
+        return {
+            'symbol': self.market_futures,
+            'precision': {'amount': self.amount_precision},
+            'limits': {'amount': {'min': self.min_amount}, 'cost': {'min': self.min_cost}}
+        }
+
+    def mark(self, timestamp: int, price: float):
+        self._account.mark(self.market_futures, timestamp, price)
+
+    def fetch_balance(self, min_balance=50, max_age: float = None, allow_stale: bool = False):
+        self.balance = self._account.balance()
+
+    @property
+    def free_balance(self):
+        if not self.balance:
+            self.fetch_balance()
+        return self.balance['free'][self._collateral]
+
+    @property
+    def total_balance(self):
+        if not self.balance:
+            self.fetch_balance()
+        return self.balance['total'][self._collateral]
+
+    def opened_position(self):
+        self._open_position = self._account.position(self.market_futures)
+
+    @property
+    def open_position_side(self):
+        if self._open_position:
+            return POSITIONS_MAPPING.get(self._open_position['side'])
+        return
+
+    def enter_position(self, side, amount):
+        return self._account.create_order(self.market_futures, side, amount)
+
+    def close_position(self):
+        self.opened_position()
+        if not self.open_position_side:
+            return
+        side = 'buy' if self.open_position_side == 'sell' else 'sell'
+        return self._account.create_order(
+            self.market_futures, side, self._open_position['contracts'], reduce_only=True
+        )
+
+    def order(self, action_key, amount: float = 0):
+        if action_key == 'close':
+            return self.close_position()
+        return self.enter_position(POSITIONS_MAPPING[action_key], amount)
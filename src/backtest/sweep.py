@@ -0,0 +1,160 @@
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from typing import Dict, List
+
+import pandas as pd
+
+from ohlc_cache import OHLC_COLUMNS
+from src.backtest.engine import Backtester
+from turtle_trader import TurtleParams
+
+_logger = logging.getLogger(__name__)
+
+# grid keys can be the config names or TurtleParams fields
+GRID_KEYS = {
+    'ATR_PERIOD': 'atr_period',
+    'TURTLE_ENTRY_DAYS': 'entry_days',
+    'TURTLE_EXIT_DAYS': 'exit_days',
+    'STOP_LOSS_ATR_MULTIPL': 'stop_loss_atr_multipl',
+    'PYRAMIDING_LIMIT': 'pyramiding_limit',
+    'AGGRESSIVE_PYRAMID_ATR_PRICE_RATIO_LIMIT': 'aggressive_pyramid_atr_price_ratio_limit',
+}
+CONFIG_NAMES = {field_name: config_name for config_name, field_name in GRID_KEYS.items()}
+INDICATOR_PARAMS = ('atr_period', 'entry_days', 'exit_days')
+# columns and conditions frames kept per ticker, combinations come sorted by window so recent ones are reused
+INDICATOR_CACHE_SIZE = 64
+
+
+class IndicatorCache:
+    """
+    Indicator columns of one ticker memoized by window, shared by all combinations run in a worker.
+    The least recently used entries are dropped over `max_entries`.
+    """
+
+    def __init__(self, ohlc: pd.DataFrame, max_entries: int = INDICATOR_CACHE_SIZE):
+        self.ohlc = ohlc.sort_values('timeframe')[OHLC_COLUMNS].reset_index(drop=True)
+        self.max_entries = max_entries
+        self._columns = OrderedDict()
+
+    def _memo(self, key, compute):
+        if key in self._columns:
+            self._columns.move_to_end(key)
+            return self._columns[key]
+        value = self._columns[key] = compute()
+        while len(self._columns) > self.max_entries:
+            self._columns.popitem(last=False)
+        return value
+
+    def true_range(self) -> pd.Series:
+        def compute():
+            prev_close = self.ohlc['C'].shift(1)
+            return pd.concat([
+                self.ohlc['H'] - self.ohlc['L'],
+                (self.ohlc['H'] - prev_close).abs(),
+                (self.ohlc['L'] - prev_close).abs()
+            ], axis=1).max(axis=1)
+
+        return self._memo('true_range', compute)
+
+    def atr(self, period: int) -> pd.Series:
+        return self._memo(('ATR', period), lambda: self.true_range().rolling(window=period, min_periods=1).mean())
+
+    def channel(self, column: str, window: int, is_max: bool) -> pd.Series:
+        def compute():
+            rolling = self.ohlc[column].rolling(window=window, min_periods=1)
+            return rolling.max() if is_max else rolling.min()
+
+        return self._memo((column, window, is_max), compute)
+
+    def conditions(self, params: TurtleParams) -> pd.DataFrame:
+        """CurrMarketConditions columns for every candle, same values as TurtleIndicators.update"""
+
+        def compute():
+            df = self.ohlc.copy()
+            df['datetime'] = self._memo('datetime', lambda: pd.to_datetime(self.ohlc['timeframe'], unit='ms'))
+            df['ATR'] = self.atr(params.atr_period)
+            df['d20_High'] = self.channel('H', params.entry_days, is_max=True)
+            df['d20_Low'] = self.channel('L', params.entry_days, is_max=False)
+            df['d10_High'] = self.channel('H', params.exit_days, is_max=True)
+            df['d10_Low'] = self.channel('L', params.exit_days, is_max=False)
+            df['Long_Entry'] = df['H'] > df['d20_High'].shift(1)
+            df['Short_Entry'] = df['L'] < df['d20_Low'].shift(1)
+            df['Long_Exit'] = df['L'] < df['d10_Low'].shift(1)
+            df['Short_Exit'] = df['H'] > df['d10_High'].shift(1)
+            return df
+
+        return self._memo(('conditions',) + tuple(getattr(params, name) for name in INDICATOR_PARAMS), compute)
+
+
+_worker_state = {}
+
+
+def _init_worker(ohlc: Dict[str, pd.DataFrame], backtest_kwargs: dict):
+    logging.getLogger().setLevel(logging.WARNING)
+    _worker_state['ohlc'] = ohlc
+    _worker_state['caches'] = {ticker: IndicatorCache(df) for ticker, df in ohlc.items()}
+    _worker_state['backtest_kwargs'] = backtest_kwargs
+
+
+def _run_combination(combination: dict) -> dict:
+    params = TurtleParams(**combination)
+    conditions = {ticker: cache.conditions(params) for ticker, cache in _worker_state['caches'].items()}
+    result = Backtester(_worker_state['ohlc'],
+                        params=params,
+                        market_conditions=conditions,
+                        **_worker_state['backtest_kwargs']).run()
+    return {**{CONFIG_NAMES[name]: value for name, value in asdict(params).items()}, **result.summary}
+
+
+class ParameterSweep:
+    """
+    Backtests every combination of a parameter grid on a process pool.
+
+    Combinations are ordered by their indicator windows and handed to workers in
+    contiguous chunks, so indicator columns computed for a window are reused by all
+    combinations with the same window in that worker.
+    """
+
+    def __init__(self,
+                 ohlc: Dict[str, pd.DataFrame],
+                 grid: Dict[str, list],
+                 workers: int = None,
+                 rank_by: str = 'sharpe',
+                 **backtest_kwargs):
+        self.ohlc = ohlc
+        self.grid = {GRID_KEYS.get(key, key): values for key, values in grid.items()}
+        unknown = set(self.grid) - set(GRID_KEYS.values())
+        if unknown:
+            raise ValueError(f"Unknown sweep parameters: {unknown}, use {list(GRID_KEYS)}")
+        self.workers = workers or os.cpu_count()
+        self.rank_by = rank_by
+        self.backtest_kwargs = backtest_kwargs
+
+    def combinations(self) -> List[dict]:
+        names = list(self.grid)
+        combinations = [dict(zip(names, values)) for values in itertools.product(*self.grid.values())]
+        default = asdict(TurtleParams())
+        return sorted(combinations,
+                      key=lambda combination: tuple(combination.get(name, default[name])
+                                                    for name in INDICATOR_PARAMS))
+
+    def run(self) -> pd.DataFrame:
+        start = time.perf_counter()
+        combinations = self.combinations()
+        chunksize = max(1, len(combinations) // (self.workers * 4))
+        _logger.info(f"Sweeping {len(combinations)} combinations on {self.workers} workers")
+
+        with ProcessPoolExecutor(max_workers=self.workers,
+                                 initializer=_init_worker,
+                                 initargs=(self.ohlc, self.backtest_kwargs)) as executor:
+            results = list(executor.map(_run_combination, combinations, chunksize=chunksize))
+
+        _logger.info(f"Sweep finished in {time.perf_counter() - start:.1f}s")
+        results = pd.DataFrame(results).sort_values(self.rank_by, ascending=False)
+        results.insert(0, 'rank', range(1, len(results) + 1))
+        return results.reset_index(drop=True)
@@ -14,6 +14,20 @@ KUCOIN_API_SECRET = os.environ.get('KUCOIN_API_SECRET')
 KUCOIN_PASS = os.environ.get('KUCOIN_PASS')
 
 LEVERAGE = os.environ.get('LEVERAGE', 1)
+# markets metadata cached on disk, refreshed in background when older than max age (seconds)
+MARKET_CACHE_ENABLED = os.environ.get('MARKET_CACHE_ENABLED', 'true').lower() == 'true'
+MARKET_CACHE_DIR = os.environ.get('MARKET_CACHE_DIR', os.path.join(TRADING_DATA_DIR, 'market_cache'))
+MARKET_CACHE_MAX_AGE = float(os.environ.get('MARKET_CACHE_MAX_AGE', 24 * 60 * 60))
+# raw exchange orders, append-only gzip jsonl segments (synced per order) with an id -> offset index rebuilt from them
+ORDER_JOURNAL_DIR = os.environ.get('ORDER_JOURNAL_DIR', os.path.join(TRADING_DATA_DIR, 'order_journal'))
+ORDER_JOURNAL_SEGMENT_BYTES = int(os.environ.get('ORDER_JOURNAL_SEGMENT_BYTES', 64 * 1024 * 1024))
+ORDER_JOURNAL_FSYNC = os.environ.get('ORDER_JOURNAL_FSYNC', 'true').lower() == 'true'
+# validate every value of exchange orders against OrderSchema fields, otherwise they are only mapped to columns
+ORDER_LOAD_STRICT = os.environ.get('ORDER_LOAD_STRICT', 'false').lower() == 'true'
+# opened positions of all symbols are kept in memory, seconds after which they are reloaded and checked against DB
+POSITION_STORE_RECONCILE_INTERVAL = float(os.environ.get('POSITION_STORE_RECONCILE_INTERVAL', 300))
+# seconds a fetched balance is reused by all adapters, our own orders invalidate it
+BALANCE_CACHE_TTL = float(os.environ.get('BALANCE_CACHE_TTL', 120))
 
 # exchanges
 BINANCE_CONFIG_TEST = {
@@ -46,9 +60,80 @@ KUCOIN_CONFIG_PROD = {
     }
 }
 
+# local stand-in exchange (exchange id 'fake') for load and latency tests, see fake_exchange.py
+FAKE_EXCHANGE_CONFIG = {
+    'dataDir': os.environ.get('FAKE_EXCHANGE_DATA_DIR'),  # <TICKER>.csv / parquet candles, synthetic if not set
+    'symbols': int(os.environ.get('FAKE_EXCHANGE_SYMBOLS', 500)),  # number of synthetic symbols
+    'seed': int(os.environ.get('FAKE_EXCHANGE_SEED', 42)),
+    'latencyMs': float(os.environ.get('FAKE_EXCHANGE_LATENCY_MS', 50)),  # median response latency
+    'latencySigma': float(os.environ.get('FAKE_EXCHANGE_LATENCY_SIGMA', 0.5)),  # lognormal tail
+    'errorRate': float(os.environ.get('FAKE_EXCHANGE_ERROR_RATE', 0)),  # requests failing with a network error
+    'lostResponseRate': float(os.environ.get('FAKE_EXCHANGE_LOST_RESPONSE_RATE', 0)),  # orders filled, then timeout
+    'rateLimitWeight': int(os.environ.get('FAKE_EXCHANGE_RATE_LIMIT_WEIGHT', 2400)),  # per minute, 0 no limit
+    'initialBalance': float(os.environ.get('FAKE_EXCHANGE_INITIAL_BALANCE', 10_000)),
+}
+
+# retries: seconds a trading cycle may spend before retries give up, longest and jittered fraction of backoff waits,
+# consecutive failures opening an endpoint circuit and seconds it stays open
+RETRY_CYCLE_BUDGET = float(os.environ.get('RETRY_CYCLE_BUDGET', 300))
+RETRY_MAX_DELAY = float(os.environ.get('RETRY_MAX_DELAY', 20))
+RETRY_JITTER = float(os.environ.get('RETRY_JITTER', 0.5))
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get('CIRCUIT_RESET_TIMEOUT', 60))
+
+# request weight budget shared by all exchange objects of an exchange id, the fraction of the exchange limit
+# we use and the used weight header with the exchange limit it counts against (per RATE_LIMIT_WINDOW seconds),
+# with RATE_LIMIT_STATE_DIR (e.g. /dev/shm/turtle) the budget is shared by all processes on the host
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_SAFETY = float(os.environ.get('RATE_LIMIT_SAFETY', 0.8))
+RATE_LIMIT_WINDOW = float(os.environ.get('RATE_LIMIT_WINDOW', 60))
+RATE_LIMIT_STATE_DIR = os.environ.get('RATE_LIMIT_STATE_DIR')
+USED_WEIGHT_HEADERS = {
+    'binance': ('X-MBX-USED-WEIGHT-1M', int(os.environ.get('BINANCE_WEIGHT_LIMIT', 2400))),
+    'fake': ('X-MBX-USED-WEIGHT-1M', FAKE_EXCHANGE_CONFIG['rateLimitWeight']),
+}
+
 SLACK_URL = os.environ.get("SLACK_URL")
+# slack messages are sent from a background queue, a burst within the window is sent as one message per notifier
+NOTIFY_QUEUE_SIZE = int(os.environ.get('NOTIFY_QUEUE_SIZE', 1000))
+NOTIFY_BATCH_WINDOW = float(os.environ.get('NOTIFY_BATCH_WINDOW', 1))
+NOTIFY_MAX_MESSAGE_CHARS = int(os.environ.get('NOTIFY_MAX_MESSAGE_CHARS', 3500))
+NOTIFY_FLUSH_TIMEOUT = float(os.environ.get('NOTIFY_FLUSH_TIMEOUT', 10))
+# span timings of exchange, DB, indicator and notifier calls: prometheus textfile and json summary per run,
+# METRICS_PORT serves the prometheus text over http (daemon and stream modes), 0 disables it
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'false').lower() == 'true'
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(TRADING_DATA_DIR, 'metrics'))
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 0))
 APP_SETTINGS = os.environ.get("APP_SETTINGS", "DevConfig")
 TRADED_TICKERS = os.environ.get("TRADED_TICKERS", "BTC,ETH,SOL,DOGE").split(',')
+# number of tickers traded in parallel, every worker has its own exchange adapter
+TRADE_CONCURRENCY = int(os.environ.get('TRADE_CONCURRENCY', 1))
+# read tickers and positions of all symbols in one request each and candles concurrently before a cycle
+CYCLE_PREFETCH_ENABLED = os.environ.get('CYCLE_PREFETCH_ENABLED', 'true').lower() == 'true'
+# universe scan: only perpetuals with a live entry signal or an opened position are traded, entries need
+# the quote volume (24h, last candle if the exchange does not report it) and are capped to the best ranked
+SCANNER_MIN_QUOTE_VOLUME = float(os.environ.get('SCANNER_MIN_QUOTE_VOLUME', 5_000_000))
+SCANNER_MAX_CANDIDATES = int(os.environ.get('SCANNER_MAX_CANDIDATES', 20))
+# daemon mode: candle timeframe the trading cycle runs on and seconds waited after the candle close
+DAEMON_TIMEFRAME = os.environ.get('DAEMON_TIMEFRAME', '1d')
+DAEMON_CLOSE_DELAY = float(os.environ.get('DAEMON_CLOSE_DELAY', 2))
+# stream mode: threads executing triggered orders, seconds between reloads of opened positions from DB
+STREAM_WORKERS = int(os.environ.get('STREAM_WORKERS', 8))
+STREAM_REFRESH_INTERVAL = float(os.environ.get('STREAM_REFRESH_INTERVAL', 60))
+# trader database connection pool: connections kept open (size) and opened on top under load (overflow), seconds
+# a checkout waits for a free connection, seconds after which a connection is replaced (recycle) and whether it is
+# tested before every checkout (pre-ping), TRADER_DATABASE_URL overrides the url of the database_tools env vars,
+# a postgresql:// url without a driver connects with psycopg 3 (postgresql+psycopg)
+TRADER_DATABASE_URL = os.environ.get('TRADER_DATABASE_URL')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', max(5, TRADE_CONCURRENCY + 2)))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 30 * 60))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+# server-side prepared statements (psycopg 3 driver, postgresql+psycopg url), a statement is prepared on its
+# connection after the threshold of executions, disable behind pgbouncer in transaction mode
+DB_PREPARED_STATEMENTS = os.environ.get('DB_PREPARED_STATEMENTS', 'true').lower() == 'true'
+DB_PREPARE_THRESHOLD = int(os.environ.get('DB_PREPARE_THRESHOLD', 5))
 
 # turtle strategy
 # risks
@@ -68,6 +153,9 @@ OHLC_HISTORY_W_BUFFER_DAYS = int(os.environ.get(
     'OHLC_HISTORY_W_BUFFER_DAYS',
     10 + TURTLE_ENTRY_DAYS
 ))
+# local store of closed candles, only newer candles are fetched from exchange
+OHLC_CACHE_ENABLED = os.environ.get('OHLC_CACHE_ENABLED', 'true').lower() == 'true'
+OHLC_CACHE_DIR = os.environ.get('OHLC_CACHE_DIR', os.path.join(TRADING_DATA_DIR, 'ohlc_cache'))
 
 # pyramiding
 PYRAMIDING_LIMIT = int(os.environ.get('PYRAMIDING_LIMIT', 4))  # max pyramid trades (1 init, 3 pyramid)
@@ -83,7 +171,8 @@ class Config:
     DEVELOPMENT = True
     USE_SANDBOX = True
     EXCHANGES = {
-        'binance': BINANCE_CONFIG_TEST
+        'binance': BINANCE_CONFIG_TEST,
+        'fake': FAKE_EXCHANGE_CONFIG
     }
 
 
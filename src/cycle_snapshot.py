@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import pandas as pd
+
+from config import TRADE_CONCURRENCY
+from exchange_adapter import ExchangeAdapter
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CycleSnapshot:
+    """
+    Exchange state of all traded symbols read once at the start of a trading cycle.
+
+    Tickers and positions are keyed by futures symbol (BTC/USDT:USDT), candles by market (BTC/USDT).
+    Adapters read the snapshot instead of the exchange, a symbol our order went to is marked dirty
+    and read from the exchange again for the rest of the cycle.
+    """
+    timeframe: str = '1d'
+    tickers: Dict[str, dict] = field(default_factory=dict)
+    # positions of all requested symbols are known, a symbol without an entry has no position
+    position_symbols: frozenset = frozenset()
+    positions: Dict[str, dict] = field(default_factory=dict)
+    ohlc: Dict[str, pd.DataFrame] = field(default_factory=dict)
+    fetched_at: float = field(default_factory=time.time)
+    dirty: set = field(default_factory=set)
+
+    def mark_dirty(self, symbol: str):
+        self.dirty.add(symbol)
+
+    def has_ticker(self, symbol: str) -> bool:
+        return symbol in self.tickers and symbol not in self.dirty
+
+    def has_position(self, symbol: str) -> bool:
+        return symbol in self.position_symbols and symbol not in self.dirty
+
+    def has_ohlc(self, market: str, timeframe: str) -> bool:
+        return timeframe == self.timeframe and market in self.ohlc
+
+
+class SnapshotPrefetcher:
+    """
+    Fills a CycleSnapshot with one fetch_tickers and one positions request for all symbols
+    and the candles of every symbol fetched on `concurrency` threads (through the OHLC cache).
+
+    A failed request leaves its part of the snapshot empty, traders then fetch it themselves.
+    """
+
+    def __init__(self, exchange: ExchangeAdapter, concurrency: int = TRADE_CONCURRENCY):
+        self.exchange = exchange
+        self._concurrency = max(1, concurrency)
+        self._local = threading.local()
+
+    def _worker_exchange(self, ticker: str) -> ExchangeAdapter:
+        exchange = getattr(self._local, 'exchange', None)
+        if exchange is None:
+            exchange = ExchangeAdapter(self.exchange._exchange_id)
+            exchange.share_markets(self.exchange)
+            self._local.exchange = exchange
+        exchange.market = ticker
+        return exchange
+
+    def _fetch_ohlc(self, ticker: str, since: int, timeframe: str):
+        try:
+            exchange = self._worker_exchange(ticker)
+            return exchange.market, exchange.fetch_ohlc(since=since, timeframe=timeframe)
+        except Exception as e:
+            _logger.warning(f"Cannot prefetch candles of {ticker}: {e}")
+            return None
+
+    def prefetch(self, tickers: List[str], since: int = None, timeframe: str = '1d') -> CycleSnapshot:
+        """Snapshot of `tickers`, candles are fetched only when `since` is given"""
+        start = time.perf_counter()
+        collateral = self.exchange._collateral
+        symbols = [f"{ticker}/{collateral}:{collateral}" for ticker in tickers]
+        symbols = [symbol for symbol in symbols if symbol in self.exchange.markets]
+        snapshot = CycleSnapshot(timeframe)
+
+        try:
+            snapshot.tickers = {symbol: ticker for symbol, ticker in self.exchange.fetch_tickers(symbols).items()
+                                if symbol in symbols}
+        except Exception as e:
+            _logger.warning(f"Cannot prefetch tickers, traders fetch their own: {e}")
+
+        try:
+            positions = self.exchange.fetch_positions(symbols)
+            snapshot.positions = {position['symbol']: position for position in positions
+                                  if position.get('contracts')}
+            snapshot.position_symbols = frozenset(symbols)
+        except Exception as e:
+            _logger.warning(f"Cannot prefetch positions, traders fetch their own: {e}")
+
+        if since is not None:
+            if self._concurrency == 1:
+                results = [self._fetch_ohlc(ticker, since, timeframe) for ticker in tickers]
+            else:
+                with ThreadPoolExecutor(max_workers=self._concurrency, thread_name_prefix='prefetch') as executor:
+                    results = list(executor.map(lambda ticker: self._fetch_ohlc(ticker, since, timeframe), tickers))
+            snapshot.ohlc = dict(result for result in results if result is not None)
+
+        _logger.info(f"Prefetched {len(snapshot.tickers)} tickers, {len(snapshot.positions)} positions "
+                     f"and candles of {len(snapshot.ohlc)} of {len(tickers)} symbols "
+                     f"in {time.perf_counter() - start:.2f}s")
+        return snapshot
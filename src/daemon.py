@@ -0,0 +1,192 @@
+import logging
+import signal
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import ccxt
+
+from config import (SLACK_URL,
+                    TRADE_CONCURRENCY,
+                    DAEMON_TIMEFRAME,
+                    DAEMON_CLOSE_DELAY,
+                    METRICS_PORT,
+                    CYCLE_PREFETCH_ENABLED,
+                    RETRY_CYCLE_BUDGET,
+                    OHLC_HISTORY_W_BUFFER_DAYS)
+from cycle_snapshot import SnapshotPrefetcher
+from exchange_adapter import ExchangeAdapter
+from src.utils import metrics
+from src.utils.notifier import QueuedNotifier
+from src.utils.retry_policy import retry_deadline
+from trading_cycle import TickerSessionResult, log_session_summary, load_opened_positions
+from turtle_indicators import TurtleIndicators
+from turtle_trader import TurtleTrader, CurrMarketConditions
+
+_logger = logging.getLogger(__name__)
+_notifier = QueuedNotifier(url=SLACK_URL, username='Trading daemon')
+
+
+def next_candle_close(now_ms: int, timeframe_ms: int) -> int:
+    """Timestamp (ms) of the next candle boundary after now"""
+    return (now_ms // timeframe_ms + 1) * timeframe_ms
+
+
+class WarmTicker:
+    """
+    Exchange adapter, trader and streaming indicators of one ticker kept between cycles.
+
+    Indicators hold all closed candles, a cycle fetches only candles newer than
+    the last committed one, commits the closed ones and evaluates the running candle.
+    """
+
+    def __init__(self, ticker: str, exchange: ExchangeAdapter, timeframe: str = DAEMON_TIMEFRAME):
+        self.ticker = ticker
+        self.timeframe = timeframe
+        self.timeframe_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+        self.exchange = exchange
+        self.exchange.market = ticker
+        self.trader = TurtleTrader(exchange, load_state=False)
+        self.indicators: TurtleIndicators = None
+
+    def warm_up(self, now_ms: int):
+        since = now_ms - OHLC_HISTORY_W_BUFFER_DAYS * self.timeframe_ms
+        ohlc = self.exchange.fetch_ohlc(since=since, timeframe=self.timeframe)
+        params = self.trader.params
+        self.indicators = TurtleIndicators.from_ohlc(ohlc.iloc[:-1],
+                                                     atr_period=params.atr_period,
+                                                     entry_days=params.entry_days,
+                                                     exit_days=params.exit_days)
+        _logger.info(f"{self.ticker} indicators warmed up with {len(ohlc) - 1} closed candles")
+
+    def update_market_conditions(self, now_ms: int):
+        if self.indicators is None or self.indicators.last_timestamp is None:
+            self.warm_up(now_ms)
+
+        candles = [candle for candle in self.exchange.fetch_candles(self.indicators.last_timestamp + 1,
+                                                                    self.timeframe)
+                   if candle[0] > self.indicators.last_timestamp]
+        if not candles:
+            raise ValueError(f"No candle after {self.indicators.last_timestamp} for {self.ticker}")
+
+        with metrics.span('indicators'):
+            for candle in candles[:-1]:
+                self.indicators.update(candle)
+            conditions = self.indicators.peek(candles[-1])
+        self.trader.curr_market_conditions = CurrMarketConditions(**conditions)
+        self.trader.curr_market_conditions.log_current_market_conditions()
+
+    def trade(self, now_ms: int):
+        self.update_market_conditions(now_ms)
+        self.trader.get_opened_positions()
+        self.trader.trade()
+
+
+class TradingDaemon:
+    """
+    Long-running trading process woken on candle closes of the configured timeframe.
+
+    The exchange markets, DB pool, notifiers and per ticker indicator state live for the whole
+    process, so a cycle only fetches the newest candles before deciding. Latency of every
+    ticker is measured from the candle close to the end of its session.
+    """
+
+    def __init__(self,
+                 tickers: List[str],
+                 exchange_id: str = 'binance',
+                 timeframe: str = DAEMON_TIMEFRAME,
+                 concurrency: int = TRADE_CONCURRENCY,
+                 close_delay: float = DAEMON_CLOSE_DELAY):
+        self.exchange_id = exchange_id
+        self.timeframe = timeframe
+        self.timeframe_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+        self.close_delay = close_delay
+        self._concurrency = max(1, concurrency)
+        self._stop = threading.Event()
+
+        self.exchange = ExchangeAdapter(exchange_id)
+        self.exchange.load_exchange()
+        self.tickers = {}
+        for ticker in tickers:
+            exchange = ExchangeAdapter(exchange_id)
+            exchange.share_markets(self.exchange)
+            self.tickers[ticker] = WarmTicker(ticker, exchange, timeframe)
+
+    def stop(self, *_):
+        _logger.info("Stopping trading daemon")
+        self._stop.set()
+
+    def trade_ticker(self,
+                     warm_ticker: WarmTicker,
+                     candle_close_ms: int,
+                     deadline: float = None) -> TickerSessionResult:
+        try:
+            _logger.info(f"\n\n----------- Starting trade - {warm_ticker.ticker} -----------")
+            with metrics.tagged(exchange=self.exchange_id, ticker=warm_ticker.ticker), metrics.span('session'), \
+                    retry_deadline(deadline):
+                warm_ticker.trade(candle_close_ms)
+            return TickerSessionResult(warm_ticker.ticker, time.time() - candle_close_ms / 1000)
+
+        except Exception as e:
+            # indicators are rebuilt from history next cycle
+            warm_ticker.indicators = None
+            msg = f"Trading error - {warm_ticker.ticker}: {e}\n{traceback.format_exc()}"
+            _logger.error(msg)
+            _notifier.error(msg)
+            return TickerSessionResult(warm_ticker.ticker, time.time() - candle_close_ms / 1000, error=str(e))
+
+    def run_cycle(self, candle_close_ms: int) -> List[TickerSessionResult]:
+        warm_tickers = list(self.tickers.values())
+        # retries of all tickers give up once the cycle ran for RETRY_CYCLE_BUDGET
+        deadline = time.monotonic() + RETRY_CYCLE_BUDGET
+        # positions may have been changed by other processes since the last cycle
+        load_opened_positions(deadline)
+        if CYCLE_PREFETCH_ENABLED:
+            # candles are updated incrementally by every ticker, only tickers and positions are prefetched
+            with metrics.span('prefetch'), retry_deadline(deadline):
+                snapshot = SnapshotPrefetcher(self.exchange, self._concurrency).prefetch(list(self.tickers),
+                                                                                        timeframe=self.timeframe)
+            for warm_ticker in warm_tickers:
+                warm_ticker.exchange.snapshot = snapshot
+
+        if self._concurrency == 1:
+            return [self.trade_ticker(warm_ticker, candle_close_ms, deadline) for warm_ticker in warm_tickers]
+
+        with ThreadPoolExecutor(max_workers=self._concurrency, thread_name_prefix='trader') as executor:
+            return list(executor.map(lambda warm_ticker: self.trade_ticker(warm_ticker, candle_close_ms, deadline),
+                                     warm_tickers))
+
+    def warm_up(self):
+        now_ms = int(time.time() * 1000)
+        for warm_ticker in self.tickers.values():
+            try:
+                warm_ticker.warm_up(now_ms)
+            except Exception as e:
+                _logger.error(f"Cannot warm up {warm_ticker.ticker}, retrying next cycle: {e}")
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        if metrics.registry.enabled and METRICS_PORT:
+            metrics.serve(METRICS_PORT)
+        self.warm_up()
+
+        while not self._stop.is_set():
+            candle_close_ms = next_candle_close(int(time.time() * 1000), self.timeframe_ms)
+            wait = candle_close_ms / 1000 + self.close_delay - time.time()
+            _logger.info(f"Next {self.timeframe} candle close at "
+                         f"{time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(candle_close_ms / 1000))} UTC, "
+                         f"sleeping {wait:.0f}s")
+            if self._stop.wait(max(0.0, wait)):
+                break
+
+            metrics.registry.start_run()
+            results = self.run_cycle(candle_close_ms)
+            log_session_summary(results)
+            _logger.info(f"Cycle finished {time.time() - candle_close_ms / 1000:.2f}s after candle close")
+            if metrics.registry.enabled:
+                metrics.registry.write()
+
+        _logger.info("Trading daemon stopped")
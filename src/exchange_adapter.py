@@ -1,15 +1,25 @@
 import logging
+import threading
+import time
 import traceback
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING
 
 import ccxt
 import pandas as pd
-from retrying import retry
-from slack_bot.notifications import SlackNotifier
 
-from config import SLACK_URL, LEVERAGE
+from config import SLACK_URL, LEVERAGE, OHLC_CACHE_ENABLED, BALANCE_CACHE_TTL, MARKET_CACHE_ENABLED
 from exchange_factory import ExchangeFactory
+from market_cache import get_market_cache
+from ohlc_cache import OhlcCache, OHLC_COLUMNS
+from src.utils.metrics import span
+from src.utils.notifier import QueuedNotifier
+from src.utils.retry_policy import RetryPolicy
 
-_notifier = SlackNotifier(url=SLACK_URL, username='Exchange adapter')
+if TYPE_CHECKING:
+    from cycle_snapshot import CycleSnapshot
+
+_notifier = QueuedNotifier(url=SLACK_URL, username='Exchange adapter')
 _logger = logging.getLogger(__name__)
 
 POSITIONS_MAPPING = {
@@ -22,9 +32,88 @@ class NotEnoughBalanceException(Exception):
     """Balance is really low"""
 
 
-def retry_if_network_error(exception):
-    """Return True if we should retry (in this case when it's a NetworkError), False otherwise"""
-    return isinstance(exception, (ccxt.NetworkError, ccxt.ExchangeError))
+# reads are retried on network errors only, an exchange error (bad symbol, auth) fails the same way again
+EXCHANGE_READ_POLICY = RetryPolicy(retry_on=(ccxt.NetworkError,), base_delay=1.5)
+# a timed out order may have been filled, only errors raised before the order is executed are retried
+EXCHANGE_ORDER_POLICY = RetryPolicy(retry_on=(ccxt.RateLimitExceeded, ccxt.DDoSProtection),
+                                    attempts=3,
+                                    base_delay=1.5,
+                                    failure_on=(ccxt.NetworkError,))
+# closing reads the position from exchange first, a retry after a filled close finds nothing to close
+EXCHANGE_CLOSE_POLICY = RetryPolicy(retry_on=(ccxt.NetworkError,))
+
+
+@dataclass
+class BalanceSnapshot:
+    balance: dict
+    fetched_at: float
+    ttl: float
+    # served after the refresh failed
+    refresh_failed: bool = False
+
+    @property
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+    @property
+    def stale(self):
+        return self.refresh_failed or self.age > self.ttl
+
+
+class BalanceCache:
+    """
+    Balance snapshots per exchange shared by all adapters in the process.
+
+    The fetch (with its retries) runs outside the lock, only the result is published under it.
+    A fetch started before an invalidation is not published, it may predate our order.
+    The last fetched snapshot is kept through invalidations, callers that can live with an old
+    balance (reports, order records) get it marked stale when the refresh fails.
+    """
+
+    def __init__(self, ttl: float = BALANCE_CACHE_TTL):
+        self.ttl = ttl
+        self._snapshots = {}
+        self._last = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, fetch, max_age: float = None, allow_stale: bool = False) -> BalanceSnapshot:
+        """Cached snapshot, `fetch()` is called when there is none or it is older than max_age (ttl by default).
+        With allow_stale a failed fetch returns the last snapshot marked stale, if there is one."""
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None and snapshot.age <= max_age:
+                return snapshot
+            generation = self._generations.get(key, 0)
+
+        try:
+            snapshot = BalanceSnapshot(fetch(), time.monotonic(), self.ttl)
+        except Exception as exc:
+            with self._lock:
+                last = self._last.get(key)
+            if not allow_stale or last is None:
+                raise
+            _logger.warning(f"Balance refresh failed, serving the snapshot of age {last.age:.0f}s. {exc}")
+            return replace(last, refresh_failed=True)
+
+        with self._lock:
+            published = self._snapshots.get(key)
+            if self._generations.get(key, 0) == generation and (
+                    published is None or published.fetched_at < snapshot.fetched_at):
+                self._snapshots[key] = snapshot
+            last = self._last.get(key)
+            if last is None or last.fetched_at < snapshot.fetched_at:
+                self._last[key] = snapshot
+        return snapshot
+
+    def invalidate(self, key):
+        with self._lock:
+            self._snapshots.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+
+_balance_cache = BalanceCache()
 
 
 class ExchangeAdapter(ExchangeFactory):
@@ -37,13 +126,52 @@ class ExchangeAdapter(ExchangeFactory):
         self.market_futures = f"{self._market}:{self._collateral}"
         self._open_position = None
         self.balance = None
-
-    def load_exchange(self, force_refresh=True):
-        if force_refresh or not self._exchange.markets:
+        # balance is an old snapshot, its refresh failed
+        self.balance_stale = False
+        self._lazy_markets = False
+        # per cycle prefetched tickers, positions and candles, see cycle_snapshot.py
+        self.snapshot: 'CycleSnapshot' = None
+
+    def load_exchange(self, force_refresh=False):
+        """
+        Load markets from the disk cache (refreshed in background when older than MARKET_CACHE_MAX_AGE)
+        or from the exchange when there is no cache or force_refresh is set.
+        Adapter properties read the compact per-symbol index, the full market map
+        is handed to ccxt only before the first exchange call.
+        """
+        cache = get_market_cache(self._exchange_id)
+        if force_refresh or not MARKET_CACHE_ENABLED or cache.age is None:
             _logger.info(f"Loading markets on {self._exchange.id}")
-            self.markets = self._exchange.load_markets(True)
+            with span('exchange.load_markets'):
+                self.markets = self._exchange.load_markets(True)
+            if MARKET_CACHE_ENABLED:
+                cache.save(self.markets, self._exchange.currencies)
+        else:
+            _logger.info(f"Using cached markets, age {cache.age:.0f}s")
+            self.markets = cache.index()
+            self._lazy_markets = True
+            if cache.is_stale:
+                cache.refresh_in_background(self._fetch_markets)
         _logger.info("Markets loaded successfully")
 
+    def _fetch_markets(self):
+        # separate exchange object, so the adapter keeps working while markets are reloaded
+        exchange = self._create_exchange_object()
+        return exchange.load_markets(True), exchange.currencies
+
+    def ensure_markets(self):
+        """ccxt needs the full market map before any request, take it from the cache on first use"""
+        if self._lazy_markets and not self._exchange.markets:
+            markets, currencies = get_market_cache(self._exchange_id).markets()
+            self._exchange.set_markets(markets, currencies)
+
+    def share_markets(self, other: 'ExchangeAdapter'):
+        """Reuse markets already loaded by another adapter instead of loading them again"""
+        if other._exchange.markets:
+            self._exchange.set_markets(other._exchange.markets, other._exchange.currencies)
+        self.markets = other.markets
+        self._lazy_markets = other._lazy_markets
+
     @property
     def market_info(self):
         _logger.debug(f"Accessing market info for {self.market_futures}: "
@@ -64,8 +192,7 @@ class ExchangeAdapter(ExchangeFactory):
 
     @property
     def free_balance(self):
-        if not self.balance:
-            self.fetch_balance()
+        self.fetch_balance(allow_stale=True)
         if self.balance:
             free = self.balance['free'][self._collateral]
             return free
@@ -73,8 +200,7 @@ class ExchangeAdapter(ExchangeFactory):
 
     @property
     def total_balance(self):
-        if not self.balance:
-            self.fetch_balance()
+        self.fetch_balance(allow_stale=True)
         if self.balance:
             total = self.balance['total'][self._collateral]
             return total
@@ -90,48 +216,82 @@ class ExchangeAdapter(ExchangeFactory):
         self._market = f"{name}/{self._collateral}"
         self.market_futures = f"{self._market}:{self._collateral}"
 
-    @retry(retry_on_exception=retry_if_network_error,
-           stop_max_attempt_number=5,
-           wait_exponential_multiplier=1500)
-    def fetch_ohlc(self, since, timeframe: str = '1d'):
-        candles = self._exchange.fetchOHLCV(self._market, timeframe=timeframe, since=since)
-        candles_df = pd.DataFrame(candles, columns=['timeframe', 'O', 'H', 'L', 'C', 'V'])
+    @EXCHANGE_READ_POLICY.retry('exchange.fetch_ohlcv')
+    def fetch_candles(self, since, timeframe: str = '1d'):
+        self.ensure_markets()
+        return self._exchange.fetchOHLCV(self._market, timeframe=timeframe, since=since)
+
+    def fetch_ohlc(self, since, timeframe: str = '1d', use_cache: bool = OHLC_CACHE_ENABLED):
+        if self.snapshot is not None and self.snapshot.has_ohlc(self._market, timeframe):
+            return self.snapshot.ohlc[self._market].copy()
+        if use_cache:
+            cache = OhlcCache(self._exchange_id, self._market, timeframe)
+            candles_df = cache.update(lambda start: self.fetch_candles(start, timeframe), since)
+        else:
+            candles = self.fetch_candles(since, timeframe)
+            candles_df = pd.DataFrame(candles, columns=OHLC_COLUMNS)
         candles_df['datetime'] = pd.to_datetime(candles_df['timeframe'], unit='ms')
         return candles_df
 
-    @retry(retry_on_exception=retry_if_network_error,
-           stop_max_attempt_number=5,
-           wait_exponential_multiplier=1500)
-    def fetch_balance(self, min_balance=50):
+    @EXCHANGE_READ_POLICY.retry('exchange.fetch_balance')
+    def _fetch_balance(self):
         _logger.info(f"getting balance")
-        self.balance = self._exchange.fetch_balance()
+        self.ensure_markets()
+        return self._exchange.fetch_balance()
+
+    def fetch_balance(self, min_balance=50, max_age: float = None, allow_stale: bool = False) -> BalanceSnapshot:
+        """
+        Balance from the shared cache, fetched from exchange if older than max_age (BALANCE_CACHE_TTL).
+        A failed fetch raises, with allow_stale the last balance is used instead and `balance_stale` is set.
+        """
+        snapshot = _balance_cache.get(self._exchange_id, self._fetch_balance, max_age, allow_stale)
+        if snapshot.stale:
+            _logger.warning(f"Using stale balance, age {snapshot.age:.0f}s")
+        self.balance = snapshot.balance
+        self.balance_stale = snapshot.stale
+        return snapshot
+
+    def invalidate_balance(self):
+        """Our order changed the balance, next read fetches it again"""
+        _balance_cache.invalidate(self._exchange_id)
+        self.balance = None
+        self.balance_stale = False
 
-        # if self.free_balance and self.free_balance < min_balance:
-        #     _logger.error(f"balance: {self.free_balance}$ is under minimal balance: {min_balance}$")
-        #     raise NotEnoughBalanceException
+    def invalidate_snapshot(self):
+        """Our order changed the position, next reads of this symbol go to the exchange"""
+        if self.snapshot is not None:
+            self.snapshot.mark_dirty(self.market_futures)
 
-    @retry(retry_on_exception=retry_if_network_error,
-           stop_max_attempt_number=5,
-           wait_exponential_multiplier=1500)
-    def close_price(self):
+    @EXCHANGE_READ_POLICY.retry('exchange.fetch_ticker')
+    def _fetch_close_price(self):
         _logger.info(f"getting close price")
+        self.ensure_markets()
         return self._exchange.fetch_ticker(symbol=self.market_futures)['close']
 
-    @retry(retry_on_exception=retry_if_network_error,
-           stop_max_attempt_number=5,
-           wait_exponential_multiplier=1500)
-    def opened_position(self):
-        _logger.info(f"getting open positions")
-
+    def close_price(self):
+        if self.snapshot is not None and self.snapshot.has_ticker(self.market_futures):
+            return self.snapshot.tickers[self.market_futures]['close']
+        return self._fetch_close_price()
+
+    @EXCHANGE_READ_POLICY.retry('exchange.fetch_tickers')
+    def fetch_tickers(self, symbols: list) -> dict:
+        self.ensure_markets()
+        return self._exchange.fetch_tickers(symbols)
+
+    @EXCHANGE_READ_POLICY.retry('exchange.fetch_positions')
+    def fetch_positions(self, symbols: list) -> list:
+        self.ensure_markets()
         if self._exchange_id == 'binance':
-            open_positions = self._exchange.fetch_account_positions(
-                symbols=[self.market_futures]
-            )
-        else:
-            open_positions = self._exchange.fetchPositions(
-                symbols=[self.market_futures]
-            )
+            return self._exchange.fetch_account_positions(symbols=symbols)
+        return self._exchange.fetchPositions(symbols=symbols)
 
+    def opened_position(self):
+        if self.snapshot is not None and self.snapshot.has_position(self.market_futures):
+            self._open_position = self.snapshot.positions.get(self.market_futures)
+            return
+
+        _logger.info(f"getting open positions")
+        open_positions = self.fetch_positions([self.market_futures])
         if open_positions:
             open_position = open_positions[0]
             self._open_position = open_position
@@ -158,11 +318,10 @@ class ExchangeAdapter(ExchangeFactory):
             f"\n{self._open_position}"
         )
 
-    @retry(retry_on_exception=retry_if_network_error,
-           stop_max_attempt_number=5,
-           wait_exponential_multiplier=1500)
+    @EXCHANGE_ORDER_POLICY.retry('exchange.enter_position')
     def enter_position(self, side, amount):
         _logger.info(f"entering {str.upper(side)} position")
+        self.ensure_markets()
 
         try:
             # self.opened_position()
@@ -175,18 +334,24 @@ class ExchangeAdapter(ExchangeFactory):
             _logger.info(f"creating order: {side}, "
                          f"amount: {amount}, "
                          f"params: {self.params}")
-            order = self._exchange.create_order(
-                symbol=self.market_futures,
-                type='market',
-                side=side,
-                amount=amount,
-                params=self.params
-            )
+            with span('exchange.create_order'):
+                order = self._exchange.create_order(
+                    symbol=self.market_futures,
+                    type='market',
+                    side=side,
+                    amount=amount,
+                    params=self.params
+                )
+            self.invalidate_balance()
+            self.invalidate_snapshot()
 
             _notifier.info(f"{str.upper(side)} {self.market} | amount: {amount}")
             return order
 
         except (ccxt.NetworkError, ccxt.ExchangeError) as e:
+            # the order may have gone through, retries read the position and balance from exchange
+            self.invalidate_balance()
+            self.invalidate_snapshot()
             msg = (f"{self._exchange.id} enter_position failed "
                    f"due to a Network or Exchange error: {e}")
             _logger.error(msg)
@@ -203,11 +368,10 @@ class ExchangeAdapter(ExchangeFactory):
             _logger.error(msg)
             raise
 
-    @retry(retry_on_exception=retry_if_network_error,
-           stop_max_attempt_number=5,
-           wait_exponential_multiplier=1000)
+    @EXCHANGE_CLOSE_POLICY.retry('exchange.close_position')
     def close_position(self):
         _logger.info(f"closing position")
+        self.ensure_markets()
 
         params = {'reduceOnly': True}
         try:
@@ -216,25 +380,30 @@ class ExchangeAdapter(ExchangeFactory):
             if not self.open_position_side:
                 _logger.warning(f"no open position to close: {self.open_position_side}")
                 _notifier.warning(f"no open position to close: {self.open_position_side}")
-                return {"msg": "Nothing to close"}
+                return None
 
             side = 'buy' if self.open_position_side == 'sell' else 'sell'
 
             _logger.info(f"creating order: {side}, "
                          f"amount: {self.open_position_amount}, "
                          f"params: {params}")
-            order = self._exchange.create_order(
-                symbol=self.market_futures,
-                type='market',
-                side=side,
-                amount=self.open_position_amount,
-                params=params
-            )
+            with span('exchange.create_order'):
+                order = self._exchange.create_order(
+                    symbol=self.market_futures,
+                    type='market',
+                    side=side,
+                    amount=self.open_position_amount,
+                    params=params
+                )
+            self.invalidate_balance()
+            self.invalidate_snapshot()
 
             _notifier.info(f"order CLOSE {str.upper(side)}")
             return order
 
         except (ccxt.NetworkError, ccxt.ExchangeError) as e:
+            # the order may have gone through, retries read the position from exchange
+            self.invalidate_snapshot()
             msg = (f"{self._exchange.id} close_position failed "
                    f"due to a Network or Exchange error: {e}")
             _logger.error(msg)
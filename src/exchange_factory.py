@@ -2,18 +2,18 @@ import logging
 import traceback
 
 import ccxt
-from retrying import retry
-from slack_bot.notifications import SlackNotifier
 
 from config import app_config, SLACK_URL
+from src.utils.notifier import QueuedNotifier
+from src.utils.rate_limiter import share_rate_limit
+from src.utils.retry_policy import RetryPolicy
 
-_notifier = SlackNotifier(url=SLACK_URL, username='Exchange factory')
+_notifier = QueuedNotifier(url=SLACK_URL, username='Exchange factory')
 _logger = logging.getLogger(__name__)
 
 
-def retry_if_network_error(exception):
-    """Return True if we should retry, False otherwise"""
-    return isinstance(exception, ccxt.NetworkError)
+# exchange objects are created at start up, a cycle without an exchange gives up after a few short waits
+CREATE_POLICY = RetryPolicy(retry_on=(ccxt.NetworkError,), attempts=3, base_delay=2, circuit_breaker=False)
 
 
 class ExchangeFactory:
@@ -24,11 +24,16 @@ class ExchangeFactory:
         self._exchange = self._create_exchange_object()
         self.markets = ...
 
-    @retry(retry_on_exception=retry_if_network_error, stop_max_attempt_number=7, wait_fixed=10_000)
+    @CREATE_POLICY.retry('exchange.create_exchange')
     def _create_exchange_object(self) -> ccxt.Exchange:
         try:
             _logger.info(f"crating exchange object")
-            _exchange_class = getattr(ccxt, self._exchange_id)
+            if self._exchange_id == 'fake':
+                # local stand-in for load tests, imported only when configured
+                from fake_exchange import FakeExchange
+                _exchange_class = FakeExchange
+            else:
+                _exchange_class = getattr(ccxt, self._exchange_id)
             _exchange = _exchange_class(app_config.EXCHANGES[self._exchange_id])
 
             if self._use_futures:
@@ -40,7 +45,8 @@ class ExchangeFactory:
             if app_config.USE_SANDBOX:
                 _logger.info(f"using SANDBOX")
                 _exchange.set_sandbox_mode(True)
-            return _exchange
+            # one weight budget for all exchange objects of the exchange id instead of one per object
+            return share_rate_limit(self._exchange_id, _exchange)
 
         except ccxt.NetworkError as e:
             msg = f"""{self._exchange.id} creating exchange object 
@@ -0,0 +1,290 @@
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from typing import Dict, List
+
+import ccxt
+import numpy as np
+
+from config import TRADED_TICKERS
+from ohlc_cache import OHLC_COLUMNS
+from src.backtest.engine import load_ohlc_dir
+from src.backtest.simulated_exchange import SimulatedAccount, COLLATERAL
+
+_logger = logging.getLogger(__name__)
+
+EXCHANGE_ID = 'fake'
+SYNTHETIC_START_MS = 1_577_836_800_000  # 2020-01-01
+SYNTHETIC_MAX_BARS = 2000
+OHLCV_LIMIT = 500
+
+# request weights, roughly binance futures
+WEIGHTS = {
+    'fetchOHLCV': 5,
+    'fetch_balance': 5,
+    'fetch_positions': 5,
+    'fetch_ticker': 1,
+    'fetch_tickers': 40,
+    'create_order': 1,
+}
+
+NETWORK_ERRORS = (ccxt.RequestTimeout, ccxt.NetworkError, ccxt.ExchangeNotAvailable)
+
+
+def market(base: str) -> dict:
+    symbol = f"{base}/{COLLATERAL}:{COLLATERAL}"
+    return {
+        'id': f"{base}{COLLATERAL}",
+        'symbol': symbol,
+        'base': base,
+        'quote': COLLATERAL,
+        'settle': COLLATERAL,
+        'baseId': base,
+        'quoteId': COLLATERAL,
+        'settleId': COLLATERAL,
+        'type': 'swap',
+        'spot': False,
+        'margin': False,
+        'swap': True,
+        'future': False,
+        'option': False,
+        'contract': True,
+        'linear': True,
+        'inverse': False,
+        'active': True,
+        'contractSize': 1,
+        'precision': {'amount': 3, 'price': 2},
+        'limits': {'amount': {'min': 0.001}, 'cost': {'min': 5}},
+        'info': {},
+    }
+
+
+class RateLimitWindow:
+    """Used request weight in the current minute, like binance X-MBX-USED-WEIGHT-1M"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.minute = None
+        self.used = 0
+
+    def add(self, weight: int, now: float) -> bool:
+        minute = int(now // 60)
+        if minute != self.minute:
+            self.minute, self.used = minute, 0
+        self.used += weight
+        return not self.limit or self.used <= self.limit
+
+
+class FakeVenue:
+    """
+    State of the fake exchange shared by all FakeExchange clients in the process:
+    candles, one SimulatedAccount, the rate limit window and request statistics.
+
+    Candles are read from `dataDir` (same files as the backtest) or generated as a seeded
+    random walk per symbol and timeframe, so runs with the same config are reproducible.
+    """
+
+    def __init__(self, config: dict):
+        self.config = config
+        self._rng = random.Random(config.get('seed', 42))
+        self._lock = threading.Lock()
+        self._rate_limit = RateLimitWindow(config.get('rateLimitWeight', 0))
+        self._candles = {}
+        self.stats = Counter()
+
+        if config.get('dataDir'):
+            self._data = {ticker: df.sort_values('timeframe')[OHLC_COLUMNS].to_numpy()
+                          for ticker, df in load_ohlc_dir(config['dataDir']).items()}
+            bases = list(self._data)
+        else:
+            self._data = None
+            bases = list(dict.fromkeys(TRADED_TICKERS + [f"FAKE{i:03d}"
+                                                         for i in range(config.get('symbols', 500))]))
+        self.markets = {market(base)['symbol']: market(base) for base in bases}
+        self.currencies = {COLLATERAL: {'id': COLLATERAL, 'code': COLLATERAL, 'precision': 2}}
+
+        self.account = SimulatedAccount(config.get('initialBalance', 10_000))
+        now_ms = int(time.time() * 1000)
+        for symbol, info in self.markets.items():
+            self.account.mark(symbol, now_ms, float(self.candles(info['base'], '1d')[-1][4]))
+
+    def base(self, symbol: str) -> str:
+        return symbol.split('/')[0]
+
+    def candles(self, base: str, timeframe: str) -> np.ndarray:
+        if self._data is not None:
+            return self._data[base]
+
+        key = (base, timeframe)
+        if key not in self._candles:
+            timeframe_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+            now_ms = int(time.time() * 1000)
+            first = max(SYNTHETIC_START_MS, (now_ms // timeframe_ms - SYNTHETIC_MAX_BARS + 1) * timeframe_ms)
+            timestamps = np.arange(first, now_ms, timeframe_ms)
+            rng = np.random.default_rng([self.config.get('seed', 42), zlib.crc32(base.encode()), timeframe_ms])
+            close = 10 ** rng.uniform(-1, 4) * np.exp(np.cumsum(rng.normal(0, 0.03, len(timestamps))))
+            open_ = np.r_[close[0], close[:-1]]
+            high = np.maximum(open_, close) * (1 + rng.random(len(timestamps)) * 0.02)
+            low = np.minimum(open_, close) * (1 - rng.random(len(timestamps)) * 0.02)
+            volume = rng.random(len(timestamps)) * 1e6
+            self._candles[key] = np.column_stack([timestamps, open_, high, low, close, volume])
+        return self._candles[key]
+
+    def request(self, endpoint: str) -> dict:
+        """Account the request and inject latency, rate limit and network errors, returns response headers"""
+        with self._lock:
+            self.stats[endpoint] += 1
+            now = time.time()
+            allowed = self._rate_limit.add(WEIGHTS.get(endpoint, 1), now)
+            headers = {'X-MBX-USED-WEIGHT-1M': str(self._rate_limit.used)}
+            if not allowed:
+                headers['Retry-After'] = str(math.ceil(60 - now % 60))
+            fail = self._rng.random() < self.config.get('errorRate', 0)
+            error = self._rng.choice(NETWORK_ERRORS)
+            latency = self.config.get('latencyMs', 0) / 1000 * math.exp(
+                self._rng.gauss(0, self.config.get('latencySigma', 0)))
+
+        time.sleep(latency)
+        if not allowed:
+            self.stats['rate_limited'] += 1
+            error = ccxt.RateLimitExceeded(f"{EXCHANGE_ID} used weight {headers['X-MBX-USED-WEIGHT-1M']} "
+                                           f"over {self._rate_limit.limit}/1m")
+            error.headers = headers
+            raise error
+        if fail:
+            self.stats['errors'] += 1
+            raise error(f"{EXCHANGE_ID} injected {error.__name__} on {endpoint}")
+        return headers
+
+    def lose_response(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.config.get('lostResponseRate', 0)
+
+    def create_order(self, symbol: str, side: str, amount: float, reduce_only: bool) -> dict:
+        with self._lock:
+            self.account.mark(symbol, int(time.time() * 1000), self.account.prices[symbol])
+            order = self.account.create_order(symbol, side, amount, reduce_only=reduce_only)
+        # ids have to stay unique across runs, orders are saved to DB
+        order['id'] = f"fake-{uuid.uuid4().hex[:16]}"
+        order['clientOrderId'] = f"fake-client-{order['id'][5:]}"
+        return order
+
+
+_venues: Dict[int, FakeVenue] = {}
+_venues_lock = threading.Lock()
+
+
+def get_venue(config: dict) -> FakeVenue:
+    with _venues_lock:
+        if id(config) not in _venues:
+            _venues[id(config)] = FakeVenue(config)
+        return _venues[id(config)]
+
+
+class FakeExchange:
+    """
+    ccxt-compatible client of the FakeVenue, covers the calls ExchangeAdapter makes.
+
+    Selected with exchange id 'fake', configured by FAKE_EXCHANGE_CONFIG.
+    Every request goes through FakeVenue.request (latency, rate limit and error injection).
+    """
+
+    id = EXCHANGE_ID
+
+    def __init__(self, config: dict = None):
+        self.config = config if config is not None else {}
+        self.venue = get_venue(self.config)
+        self.options = dict(self.config.get('options', {}))
+        self.markets = None
+        self.currencies = None
+        self.last_response_headers = {}
+        # like ccxt: ms per unit of request weight, the shared rate limiter replaces throttle
+        weight_limit = self.config.get('rateLimitWeight', 0)
+        self.rateLimit = 60_000 / weight_limit if weight_limit else 0
+        self.enableRateLimit = False
+
+    def throttle(self, cost=None):
+        pass
+
+    def fetch(self, endpoint: str):
+        """One request to the venue, the counterpart of ccxt's HTTP fetch"""
+        if self.enableRateLimit:
+            self.throttle(WEIGHTS.get(endpoint, 1))
+        try:
+            self.last_response_headers = self.venue.request(endpoint)
+        except ccxt.RateLimitExceeded as exc:
+            self.last_response_headers = exc.headers
+            raise
+
+    def set_sandbox_mode(self, enabled: bool):
+        pass
+
+    def load_markets(self, reload: bool = False, params=None) -> dict:
+        self.fetch('load_markets')
+        self.set_markets(self.venue.markets, self.venue.currencies)
+        return self.markets
+
+    def set_markets(self, markets, currencies=None):
+        self.markets = dict(markets)
+        self.currencies = dict(currencies or {})
+        return self.markets
+
+    def _symbol(self, symbol: str) -> str:
+        futures_symbol = symbol if ':' in symbol else f"{symbol}:{COLLATERAL}"
+        if futures_symbol not in self.venue.markets:
+            raise ccxt.BadSymbol(f"{EXCHANGE_ID} does not have market symbol {symbol}")
+        return futures_symbol
+
+    def fetchOHLCV(self, symbol: str, timeframe: str = '1m', since: int = None, limit: int = None, params=None):
+        self.fetch('fetchOHLCV')
+        candles = self.venue.candles(self.venue.base(self._symbol(symbol)), timeframe)
+        start = np.searchsorted(candles[:, 0], since) if since is not None else max(0, len(candles) - OHLCV_LIMIT)
+        return [[int(row[0]), *map(float, row[1:])] for row in candles[start:start + (limit or OHLCV_LIMIT)]]
+
+    fetch_ohlcv = fetchOHLCV
+
+    def fetch_balance(self, params=None) -> dict:
+        self.fetch('fetch_balance')
+        balance = self.venue.account.balance()
+        balance[COLLATERAL] = {'free': balance['free'][COLLATERAL], 'total': balance['total'][COLLATERAL]}
+        return balance
+
+    def fetch_positions(self, symbols: List[str] = None, params=None) -> list:
+        self.fetch('fetch_positions')
+        positions = [self.venue.account.position(self._symbol(symbol)) for symbol in symbols or []]
+        return [position for position in positions if position]
+
+    fetchPositions = fetch_positions
+    fetch_account_positions = fetch_positions
+
+    def fetch_ticker(self, symbol: str, params=None) -> dict:
+        self.fetch('fetch_ticker')
+        futures_symbol = self._symbol(symbol)
+        price = self.venue.account.prices[futures_symbol]
+        return {'symbol': futures_symbol, 'timestamp': int(time.time() * 1000), 'last': price, 'close': price}
+
+    def fetch_tickers(self, symbols: List[str] = None, params=None) -> dict:
+        self.fetch('fetch_tickers')
+        now_ms = int(time.time() * 1000)
+        tickers = {}
+        for symbol in symbols or self.venue.markets:
+            futures_symbol = self._symbol(symbol)
+            price = self.venue.account.prices[futures_symbol]
+            tickers[futures_symbol] = {'symbol': futures_symbol, 'timestamp': now_ms, 'last': price, 'close': price}
+        return tickers
+
+    def create_order(self, symbol: str, type: str, side: str, amount: float, price=None, params=None) -> dict:
+        self.fetch('create_order')
+        order = self.venue.create_order(self._symbol(symbol), side, amount, bool((params or {}).get('reduceOnly')))
+        if self.venue.lose_response():
+            self.venue.stats['lost_responses'] += 1
+            raise ccxt.RequestTimeout(f"{EXCHANGE_ID} order {order['id']} filled, response lost")
+        return order
+
+    def close(self):
+        pass
@@ -1,17 +1,28 @@
+import asyncio
+import json
 import logging
 import sys
 import traceback
 
 import click
 from jnd_utils.log import init_logging
-from slack_bot.notifications import SlackNotifier
 
-from config import SLACK_URL, TRADED_TICKERS
+from config import TRADING_DATA_DIR, SLACK_URL, TRADED_TICKERS, TRADE_CONCURRENCY, DAEMON_TIMEFRAME, STREAM_WORKERS
+from cycle_snapshot import SnapshotPrefetcher
+from daemon import TradingDaemon
+from stream_monitor import PositionMonitor, CcxtProFeed, ReplayFeed
+from src.backtest import Backtester, ParameterSweep, load_ohlc_dir
+from src.model import trader_database, pl_summary
+from src.utils import metrics
+from src.utils.notifier import QueuedNotifier
+from src.utils.order_journal import get_order_journal, pack_order_files
 from exchange_adapter import ExchangeAdapter
+from scanner import UniverseScanner
+from trading_cycle import TradingCycle, AsyncTradingCycle, log_session_summary
 from turtle_trader import TurtleTrader
 
 _logger = logging.getLogger(__name__)
-_notifier = SlackNotifier(url=SLACK_URL, username='main')
+_notifier = QueuedNotifier(url=SLACK_URL, username='main')
 
 
 @click.group(chain=True)
@@ -19,33 +30,177 @@ def cli():
     pass
 
 
+def export_metrics():
+    if metrics.registry.enabled:
+        _logger.info(f"Metrics of the run saved to {metrics.registry.write()}")
+
+
 @cli.command()
 @click.option('-e', '--exchange', type=str, default='binance')
 @click.option('-t', '--ticker', type=str, default='BTC')
 def log_pl(exchange, ticker):
     exchange = ExchangeAdapter(exchange)
     exchange.market = f"{ticker}"
-    TurtleTrader(exchange).log_total_pl()
+    TurtleTrader(exchange, load_state=False).log_total_pl()
+
+
+@cli.command(help='recompute the P/L summary table from all orders')
+def rebuild_pl_summary():
+    n_symbols = pl_summary.rebuild(trader_database)
+    _logger.info(f"P/L summary rebuilt, {n_symbols} symbols")
 
 
 @cli.command(help='run Turtle trading bot')
-def trade():
+@click.option('-c', '--concurrency', type=int, default=TRADE_CONCURRENCY,
+              help='number of tickers traded in parallel')
+@click.option('-e', '--exchange', type=str, default='binance',
+              help="exchange id, 'fake' for the local stand-in exchange")
+@click.option('-t', '--tickers', type=str, default=None,
+              help="comma separated tickers, 'all' for every market of the exchange, "
+                   "TRADED_TICKERS by default (every perpetual with --scan)")
+@click.option('--scan', is_flag=True,
+              help='trade only tickers with an opened position or a ranked entry signal')
+def trade(concurrency, exchange, tickers, scan):
     _logger.info("\n============== STARTING TRADE SESSION ==============\n")
     try:
-        _logger.info(f"Initialising Turtle trader, tickers: {TRADED_TICKERS}")
-        exchange = ExchangeAdapter('binance')
-        exchange.load_exchange()
-        for ticker in TRADED_TICKERS:
-            _logger.info(f"\n\n----------- Starting trade - {ticker} -----------")
-            exchange.market = f"{ticker}"
-            trader = TurtleTrader(exchange)
-            _logger.debug(f"Market info before trading: {exchange.market_info}")
-            trader.trade()
+        cycle = TradingCycle(exchange, concurrency=concurrency, scan=scan)
+        if tickers == 'all':
+            tickers = sorted({market['base'] for market in cycle.exchange.markets.values()})
+        elif tickers:
+            tickers = tickers.split(',')
+        else:
+            tickers = UniverseScanner(cycle.exchange).universe() if scan else TRADED_TICKERS
+        _logger.info(f"Initialising Turtle trader, tickers: {tickers}")
+        results = cycle.run(tickers)
     except Exception as e:
         _logger.error(f"Trading error: {e}\n{traceback.format_exc()}")
         _notifier.error(f"Trading error: {e}\n{traceback.format_exc()}")
         sys.exit(1)
 
+    log_session_summary(results)
+    export_metrics()
+    if not all(result.ok for result in results):
+        sys.exit(1)
+
+
+@cli.command(help='scan turtle signals of every perpetual of the exchange without trading')
+@click.option('-e', '--exchange', type=str, default='binance',
+              help="exchange id, 'fake' for the local stand-in exchange")
+@click.option('-c', '--concurrency', type=int, default=TRADE_CONCURRENCY,
+              help='number of candle requests in parallel')
+@click.option('-o', '--out', type=click.Path(dir_okay=False), default=None, help='save all signals to csv')
+def scan(exchange, concurrency, out):
+    exchange = ExchangeAdapter(exchange)
+    exchange.load_exchange()
+    scanner = UniverseScanner(exchange)
+    tickers = scanner.universe()
+    snapshot = SnapshotPrefetcher(exchange, concurrency).prefetch(tickers, since=TurtleTrader.ohlc_since_timestamp())
+    signals = scanner.scan(snapshot, tickers)
+    selected = scanner.select(signals, {symbol.split('/')[0] for symbol in snapshot.positions})
+    _logger.info(f"Entry signals:\n{signals[signals['entry'].notna()].head(50).to_string()}")
+    _logger.info(f"Would trade: {selected}")
+    if out:
+        signals.to_csv(out)
+
+
+@cli.command(help='run Turtle trading bot for all tickers from one asyncio event loop')
+@click.option('-c', '--concurrency', type=int, default=TRADE_CONCURRENCY,
+              help='number of tickers traded at the same time')
+def async_trade(concurrency):
+    _logger.info("\n============== STARTING ASYNC TRADE SESSION ==============\n")
+    try:
+        _logger.info(f"Initialising async Turtle trader, tickers: {TRADED_TICKERS}")
+        results = AsyncTradingCycle('binance', concurrency=concurrency).run(TRADED_TICKERS)
+    except Exception as e:
+        _logger.error(f"Trading error: {e}\n{traceback.format_exc()}")
+        _notifier.error(f"Trading error: {e}\n{traceback.format_exc()}")
+        sys.exit(1)
+
+    log_session_summary(results)
+    export_metrics()
+    if not all(result.ok for result in results):
+        sys.exit(1)
+
+
+@cli.command(help='move order_<id>.json files into the order journal')
+@click.option('-s', '--source-dir', type=click.Path(exists=True, file_okay=False), default=TRADING_DATA_DIR)
+@click.option('--remove', is_flag=True, help='delete json files once packed')
+def pack_orders(source_dir, remove):
+    packed = pack_order_files(get_order_journal(), source_dir, remove=remove)
+    _logger.info(f"{packed} orders packed, journal holds {len(get_order_journal())} orders")
+
+
+@cli.command(help='keep running and trade on every candle close of the timeframe')
+@click.option('-t', '--timeframe', type=str, default=DAEMON_TIMEFRAME)
+@click.option('-c', '--concurrency', type=int, default=TRADE_CONCURRENCY,
+              help='number of tickers traded in parallel')
+@click.option('-e', '--exchange', type=str, default='binance',
+              help="exchange id, 'fake' for the local stand-in exchange")
+def daemon(timeframe, concurrency, exchange):
+    _logger.info("\n============== STARTING TRADING DAEMON ==============\n")
+    try:
+        _logger.info(f"Initialising trading daemon, tickers: {TRADED_TICKERS}, timeframe: {timeframe}")
+        TradingDaemon(TRADED_TICKERS, exchange, timeframe=timeframe, concurrency=concurrency).run()
+    except Exception as e:
+        _logger.error(f"Trading daemon error: {e}\n{traceback.format_exc()}")
+        _notifier.error(f"Trading daemon error: {e}\n{traceback.format_exc()}")
+        sys.exit(1)
+
+
+@cli.command(help='watch opened positions tick by tick and fire stop-loss and pyramid orders')
+@click.option('-r', '--replay', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='replay ticks from csv (timestamp,symbol,price) instead of the exchange websocket')
+@click.option('-s', '--speed', type=float, default=0, help='replay speed, 1 real time, 0 as fast as possible')
+@click.option('-w', '--workers', type=int, default=STREAM_WORKERS, help='threads executing triggered orders')
+def stream(replay, speed, workers):
+    _logger.info("\n============== STARTING POSITION MONITOR ==============\n")
+    feed = ReplayFeed(replay, speed=speed) if replay else CcxtProFeed('binance')
+    try:
+        asyncio.run(PositionMonitor(feed, 'binance', workers=workers).run())
+        export_metrics()
+    except Exception as e:
+        _logger.error(f"Position monitor error: {e}\n{traceback.format_exc()}")
+        _notifier.error(f"Position monitor error: {e}\n{traceback.format_exc()}")
+        sys.exit(1)
+
+
+@cli.command(help='backtest Turtle trading strategy on OHLCV history')
+@click.option('-d', '--data-dir', type=click.Path(exists=True, file_okay=False), required=True,
+              help='directory with <TICKER>.csv (timeframe,O,H,L,C,V) or ohlc cache parquet files')
+@click.option('-b', '--balance', type=float, default=10_000)
+@click.option('-f', '--fee-rate', type=float, default=0.0004)
+@click.option('-o', '--out-dir', type=click.Path(file_okay=False), default=None,
+              help='write trades.csv, equity.csv and summary.json here')
+def backtest(data_dir, balance, fee_rate, out_dir):
+    ohlc = load_ohlc_dir(data_dir)
+    _logger.info(f"Backtesting {len(ohlc)} tickers: {list(ohlc)}")
+    result = Backtester(ohlc, initial_balance=balance, fee_rate=fee_rate).run()
+    _logger.info(f"Backtest summary:\n{json.dumps(result.summary, indent=4)}")
+    if out_dir:
+        result.save(out_dir)
+
+
+@cli.command(help='backtest every combination of a parameter grid on a process pool')
+@click.option('-d', '--data-dir', type=click.Path(exists=True, file_okay=False), required=True,
+              help='directory with <TICKER>.csv (timeframe,O,H,L,C,V) or ohlc cache parquet files')
+@click.option('-g', '--grid', type=click.File(), required=True,
+              help='json file, e.g. {"ATR_PERIOD": [20, 50], "STOP_LOSS_ATR_MULTIPL": [1.5, 2, 3]}')
+@click.option('-w', '--workers', type=int, default=None, help='number of processes, defaults to cpu count')
+@click.option('-r', '--rank-by', type=str, default='sharpe', help='summary stat used for ranking')
+@click.option('-b', '--balance', type=float, default=10_000)
+@click.option('-f', '--fee-rate', type=float, default=0.0004)
+@click.option('-o', '--out', type=click.Path(dir_okay=False), default='sweep_results.csv')
+def sweep(data_dir, grid, workers, rank_by, balance, fee_rate, out):
+    ohlc = load_ohlc_dir(data_dir)
+    results = ParameterSweep(ohlc,
+                             json.load(grid),
+                             workers=workers,
+                             rank_by=rank_by,
+                             initial_balance=balance,
+                             fee_rate=fee_rate).run()
+    results.to_csv(out, index=False)
+    _logger.info(f"Sweep results saved to {out}, best:\n{results.head(10).to_string(index=False)}")
+
 
 if __name__ == '__main__':
     init_logging()
@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from config import app_config, MARKET_CACHE_DIR, MARKET_CACHE_MAX_AGE
+
+_logger = logging.getLogger(__name__)
+
+# market fields kept in the compact index, enough for sizing and filtering orders
+INDEX_FIELDS = ('id', 'symbol', 'base', 'quote', 'settle', 'type', 'swap', 'linear',
+                'active', 'contractSize', 'precision', 'limits')
+
+
+class MarketCache:
+    """
+    Markets of one exchange stored on disk, sandbox markets are kept apart from production ones.
+
+    The full market map (needed by ccxt itself) and a compact per-symbol index
+    (read by adapter properties) are kept in separate files, so the index
+    can be answered without parsing the full map.
+    """
+
+    def __init__(self,
+                 exchange_id: str,
+                 sandbox: bool = app_config.USE_SANDBOX,
+                 cache_dir: str = MARKET_CACHE_DIR,
+                 max_age: float = MARKET_CACHE_MAX_AGE):
+        self.exchange_id = exchange_id
+        self.sandbox = sandbox
+        self.max_age = max_age
+        name = f"{exchange_id}_sandbox" if sandbox else exchange_id
+        self.markets_path = os.path.join(cache_dir, f"{name}_markets.json")
+        self.index_path = os.path.join(cache_dir, f"{name}_index.json")
+        self._lock = threading.Lock()
+        self._index = None
+        self._markets = None
+        self._refreshing = False
+
+    @property
+    def age(self):
+        """Seconds since the cache was written, None if there is no cache"""
+        if not (os.path.exists(self.index_path) and os.path.exists(self.markets_path)):
+            return None
+        return time.time() - os.path.getmtime(self.index_path)
+
+    @property
+    def is_stale(self):
+        age = self.age
+        return age is None or age > self.max_age
+
+    def index(self) -> dict:
+        with self._lock:
+            if self._index is None:
+                with open(self.index_path) as ff:
+                    self._index = json.load(ff)
+            return self._index
+
+    def markets(self):
+        """Full (markets, currencies) as loaded by ccxt"""
+        with self._lock:
+            if self._markets is None:
+                _logger.info(f"Loading cached markets of {self.exchange_id}")
+                with open(self.markets_path) as ff:
+                    cached = json.load(ff)
+                self._markets = cached['markets'], cached['currencies']
+            return self._markets
+
+    def save(self, markets: dict, currencies: dict):
+        os.makedirs(os.path.dirname(self.markets_path), exist_ok=True)
+        index = {symbol: {key: market.get(key) for key in INDEX_FIELDS} for symbol, market in markets.items()}
+
+        for path, data in ((self.markets_path, {'markets': markets, 'currencies': currencies}),
+                           (self.index_path, index)):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as ff:
+                json.dump(data, ff)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            self._index = index
+            self._markets = markets, currencies
+        _logger.info(f"Markets of {self.exchange_id} cached, {len(index)} symbols")
+
+    def refresh_in_background(self, load_markets):
+        """Reload markets with `load_markets()` -> (markets, currencies) in a daemon thread"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self.save(*load_markets())
+            except Exception as exc:
+                _logger.error(f"Background markets refresh of {self.exchange_id} failed: {exc}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name=f"{self.exchange_id}-markets-refresh", daemon=True).start()
+
+
+_market_caches = {}
+_market_caches_lock = threading.Lock()
+
+
+def get_market_cache(exchange_id: str, sandbox: bool = app_config.USE_SANDBOX) -> MarketCache:
+    """One MarketCache per exchange (and sandbox mode) in the process, so the cached files are parsed once"""
+    key = (exchange_id, sandbox)
+    with _market_caches_lock:
+        if key not in _market_caches:
+            _market_caches[key] = MarketCache(exchange_id, sandbox)
+        return _market_caches[key]
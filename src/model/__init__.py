@@ -1,3 +1,3 @@
-from database_tools.adapters.postgresql import PostgresqlAdapter
+from src.model.database import PooledDatabase
 
-trader_database = PostgresqlAdapter.from_env_vars()
+trader_database = PooledDatabase()
@@ -0,0 +1,214 @@
+import logging
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Dict
+
+from database_tools.adapters.postgresql import PostgresqlAdapter
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import CreateSchema
+
+from src.config import (TRADER_DATABASE_URL,
+                        DB_POOL_SIZE,
+                        DB_MAX_OVERFLOW,
+                        DB_POOL_TIMEOUT,
+                        DB_POOL_RECYCLE,
+                        DB_POOL_PRE_PING,
+                        DB_PREPARED_STATEMENTS,
+                        DB_PREPARE_THRESHOLD)
+from src.utils.metrics import registry, span
+
+_logger = logging.getLogger(__name__)
+
+POOL_METRICS = {
+    'db_pool_size': 'Connections the pool keeps open.',
+    'db_pool_checked_out': 'Connections in use.',
+    'db_pool_idle': 'Open connections waiting in the pool.',
+    'db_pool_overflow': 'Connections opened above the pool size.',
+    'db_pool_checkouts_total': 'Connections taken from the pool.',
+    'db_pool_checkout_timeouts_total': 'Checkouts failed waiting for a free connection.',
+    'db_pool_connects_total': 'Database connections opened.',
+    'db_pool_invalidations_total': 'Connections discarded after an error, pre-ping or recycle.',
+}
+
+
+class PoolStats:
+    __slots__ = ('checkouts', 'checkout_timeouts', 'connects', 'invalidations', '_lock')
+
+    def __init__(self):
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def increment(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool timing every checkout as the `db.pool.checkout` span (wait for a free connection,
+    opening a new one and the pre-ping)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # a pool recreated by engine.dispose starts counting again
+        self.stats = PoolStats()
+
+    def connect(self):
+        try:
+            with span('db.pool.checkout'):
+                connection = super().connect()
+        except TimeoutError:
+            self.stats.increment('checkout_timeouts')
+            _logger.warning(f"No free database connection in {self.timeout()}s, {self.status()}")
+            raise
+        self.stats.increment('checkouts')
+        return connection
+
+
+def default_driver(url: URL) -> URL:
+    """A postgresql url naming no driver connects with psycopg 3, the driver preparing statements (see _connect_args)"""
+    if url.drivername == 'postgresql':
+        return url.set(drivername='postgresql+psycopg')
+    return url
+
+
+def adapter_url() -> URL:
+    """Url of the database configured for database_tools by env vars"""
+    adapter = PostgresqlAdapter.from_env_vars()
+    with adapter.get_session() as session:
+        engine = session.get_bind()
+    url = engine.url
+    # nothing was checked out, the adapter pool holds no connection
+    engine.dispose()
+    return url
+
+
+class PooledDatabase:
+    """
+    Trader database with one tuned, process wide connection pool.
+
+    Same session API as database_tools' PostgresqlAdapter (get_session, session_manager,
+    init_schema), the engine is built here so that the pool is configured from config.
+    Sessions are short lived and never shared, a concurrent ticker takes its own connection
+    from the pool and gives it back when its session closes. The pool is LIFO, the most recently
+    used connection is reused, so idle connections above the load age out through `recycle`.
+    Committed objects are not expired, they stay readable after their session is closed.
+    """
+
+    def __init__(self,
+                 url=None,
+                 pool_size: int = DB_POOL_SIZE,
+                 max_overflow: int = DB_MAX_OVERFLOW,
+                 pool_timeout: float = DB_POOL_TIMEOUT,
+                 pool_recycle: int = DB_POOL_RECYCLE,
+                 pool_pre_ping: bool = DB_POOL_PRE_PING,
+                 prepared_statements: bool = DB_PREPARED_STATEMENTS,
+                 prepare_threshold: int = DB_PREPARE_THRESHOLD,
+                 metrics_source: str = 'trader',
+                 **engine_options):
+        url = default_driver(make_url(url or TRADER_DATABASE_URL or adapter_url()))
+        self.engine = create_engine(
+            url,
+            poolclass=MeteredQueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
+            pool_pre_ping=pool_pre_ping,
+            pool_use_lifo=True,
+            connect_args=self._connect_args(url, prepared_statements, prepare_threshold),
+            **engine_options
+        )
+        self.Session = sessionmaker(bind=self.engine, expire_on_commit=False)
+
+        event.listen(self.engine.pool, 'connect', lambda *args: self.engine.pool.stats.increment('connects'))
+        event.listen(self.engine.pool, 'invalidate', lambda *args: self.engine.pool.stats.increment('invalidations'))
+        event.listen(self.engine.pool, 'soft_invalidate',
+                     lambda *args: self.engine.pool.stats.increment('invalidations'))
+        if metrics_source:
+            registry.register_gauges(metrics_source, self.pool_metrics, POOL_METRICS)
+        _databases.add(self)
+        _logger.info(f"Database pool of {pool_size} (+{max_overflow}) connections to "
+                     f"{url.render_as_string(hide_password=True)}")
+
+    @staticmethod
+    def _connect_args(url: URL, prepared_statements: bool, prepare_threshold: int) -> dict:
+        if url.get_driver_name() == 'psycopg':
+            # None never prepares
+            return {'prepare_threshold': prepare_threshold if prepared_statements else None}
+        if prepared_statements and url.get_backend_name() == 'postgresql':
+            _logger.info(f"Driver {url.get_driver_name()} does not prepare statements server side, "
+                         f"use a postgresql+psycopg url, statements are compiled once by SQLAlchemy")
+        return {}
+
+    def pool_metrics(self) -> Dict[str, float]:
+        pool = self.engine.pool
+        return {
+            'db_pool_size': pool.size(),
+            'db_pool_checked_out': pool.checkedout(),
+            'db_pool_idle': pool.checkedin(),
+            # negative while fewer than size connections are open
+            'db_pool_overflow': max(0, pool.overflow()),
+            'db_pool_checkouts_total': pool.stats.checkouts,
+            'db_pool_checkout_timeouts_total': pool.stats.checkout_timeouts,
+            'db_pool_connects_total': pool.stats.connects,
+            'db_pool_invalidations_total': pool.stats.invalidations,
+        }
+
+    @contextmanager
+    def get_session(self):
+        session = self.Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    @contextmanager
+    def session_manager(self):
+        """Session committed at the end of the block, rolled back on error"""
+        session = self.Session()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def init_schema(self, metadata):
+        with self.engine.begin() as connection:
+            for schema in {table.schema for table in metadata.tables.values()} - {None}:
+                connection.execute(CreateSchema(schema, if_not_exists=True))
+            metadata.create_all(connection)
+
+    def warm(self, connections: int = None):
+        """Open connections up to `connections` (pool size) before they are needed"""
+        connections = min(connections or self.engine.pool.size(), self.engine.pool.size())
+        opened = [self.engine.pool.connect() for _ in range(connections)]
+        for connection in opened:
+            connection.close()
+
+    def dispose(self):
+        """Close the idle connections, connections in use are closed when given back"""
+        self.engine.dispose()
+
+
+_databases = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    # connections of the parent process must not be used (or closed) by the child
+    for database in list(_databases):
+        database.engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,53 @@
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from src.model.turtle_model import Order, PlSummary
+
+
+def add_pl(session, symbol: str, pl: float, timestamp: int):
+    """Add P/L of one close order to the symbol row, in the caller's transaction"""
+    stmt = insert(PlSummary).values(symbol=symbol, pl=pl, n_closed=1, last_timestamp=timestamp)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=[PlSummary.symbol],
+        set_={
+            'pl': PlSummary.pl + stmt.excluded.pl,
+            'n_closed': PlSummary.n_closed + 1,
+            'last_timestamp': func.greatest(PlSummary.last_timestamp, stmt.excluded.last_timestamp)
+        }
+    ))
+
+
+def query_pl(session, symbol: str):
+    """
+    P/L of the symbol and total P/L, read from the per-symbol summary rows
+    :return: asset P/L, total P/L
+    """
+    asset_pl, total_pl = session.query(
+        func.sum(PlSummary.pl).filter(PlSummary.symbol == symbol),
+        func.sum(PlSummary.pl)
+    ).one()
+
+    # If there are no records matching the filters, set the values to 0.0
+    asset_pl = 0.0 if asset_pl is None else float(asset_pl)
+    total_pl = 0.0 if total_pl is None else float(total_pl)
+    return asset_pl, total_pl
+
+
+def rebuild(database) -> int:
+    """Recompute the summary from all orders in one transaction, returns number of symbols"""
+    with database.session_manager() as session:
+        session.query(PlSummary).delete(synchronize_session=False)
+        totals = session.query(
+            Order.symbol,
+            func.sum(Order.pl),
+            func.count(Order.pl),
+            func.max(Order.timestamp)
+        ).filter(
+            Order.pl.isnot(None)
+        ).group_by(
+            Order.symbol
+        )
+        session.execute(insert(PlSummary).from_select(
+            ['symbol', 'pl', 'n_closed', 'last_timestamp'], totals.statement
+        ))
+        return session.query(func.count(PlSummary.symbol)).scalar()
@@ -1,8 +1,8 @@
-from database_tools.adapters.postgresql import PostgresqlAdapter
-from sqlalchemy import Column, Float, String, Boolean, BigInteger, JSON, Numeric, ARRAY
+from sqlalchemy import Column, Float, String, Boolean, BigInteger, JSON, Numeric, ARRAY, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 
 from src.model import trader_database
+from src.model.database import PooledDatabase
 
 Base = declarative_base()
 
@@ -17,6 +17,17 @@ class TurtleBase(Base):
 
 class Order(TurtleBase):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # OpenPositionStore._query: opened rows of all symbols in (symbol, time) order, only a handful are opened
+        Index('ix_orders_opened_symbol_timestamp', 'symbol', 'timestamp',
+              postgresql_where=text("position_status = 'opened'")),
+        # pl_summary.rebuild (rebuild_pl_summary backfill) as an index only scan over close orders,
+        # the trader reads P/L from pl_summary and never aggregates orders
+        Index('ix_orders_symbol_pl_timestamp', 'symbol',
+              postgresql_include=['pl', 'timestamp'],
+              postgresql_where=text('pl IS NOT NULL')),
+        {'schema': SCHEMA}
+    )
 
     id = Column(String, primary_key=True)
     client_order_id = Column(String, index=True)
@@ -58,5 +69,24 @@ class Order(TurtleBase):
     pl_percent = Column(Float)
 
 
+class PlSummary(TurtleBase):
+    """P/L of close orders per symbol, maintained with every close order (rebuild_pl_summary to backfill)"""
+    __tablename__ = 'pl_summary'
+
+    symbol = Column(String, primary_key=True)
+    pl = Column(Float, nullable=False, default=0.0)
+    n_closed = Column(BigInteger, nullable=False, default=0)
+    last_timestamp = Column(BigInteger)
+
+
+def create_indexes(database: PooledDatabase = trader_database):
+    """Create model indexes missing on existing tables, init_schema only creates indexes of new tables"""
+    with database.session_manager() as session:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=session.connection(), checkfirst=True)
+
+
 if __name__ == '__main__':
     trader_database.init_schema(Base.metadata)
+    create_indexes()
@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import time
+
+import ccxt
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import OHLC_CACHE_DIR
+
+_logger = logging.getLogger(__name__)
+
+OHLC_COLUMNS = ['timeframe', 'O', 'H', 'L', 'C', 'V']
+OHLC_DTYPES = {'timeframe': 'int64', 'O': 'float64', 'H': 'float64', 'L': 'float64', 'C': 'float64', 'V': 'float64'}
+# parquet schema metadata key of the ranges known to have no candles
+METADATA_KEY = b'ohlc_cache'
+
+
+def empty_ohlc() -> pd.DataFrame:
+    return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in OHLC_DTYPES.items()})
+
+
+class OhlcCache:
+    """
+    Closed candles of one exchange / symbol / timeframe stored in a parquet file.
+
+    `update` fetches only the candles missing in the store (new candles and gaps
+    inside the requested window) plus the currently running candle,
+    which is returned but never stored.
+    Ranges the exchange returned no candles for are kept in the parquet metadata, the first
+    available candle (listing) and the empty ranges after it (maintenance) are not fetched again.
+    """
+
+    def __init__(self, exchange_id: str, symbol: str, timeframe: str = '1d', cache_dir: str = OHLC_CACHE_DIR):
+        self.timeframe = timeframe
+        self.timeframe_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+        file_name = f"{symbol.replace('/', '-').replace(':', '-')}_{timeframe}.parquet"
+        self.path = os.path.join(cache_dir, exchange_id, file_name)
+        # open time of the first candle the exchange has, None until a fetch reached before it
+        self.first_ts = None
+        # [start, end) ranges after first_ts the exchange returned no candles for
+        self.empty_ranges = []
+
+    def load(self) -> pd.DataFrame:
+        if not os.path.exists(self.path):
+            return empty_ohlc()
+        try:
+            table = pq.read_table(self.path)
+        except Exception as exc:
+            _logger.error(f"Cannot read ohlc cache {self.path}, rebuilding it. {exc}")
+            return empty_ohlc()
+        metadata = json.loads((table.schema.metadata or {}).get(METADATA_KEY, b'{}'))
+        self.first_ts = metadata.get('first_ts')
+        self.empty_ranges = [tuple(empty_range) for empty_range in metadata.get('empty_ranges', [])]
+        return table.to_pandas().astype(OHLC_DTYPES)
+
+    def save(self, candles: pd.DataFrame):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        table = pa.Table.from_pandas(candles[OHLC_COLUMNS], preserve_index=False)
+        metadata = {'first_ts': self.first_ts, 'empty_ranges': self.empty_ranges}
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               METADATA_KEY: json.dumps(metadata).encode()})
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, self.path)
+
+    def _runs(self, timestamps):
+        """Sorted candle open times grouped in contiguous [start, end) ranges"""
+        if not timestamps.size:
+            return []
+        breaks = np.flatnonzero(np.diff(timestamps) != self.timeframe_ms) + 1
+        return [(int(run[0]), int(run[-1]) + self.timeframe_ms) for run in np.split(timestamps, breaks)]
+
+    def _empty_timestamps(self):
+        empty = [np.arange(start, end, self.timeframe_ms, dtype='int64') for start, end in self.empty_ranges]
+        return np.concatenate(empty) if empty else np.empty(0, dtype='int64')
+
+    def missing_ranges(self, timestamps, since: int, until: int):
+        """Contiguous (start, end) ranges of candle open times in [since, until) missing in timestamps
+        and not known to be empty"""
+        if self.first_ts is not None:
+            since = max(since, self.first_ts)
+        expected = np.arange(since, until, self.timeframe_ms, dtype='int64')
+        known = np.union1d(np.asarray(timestamps, dtype='int64'), self._empty_timestamps())
+        return self._runs(np.setdiff1d(expected, known, assume_unique=True))
+
+    def record_empty(self, ranges, timestamps, running_candle_ts: int):
+        """Remember what of the fetched ranges the exchange has no candles for, timestamps are the cached
+        and fetched candle open times"""
+        timestamps = np.unique(np.asarray(timestamps, dtype='int64'))
+        requested = [np.arange(start, running_candle_ts if end is None else end, self.timeframe_ms, dtype='int64')
+                     for start, end in ranges]
+        empty = np.setdiff1d(np.concatenate(requested), timestamps)
+        if timestamps.size and empty.size and empty[0] < timestamps[0]:
+            # nothing before the first candle, the symbol was listed then
+            first_ts = int(timestamps[0])
+            self.first_ts = first_ts if self.first_ts is None else min(self.first_ts, first_ts)
+        if self.first_ts is not None:
+            empty = empty[empty >= self.first_ts]
+        # candles after the newest one may not be published yet
+        empty = empty[empty < timestamps[-1]] if timestamps.size else empty[:0]
+        if empty.size:
+            _logger.info(f"No candles in {len(self._runs(empty))} ranges of ohlc cache {self.path}")
+        self.empty_ranges = self._runs(np.union1d(self._empty_timestamps(), empty))
+
+    def fetch_range(self, fetch_candles, start: int, end: int = None, now_ms: int = None):
+        """Page through fetch_candles(since) until end (exclusive), None means up to the running candle"""
+        now_ms = now_ms or int(time.time() * 1000)
+        candles = []
+        since = start
+        while True:
+            batch = fetch_candles(since)
+            if not batch:
+                break
+            candles.extend(batch)
+            last_ts = batch[-1][0]
+            if (end is not None and last_ts + self.timeframe_ms >= end) or last_ts < since:
+                break
+            next_since = last_ts + self.timeframe_ms
+            if end is None and next_since > now_ms:
+                break
+            since = next_since
+        return candles
+
+    def update(self, fetch_candles, since: int, now_ms: int = None) -> pd.DataFrame:
+        now_ms = now_ms or int(time.time() * 1000)
+        since = since - since % self.timeframe_ms
+        running_candle_ts = now_ms - now_ms % self.timeframe_ms
+
+        cached = self.load()
+        cached = cached[cached['timeframe'] < running_candle_ts]
+
+        ranges = self.missing_ranges(cached['timeframe'], since, running_candle_ts)
+        # the newest range is extended by the running candle, otherwise fetch running candle alone
+        if ranges and ranges[-1][1] == running_candle_ts:
+            ranges[-1] = (ranges[-1][0], None)
+        else:
+            ranges.append((running_candle_ts, None))
+        if len(ranges) > 1:
+            _logger.info(f"Filling {len(ranges) - 1} gaps in ohlc cache {self.path}")
+
+        fetched = []
+        for start, end in ranges:
+            fetched.extend(self.fetch_range(fetch_candles, start, end, now_ms))
+        closed_ranges = [(start, end) for start, end in ranges if start < running_candle_ts]
+        if closed_ranges:
+            timestamps = np.concatenate([cached['timeframe'].to_numpy(dtype='int64'),
+                                         np.array([candle[0] for candle in fetched], dtype='int64')])
+            self.record_empty(closed_ranges, timestamps, running_candle_ts)
+
+        candles = pd.concat(
+            [cached, pd.DataFrame(fetched, columns=OHLC_COLUMNS)],
+            ignore_index=True
+        ) if fetched else cached
+        candles = candles.drop_duplicates('timeframe', keep='last').sort_values('timeframe')
+        candles = candles.astype(OHLC_DTYPES)
+
+        if closed_ranges:
+            self.save(candles[candles['timeframe'] < running_candle_ts])
+
+        return candles[candles['timeframe'] >= since].reset_index(drop=True)
@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+import weakref
+from dataclasses import dataclass, fields
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError, TimeoutError
+
+from config import AGGRESSIVE_PYRAMID_ATR_PRICE_RATIO_LIMIT, POSITION_STORE_RECONCILE_INTERVAL
+from src.model import trader_database
+from src.model.turtle_model import Order
+from src.utils.retry_policy import RetryPolicy
+
+_logger = logging.getLogger(__name__)
+
+LOAD_POLICY = RetryPolicy(retry_on=(OperationalError, TimeoutError), base_delay=2)
+
+
+@dataclass
+class LastOpenedPosition:
+    id: str
+    agg_trade_id: str
+    action: str
+    price: float
+    cost: float
+    stop_loss_price: float
+    atr: float
+    free_balance: float
+    pl: float
+
+    @classmethod
+    def from_order(cls, order) -> 'LastOpenedPosition':
+        """Position of an Order (or any object with the same attributes)"""
+        return cls(*(getattr(order, name) for name in POSITION_FIELDS))
+
+    @classmethod
+    def from_row(cls, row) -> 'LastOpenedPosition':
+        position = cls(*row)
+        # Numeric columns come as Decimal
+        position.atr = float(position.atr) if position.atr is not None else None
+        return position
+
+    def is_long(self):
+        return self.action == 'long'
+
+    def get_atr_price_ratio(self):
+        return self.atr / self.price
+
+    def get_atr_for_pyramid(self, atr_price_ratio_limit=AGGRESSIVE_PYRAMID_ATR_PRICE_RATIO_LIMIT):
+        # lower atr for entry to half for pyramid trade
+        # if atr/price ration is lower than 2% (less volatile market)
+        atr_ratio = self.get_atr_price_ratio()
+        if atr_ratio < atr_price_ratio_limit:
+            return self.atr * 0.5
+        return self.atr
+
+
+POSITION_FIELDS = [field.name for field in fields(LastOpenedPosition)]
+
+
+def opened_positions_select():
+    """Opened positions of all symbols in time order, rows are (symbol, *POSITION_FIELDS)"""
+    return select(
+        Order.symbol,
+        *(getattr(Order, name) for name in POSITION_FIELDS)
+    ).where(
+        Order.position_status == 'opened'
+    ).order_by(
+        Order.symbol,
+        Order.timestamp
+    )
+
+
+class OpenPositionStore:
+    """
+    Opened positions of all symbols, loaded with one query instead of one query per trader.
+
+    Positions of a symbol are a tuple in time order. The store is written through: orders
+    committed to DB by this process are added or closed here right after the commit.
+    Orders of other processes (daily run, stream monitor) are picked up on the next load,
+    the store is reloaded from DB and compared with it when older than `reconcile_interval`.
+    """
+
+    def __init__(self, database=trader_database, reconcile_interval: float = POSITION_STORE_RECONCILE_INTERVAL):
+        self._database = database
+        self.reconcile_interval = reconcile_interval
+        self._positions: Dict[str, Tuple[LastOpenedPosition, ...]] = {}
+        self.loaded_at = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    @LOAD_POLICY.retry('db.load_opened_positions')
+    def _query(self) -> Dict[str, Tuple[LastOpenedPosition, ...]]:
+        with self._database.get_session() as session:
+            rows = session.execute(opened_positions_select()).all()
+
+        positions = {}
+        for symbol, *row in rows:
+            positions.setdefault(symbol, []).append(LastOpenedPosition.from_row(row))
+        return {symbol: tuple(symbol_positions) for symbol, symbol_positions in positions.items()}
+
+    def load(self):
+        """Replace the store with the opened positions in DB, logs the symbols that differed"""
+        positions = self._query()
+        with self._lock:
+            if self.loaded_at is not None:
+                changed = [symbol for symbol in positions.keys() | self._positions.keys()
+                           if self._ids(positions.get(symbol)) != self._ids(self._positions.get(symbol))]
+                if changed:
+                    _logger.info(f"Opened positions changed in DB: {sorted(changed)}")
+            self._positions = positions
+            self.loaded_at = time.monotonic()
+        _logger.info(f"Loaded opened positions of {len(positions)} symbols")
+
+    @staticmethod
+    def _ids(positions) -> List[str]:
+        return [position.id for position in positions or ()]
+
+    def _stale(self) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.reconcile_interval
+
+    def _ensure_fresh(self):
+        if self._stale():
+            # traders starting together wait for one query
+            with self._load_lock:
+                if self._stale():
+                    self.load()
+
+    def opened(self, symbol: str) -> Tuple[LastOpenedPosition, ...]:
+        """Opened positions of the symbol in time order, empty if there is none"""
+        self._ensure_fresh()
+        with self._lock:
+            return self._positions.get(symbol, ())
+
+    def symbols(self) -> List[str]:
+        """Symbols with an opened position"""
+        self._ensure_fresh()
+        with self._lock:
+            return list(self._positions)
+
+    def add(self, symbol: str, position: LastOpenedPosition):
+        with self._lock:
+            self._positions[symbol] = self._positions.get(symbol, ()) + (position,)
+
+    def close(self, symbol: str, ids: Iterable[str]):
+        ids = set(ids or ())
+        with self._lock:
+            remaining = tuple(position for position in self._positions.get(symbol, ()) if position.id not in ids)
+            if remaining:
+                self._positions[symbol] = remaining
+            else:
+                self._positions.pop(symbol, None)
+
+
+_position_stores = weakref.WeakKeyDictionary()
+_position_stores_lock = threading.Lock()
+
+
+def get_position_store(database=trader_database) -> OpenPositionStore:
+    """One store per database in the process, shared by all traders, released with the database"""
+    with _position_stores_lock:
+        store = _position_stores.get(database)
+        if store is None:
+            # a strong reference from the store would keep its key alive
+            store = _position_stores[database] = OpenPositionStore(weakref.proxy(database))
+        return store
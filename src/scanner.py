@@ -0,0 +1,185 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Set
+
+import numpy as np
+import pandas as pd
+
+from config import SCANNER_MIN_QUOTE_VOLUME, SCANNER_MAX_CANDIDATES
+from cycle_snapshot import CycleSnapshot
+from exchange_adapter import ExchangeAdapter
+from ohlc_cache import OHLC_COLUMNS
+from position_store import get_position_store
+from src.model import trader_database
+from turtle_trader import TurtleParams
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OhlcPanel:
+    """
+    Candles of many tickers as 2-D arrays (tickers x bars).
+
+    Every row holds the last `bars` candles of its ticker right aligned, the last column is
+    the ticker's running candle. Rows of tickers with fewer candles are padded with NaN on the left,
+    so rolling windows count the ticker's own candles like the per-ticker indicators do.
+    """
+    tickers: List[str]
+    timeframe: np.ndarray
+    O: np.ndarray
+    H: np.ndarray
+    L: np.ndarray
+    C: np.ndarray
+    V: np.ndarray
+
+    @classmethod
+    def from_frames(cls, frames: Dict[str, pd.DataFrame], bars: int) -> 'OhlcPanel':
+        values = np.full((len(OHLC_COLUMNS), len(frames), bars), np.nan)
+        for row, ohlc in enumerate(frames.values()):
+            n = min(bars, len(ohlc))
+            for column, name in enumerate(OHLC_COLUMNS):
+                values[column, row, bars - n:] = ohlc[name].to_numpy()[len(ohlc) - n:]
+        return cls(list(frames), *values)
+
+
+def panel_bars(params: TurtleParams) -> int:
+    """Candles per ticker the signals of the running candle depend on"""
+    return max(params.atr_period, params.entry_days + 1, params.exit_days + 1)
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    prev_close = np.full_like(close, np.nan)
+    prev_close[:, 1:] = close[:, :-1]
+    # fmax skips NaN, the first candle of a ticker has the high - low range
+    return np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+
+def _window_mean(values: np.ndarray) -> np.ndarray:
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=1)
+    total = np.where(valid, values, 0.0).sum(axis=1)
+    return np.divide(total, count, out=np.full(len(values), np.nan), where=count > 0)
+
+
+def _window_max(values: np.ndarray) -> np.ndarray:
+    # NaN is the identity of fmax, empty windows give NaN
+    return np.fmax.reduce(values, axis=1, initial=np.nan)
+
+
+def _window_min(values: np.ndarray) -> np.ndarray:
+    return np.fmin.reduce(values, axis=1, initial=np.nan)
+
+
+def scan_panel(panel: OhlcPanel, params: TurtleParams = None) -> pd.DataFrame:
+    """
+    ATR, Donchian channels and entry/exit flags of the running candle of every ticker,
+    the values TurtleIndicators.peek gives ticker by ticker. Indexed by ticker.
+    """
+    params = params or TurtleParams()
+    high, low, close = panel.H, panel.L, panel.C
+    last_high, last_low, last_close = high[:, -1], low[:, -1], close[:, -1]
+
+    atr = _window_mean(true_range(high, low, close)[:, -params.atr_period:])
+    # breakouts are checked against the channels of the committed candles
+    entry_high = _window_max(high[:, -params.entry_days - 1:-1])
+    entry_low = _window_min(low[:, -params.entry_days - 1:-1])
+    exit_high = _window_max(high[:, -params.exit_days - 1:-1])
+    exit_low = _window_min(low[:, -params.exit_days - 1:-1])
+
+    long_entry = last_high > entry_high
+    short_entry = last_low < entry_low
+    long_exit = last_low < exit_low
+    short_exit = last_high > exit_high
+
+    last_timestamp = panel.timeframe[:, -1]
+    return pd.DataFrame({
+        'datetime': pd.to_datetime(last_timestamp, unit='ms'),
+        'C': last_close,
+        'ATR': atr,
+        'atr_price': atr / last_close,
+        'd20_High': _window_max(high[:, -params.entry_days:]),
+        'd20_Low': _window_min(low[:, -params.entry_days:]),
+        'd10_High': _window_max(high[:, -params.exit_days:]),
+        'd10_Low': _window_min(low[:, -params.exit_days:]),
+        'Long_Entry': long_entry,
+        'Short_Entry': short_entry,
+        'Long_Exit': long_exit,
+        'Short_Exit': short_exit,
+        # same precedence and safety check as TurtleTrader.entry_action
+        'entry': np.where(long_entry & ~long_exit, 'long', np.where(short_entry & ~short_exit, 'short', None)),
+        # the running candle of a delisted or halted ticker is older than the others
+        'stale': ~(last_timestamp >= np.nanmax(last_timestamp, initial=-np.inf)),
+        # quote volume of the last closed candle
+        'quote_volume': close[:, -2] * panel.V[:, -2],
+    }, index=pd.Index(panel.tickers, name='ticker'))
+
+
+def opened_tickers(snapshot: CycleSnapshot, database=trader_database) -> Set[str]:
+    """Tickers with a position on the exchange or opened orders in DB (through the position store)"""
+    tickers = {symbol.split('/')[0] for symbol in snapshot.positions}
+    tickers.update(symbol.split('/')[0] for symbol in get_position_store(database).symbols())
+    return tickers
+
+
+class UniverseScanner:
+    """
+    Turtle signals of all linear perpetuals of the exchange computed at once.
+
+    Candles are taken from the cycle snapshot into one OhlcPanel and scanned in a single vectorized
+    pass instead of a pandas pipeline per ticker. Tickers with an entry signal and enough quote volume
+    are ranked by liquidity and calmness (low ATR/price), only the best ranked and the tickers with an
+    opened position go on to TurtleTrader, the rest would do nothing this cycle.
+    """
+
+    def __init__(self,
+                 exchange: ExchangeAdapter,
+                 params: TurtleParams = None,
+                 min_quote_volume: float = SCANNER_MIN_QUOTE_VOLUME,
+                 max_candidates: int = SCANNER_MAX_CANDIDATES):
+        self.exchange = exchange
+        self.params = params or TurtleParams()
+        self.min_quote_volume = min_quote_volume
+        self.max_candidates = max_candidates
+
+    def universe(self) -> List[str]:
+        """Tickers of the active perpetuals settled in the collateral"""
+        collateral = self.exchange._collateral
+        return sorted({market['base'] for market in self.exchange.markets.values()
+                       if market.get('swap')
+                       and market.get('linear')
+                       and market.get('settle') == collateral
+                       and market.get('active') is not False})
+
+    def scan(self, snapshot: CycleSnapshot, tickers: List[str]) -> pd.DataFrame:
+        """Signals of `tickers` with candles in the snapshot, best ranked first"""
+        start = time.perf_counter()
+        collateral = self.exchange._collateral
+        frames = {ticker: snapshot.ohlc[f"{ticker}/{collateral}"] for ticker in tickers
+                  if f"{ticker}/{collateral}" in snapshot.ohlc}
+        signals = scan_panel(OhlcPanel.from_frames(frames, panel_bars(self.params)), self.params)
+
+        # 24h quote volume of the exchange tickers where reported
+        reported = pd.Series({symbol.split('/')[0]: ticker.get('quoteVolume')
+                              for symbol, ticker in snapshot.tickers.items()}, dtype=float)
+        signals['quote_volume'] = reported.reindex(signals.index).fillna(signals['quote_volume'])
+        signals['score'] = (signals['quote_volume'].rank(pct=True).fillna(0)
+                            + signals['atr_price'].rank(pct=True, ascending=False).fillna(0))
+        signals = signals.sort_values('score', ascending=False)
+
+        _logger.info(f"Scanned {len(signals)} of {len(tickers)} tickers in {time.perf_counter() - start:.3f}s, "
+                     f"{signals['entry'].notna().sum()} entry signals")
+        return signals
+
+    def select(self, signals: pd.DataFrame, open_tickers: Iterable[str]) -> List[str]:
+        """Tickers to trade: opened positions first, then the best ranked entry candidates"""
+        candidates = signals[signals['entry'].notna()
+                             & ~signals['stale']
+                             & (signals['quote_volume'] >= self.min_quote_volume)]
+        candidates = list(candidates.index[:self.max_candidates])
+        open_tickers = sorted(set(open_tickers))
+        selected = open_tickers + [ticker for ticker in candidates if ticker not in open_tickers]
+        _logger.info(f"Trading {len(open_tickers)} opened positions and "
+                     f"{len(selected) - len(open_tickers)} entry candidates: {selected}")
+        return selected
@@ -0,0 +1,57 @@
+from typing import NamedTuple
+
+from marshmallow import ValidationError, fields
+from marshmallow.utils import missing
+
+from src.config import ORDER_LOAD_STRICT
+from src.model.turtle_model import Order
+from src.schemas.turtle_schema import OrderSchema
+
+
+class MappedField(NamedTuple):
+    attr: str
+    key: str
+    field: fields.Field
+
+
+# field table compiled once from OrderSchema, so the mapper keeps its keys and defaults
+ORDER_FIELDS = tuple(MappedField(name, field.data_key or name, field)
+                     for name, field in OrderSchema().load_fields.items())
+ORDER_KEYS = tuple((mapped.attr, mapped.key) for mapped in ORDER_FIELDS)
+ORDER_DEFAULTS = {mapped.attr: mapped.field.load_default for mapped in ORDER_FIELDS
+                  if mapped.field.load_default is not missing}
+
+
+def order_values(order: dict, strict: bool = ORDER_LOAD_STRICT) -> dict:
+    """
+    Order column values of a ccxt order dict, same keys and defaults as OrderSchema.load.
+
+    The default path only renames keys and fills defaults: values are taken as they are
+    (ccxt already normalizes unified fields), nested info, trades and fees are not copied.
+    `strict` deserializes every value with its OrderSchema field and raises the same ValidationError,
+    skipping only the schema machinery.
+    Backfills can pass the values straight to an insert(Order) without building ORM objects.
+    """
+    values = dict(ORDER_DEFAULTS)
+    if not strict:
+        for attr, key in ORDER_KEYS:
+            if key in order:
+                values[attr] = order[key]
+        return values
+
+    errors = {}
+    for attr, key, field in ORDER_FIELDS:
+        if key not in order:
+            continue
+        try:
+            values[attr] = field.deserialize(order[key], key, order)
+        except ValidationError as exc:
+            errors[key] = exc.messages
+    if errors:
+        raise ValidationError(errors)
+    return values
+
+
+def load_order(order: dict, strict: bool = ORDER_LOAD_STRICT) -> Order:
+    """Order built from a ccxt order dict, drop-in replacement of OrderSchema().load(order)"""
+    return Order(**order_values(order, strict))
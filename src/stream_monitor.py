@@ -0,0 +1,322 @@
+import asyncio
+import csv
+import logging
+import signal
+import time
+import traceback
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Dict, List, NamedTuple, Optional
+
+import ccxt
+import ccxt.pro as ccxt_pro
+
+from config import app_config, SLACK_URL, STREAM_WORKERS, STREAM_REFRESH_INTERVAL, METRICS_PORT
+from exchange_adapter import ExchangeAdapter
+from position_store import get_position_store
+from src.model import trader_database
+from src.utils import metrics
+from src.utils.notifier import QueuedNotifier
+from turtle_trader import TurtleTrader
+
+_logger = logging.getLogger(__name__)
+_notifier = QueuedNotifier(url=SLACK_URL, username='Position monitor')
+
+# traders evaluate daily candles, see TurtleTrader.get_curr_market_conditions
+CANDLE_MS = ccxt.Exchange.parse_timeframe('1d') * 1000
+
+
+class Tick(NamedTuple):
+    symbol: str
+    timestamp: int
+    price: float
+
+
+class TickerFeed(ABC):
+    """
+    Source of price updates for a changing set of symbols.
+
+    `next_ticks` waits for the next updates of any of the symbols,
+    it returns None when the feed is exhausted.
+    """
+
+    @abstractmethod
+    async def next_ticks(self, symbols: List[str]) -> Optional[List[Tick]]:
+        pass
+
+    async def close(self):
+        pass
+
+
+class CcxtProFeed(TickerFeed):
+    """Ticker updates from the exchange websocket (ccxt.pro watch_tickers), one connection for all symbols"""
+
+    def __init__(self, exchange_id: str = 'binance'):
+        self._exchange = getattr(ccxt_pro, exchange_id)(app_config.EXCHANGES[exchange_id])
+        if app_config.USE_SANDBOX:
+            self._exchange.set_sandbox_mode(True)
+
+    async def next_ticks(self, symbols: List[str]) -> Optional[List[Tick]]:
+        tickers = await self._exchange.watch_tickers(symbols)
+        now_ms = int(time.time() * 1000)
+        return [Tick(symbol, ticker['timestamp'] or now_ms, ticker['last'])
+                for symbol, ticker in tickers.items() if ticker.get('last') is not None]
+
+    async def close(self):
+        await self._exchange.close()
+
+
+class ReplayFeed(TickerFeed):
+    """
+    Recorded ticks (timestamp,symbol,price csv rows in time order) served like a live feed.
+
+    `speed` 1 replays in real time, 10 ten times faster, 0 as fast as possible.
+    """
+
+    def __init__(self, path: str, speed: float = 0, batch_size: int = 100):
+        self._file = open(path, newline='')
+        self._rows = csv.DictReader(self._file)
+        self.speed = speed
+        self.batch_size = batch_size
+        self._start = None
+
+    async def _wait_for(self, timestamp: int):
+        if not self.speed:
+            return
+        if self._start is None:
+            self._start = (timestamp, time.monotonic())
+        due = self._start[1] + (timestamp - self._start[0]) / 1000 / self.speed
+        await asyncio.sleep(max(0.0, due - time.monotonic()))
+
+    async def next_ticks(self, symbols: List[str]) -> Optional[List[Tick]]:
+        subscribed = set(symbols)
+        ticks = []
+        for row in self._rows:
+            tick = Tick(row['symbol'], int(row['timestamp']), float(row['price']))
+            if tick.symbol not in subscribed:
+                continue
+            await self._wait_for(tick.timestamp)
+            ticks.append(tick)
+            if len(ticks) >= self.batch_size:
+                break
+        return ticks or None
+
+    async def close(self):
+        self._file.close()
+
+
+@dataclass
+class PositionTriggers:
+    """Stop-loss and pyramid prices of one opened position, pyramid_price is None over the pyramiding limit"""
+    is_long: bool
+    stop_price: float
+    pyramid_price: Optional[float]
+
+    @classmethod
+    def from_trader(cls, trader: TurtleTrader):
+        return cls(
+            is_long=trader.last_opened_position.is_long(),
+            stop_price=trader.last_opened_position.stop_loss_price,
+            pyramid_price=None if trader.pyramid_stop else trader.pyramid_price()
+        )
+
+    def action(self, price: float) -> Optional[str]:
+        # same priority as TurtleTrader.opened_position_action
+        if self.is_long:
+            if self.pyramid_price is not None and price >= self.pyramid_price:
+                return 'long'
+            if price <= self.stop_price:
+                return 'close'
+        else:
+            if self.pyramid_price is not None and price <= self.pyramid_price:
+                return 'short'
+            if price >= self.stop_price:
+                return 'close'
+        return None
+
+
+def opened_symbols(database=trader_database) -> List[str]:
+    """Symbols with opened positions, the position store the traders read is reloaded from DB"""
+    store = get_position_store(database)
+    store.load()
+    return store.symbols()
+
+
+class PositionMonitor:
+    """
+    Checks stop-loss and pyramid prices of all opened positions on every tick.
+
+    Trigger prices are kept per symbol, so a tick costs one dict lookup and two comparisons.
+    A triggered action runs on a thread pool through the symbol's TurtleTrader
+    (exit_position / entry_position at the tick price) while the feed keeps being consumed,
+    ticks of a symbol with an order in flight are skipped. Opened positions are reloaded
+    from DB every `refresh_interval` seconds: triggers of watched symbols are recomputed
+    (the daily run may have closed, pyramided or reversed them), symbols without an opened
+    position are unwatched and traders of newly opened symbols are loaded. Market conditions
+    (ATR sizing pyramids and stop-losses) of watched traders are reloaded once a new daily candle opened.
+    """
+
+    def __init__(self,
+                 feed: TickerFeed,
+                 exchange_id: str = 'binance',
+                 workers: int = STREAM_WORKERS,
+                 refresh_interval: float = STREAM_REFRESH_INTERVAL):
+        self.feed = feed
+        self._exchange_id = exchange_id
+        self.workers = workers
+        self.refresh_interval = refresh_interval
+
+        self.exchange = ExchangeAdapter(exchange_id)
+        self.exchange.load_exchange()
+        self.traders: Dict[str, TurtleTrader] = {}
+        self.triggers: Dict[str, PositionTriggers] = {}
+        self._busy = set()
+        self._stop = None
+
+    def load_trader(self, symbol: str) -> Optional[TurtleTrader]:
+        exchange = ExchangeAdapter(self._exchange_id)
+        exchange.share_markets(self.exchange)
+        exchange.market = exchange.markets[symbol]['base']
+        trader = TurtleTrader(exchange)
+        return trader if trader.last_opened_position else None
+
+    async def refresh(self, loop, executor):
+        """Reload opened positions of all symbols, symbols with an order in flight are re-watched when it is done"""
+        symbols = set(await loop.run_in_executor(executor, opened_symbols))
+        for symbol in list(self.traders):
+            if symbol in self._busy:
+                continue
+            if symbol not in symbols:
+                _logger.info(f"{symbol} has no opened position, unwatching")
+                self.unwatch(symbol)
+                continue
+            # positions come from the store reloaded above
+            trader = self.traders[symbol]
+            trader.get_opened_positions()
+            self.watch(symbol, trader)
+
+        running_candle_ts = int(time.time() * 1000) // CANDLE_MS * CANDLE_MS
+        outdated = [symbol for symbol, trader in self.traders.items()
+                    if symbol not in self._busy and trader.curr_market_conditions.timeframe < running_candle_ts]
+        await asyncio.gather(*(loop.run_in_executor(executor, self._reload_market_conditions, symbol)
+                               for symbol in outdated))
+
+        new_symbols = [symbol for symbol in symbols if symbol not in self.traders and symbol not in self._busy]
+        traders = await asyncio.gather(*(loop.run_in_executor(executor, self._safe_load_trader, symbol)
+                                         for symbol in new_symbols))
+        for symbol, trader in zip(new_symbols, traders):
+            if symbol not in self._busy:
+                self.watch(symbol, trader)
+
+    def _reload_market_conditions(self, symbol: str):
+        """Indicators of the current daily candle, the previous ones are kept when the reload fails"""
+        try:
+            self.traders[symbol].get_curr_market_conditions()
+        except Exception as e:
+            _logger.error(f"Cannot reload {symbol} market conditions, keeping the previous ones: {e}")
+
+    def _safe_load_trader(self, symbol: str) -> Optional[TurtleTrader]:
+        try:
+            return self.load_trader(symbol)
+        except Exception as e:
+            _logger.error(f"Cannot load {symbol} position: {e}")
+            return None
+
+    def watch(self, symbol: str, trader: Optional[TurtleTrader]):
+        if trader is None or trader.last_opened_position is None:
+            self.unwatch(symbol)
+            return
+        self.traders[symbol] = trader
+        self.triggers[symbol] = PositionTriggers.from_trader(trader)
+        _logger.info(f"Watching {symbol}: {self.triggers[symbol]}")
+
+    def unwatch(self, symbol: str):
+        self.traders.pop(symbol, None)
+        self.triggers.pop(symbol, None)
+
+    def on_tick(self, tick: Tick) -> Optional[str]:
+        triggers = self.triggers.get(tick.symbol)
+        if triggers is None or tick.symbol in self._busy:
+            return None
+        return triggers.action(tick.price)
+
+    def execute(self, symbol: str, action: str, tick: Tick) -> Optional[TurtleTrader]:
+        """Run the triggered action, returns the trader if the position is still open"""
+        trader = self.traders[symbol]
+        n_before = trader.n_of_opened_positions
+        try:
+            _logger.info(f"{symbol} {action} triggered at {tick.price}, "
+                         f"{(time.time() * 1000 - tick.timestamp) / 1000:.3f}s after tick")
+            trader.curr_market_conditions = replace(trader.curr_market_conditions, C=tick.price)
+            with metrics.tagged(exchange=self._exchange_id, ticker=symbol.split('/')[0]), metrics.span(f"stream.{action}"):
+                trader.execute_action(action)
+                trader.get_opened_positions()
+        except Exception as e:
+            msg = f"Stream trading error - {symbol}: {e}\n{traceback.format_exc()}"
+            _logger.error(msg)
+            _notifier.error(msg)
+            return None
+
+        if trader.n_of_opened_positions == n_before:
+            # no order went through, stop watching until the next positions refresh
+            _logger.warning(f"{symbol} {action} did not change positions, unwatching until refresh")
+            return None
+        return trader
+
+    def stop(self):
+        _logger.info("Stopping position monitor")
+        if self._stop:
+            self._stop.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop)
+        if metrics.registry.enabled and METRICS_PORT:
+            metrics.serve(METRICS_PORT)
+
+        pending = set()
+        last_refresh = None
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='monitor') as executor:
+                while not self._stop.is_set():
+                    if last_refresh is None or time.monotonic() - last_refresh > self.refresh_interval:
+                        await self.refresh(loop, executor)
+                        last_refresh = time.monotonic()
+                        _logger.info(f"Monitoring {len(self.triggers)} opened positions")
+
+                    if not self.triggers:
+                        try:
+                            await asyncio.wait_for(self._stop.wait(), timeout=self.refresh_interval)
+                        except asyncio.TimeoutError:
+                            pass
+                        continue
+
+                    ticks = await self.feed.next_ticks(list(self.triggers))
+                    if ticks is None:
+                        break
+
+                    for tick in ticks:
+                        action = self.on_tick(tick)
+                        if action:
+                            pending.add(self._submit(loop, executor, tick.symbol, action, tick))
+
+                    pending = {task for task in pending if not task.done()}
+
+                if pending:
+                    await asyncio.gather(*pending)
+        finally:
+            await self.feed.close()
+
+    def _submit(self, loop, executor, symbol: str, action: str, tick: Tick) -> asyncio.Future:
+        self._busy.add(symbol)
+        future = loop.run_in_executor(executor, self.execute, symbol, action, tick)
+
+        def done(result):
+            self._busy.discard(symbol)
+            self.watch(symbol, None if result.cancelled() else result.result())
+
+        future.add_done_callback(done)
+        return future
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List
+
+
+from async_exchange_adapter import AsyncExchangeAdapter, create_async_exchange
+from async_turtle_trader import AsyncTurtleTrader
+from config import SLACK_URL, TRADE_CONCURRENCY, CYCLE_PREFETCH_ENABLED, RETRY_CYCLE_BUDGET
+from cycle_snapshot import SnapshotPrefetcher
+from exchange_adapter import ExchangeAdapter
+from position_store import get_position_store
+from scanner import UniverseScanner, opened_tickers
+from src.utils import metrics
+from src.utils.notifier import QueuedNotifier
+from src.utils.retry_policy import retry_deadline
+from turtle_trader import TurtleTrader
+
+_logger = logging.getLogger(__name__)
+_notifier = QueuedNotifier(url=SLACK_URL, username='Trading cycle')
+
+
+def load_opened_positions(deadline: float = None):
+    """Opened positions of all tickers in one query at cycle start, traders read them from the store"""
+    try:
+        with retry_deadline(deadline):
+            get_position_store().load()
+    except Exception as e:
+        _logger.warning(f"Cannot load opened positions, traders load them on first use: {e}")
+
+
+@dataclass
+class TickerSessionResult:
+    ticker: str
+    elapsed: float
+    error: str = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class TradingCycle:
+    """Runs one trading session per ticker, sequentially or on a pool of workers.
+
+    Every worker thread gets its own ExchangeAdapter (the adapter keeps per-market state),
+    markets are loaded only once and shared with the worker adapters.
+    Tickers, positions and candles of all tickers are prefetched into a snapshot the adapters read.
+    With `scan` the tickers are scanned at once (see UniverseScanner) and only the ones with
+    an opened position or a ranked entry signal are traded.
+    Entries of concurrent tickers run one at a time (see get_entry_lock), each is sized from the
+    balance fetched after the previous order.
+    A failing ticker is logged and reported, the rest of the tickers keep trading.
+    Retries of the whole cycle stop after RETRY_CYCLE_BUDGET seconds.
+    """
+
+    def __init__(self,
+                 exchange_id: str = 'binance',
+                 concurrency: int = TRADE_CONCURRENCY,
+                 prefetch: bool = CYCLE_PREFETCH_ENABLED,
+                 scan: bool = False):
+        self._exchange_id = exchange_id
+        self._concurrency = max(1, concurrency)
+        self._local = threading.local()
+        # the scan reads candles from the snapshot
+        self._prefetch = prefetch or scan
+        self._scan = scan
+        self._snapshot = None
+        self._deadline = None
+
+        self.exchange = ExchangeAdapter(exchange_id)
+        self.exchange.load_exchange()
+
+    def _worker_exchange(self) -> ExchangeAdapter:
+        if self._concurrency == 1:
+            return self.exchange
+
+        exchange = getattr(self._local, 'exchange', None)
+        if exchange is None:
+            _logger.info(f"Creating exchange adapter for worker {threading.current_thread().name}")
+            exchange = ExchangeAdapter(self._exchange_id)
+            exchange.share_markets(self.exchange)
+            self._local.exchange = exchange
+        return exchange
+
+    def trade_ticker(self, ticker: str) -> TickerSessionResult:
+        start = time.perf_counter()
+        try:
+            _logger.info(f"\n\n----------- Starting trade - {ticker} -----------")
+            # the deadline context is set per ticker, worker threads do not inherit it
+            with metrics.tagged(exchange=self._exchange_id, ticker=ticker), metrics.span('session'), \
+                    retry_deadline(self._deadline):
+                exchange = self._worker_exchange()
+                exchange.market = f"{ticker}"
+                exchange.snapshot = self._snapshot
+                trader = TurtleTrader(exchange)
+                _logger.debug(f"Market info before trading: {exchange.market_info}")
+                trader.trade()
+            return TickerSessionResult(ticker, time.perf_counter() - start)
+
+        except Exception as e:
+            msg = f"Trading error - {ticker}: {e}\n{traceback.format_exc()}"
+            _logger.error(msg)
+            _notifier.error(msg)
+            return TickerSessionResult(ticker, time.perf_counter() - start, error=str(e))
+
+    def run(self, tickers: List[str]) -> List[TickerSessionResult]:
+        _logger.info(f"Trading {len(tickers)} tickers, concurrency: {self._concurrency}")
+        self._deadline = time.monotonic() + RETRY_CYCLE_BUDGET
+        load_opened_positions(self._deadline)
+        if self._prefetch:
+            with metrics.span('prefetch'), retry_deadline(self._deadline):
+                self._snapshot = SnapshotPrefetcher(self.exchange, self._concurrency).prefetch(
+                    tickers, since=TurtleTrader.ohlc_since_timestamp())
+        if self._scan:
+            with metrics.span('scan'):
+                scanner = UniverseScanner(self.exchange)
+                tickers = scanner.select(scanner.scan(self._snapshot, tickers), opened_tickers(self._snapshot))
+        if self._concurrency == 1:
+            return [self.trade_ticker(ticker) for ticker in tickers]
+
+        with ThreadPoolExecutor(max_workers=self._concurrency,
+                                thread_name_prefix='trader') as executor:
+            return list(executor.map(self.trade_ticker, tickers))
+
+
+class AsyncTradingCycle:
+    """Runs all ticker sessions from one event loop.
+
+    All adapters share a single async ccxt exchange object (one connection pool),
+    `concurrency` limits the number of tickers being traded at the same time, their entries
+    run one at a time so that each is sized from the balance left by the previous one.
+    Retries of the whole cycle stop after RETRY_CYCLE_BUDGET seconds.
+    """
+
+    def __init__(self, exchange_id: str = 'binance', concurrency: int = TRADE_CONCURRENCY):
+        self._exchange_id = exchange_id
+        self._concurrency = max(1, concurrency)
+
+    async def trade_ticker(self,
+                           exchange,
+                           ticker: str,
+                           semaphore: asyncio.Semaphore,
+                           entry_lock: asyncio.Lock) -> TickerSessionResult:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                _logger.info(f"\n\n----------- Starting trade - {ticker} -----------")
+                with metrics.tagged(exchange=self._exchange_id, ticker=ticker), metrics.span('session'):
+                    adapter = AsyncExchangeAdapter(self._exchange_id, market=ticker, exchange=exchange)
+                    await adapter.load_exchange(force_refresh=False)
+                    trader = AsyncTurtleTrader(adapter, entry_lock=entry_lock)
+                    await trader.load_state()
+                    await trader.trade()
+                return TickerSessionResult(ticker, time.perf_counter() - start)
+
+            except Exception as e:
+                msg = f"Trading error - {ticker}: {e}\n{traceback.format_exc()}"
+                _logger.error(msg)
+                _notifier.error(msg)
+                return TickerSessionResult(ticker, time.perf_counter() - start, error=str(e))
+
+    async def run_async(self, tickers: List[str]) -> List[TickerSessionResult]:
+        _logger.info(f"Trading {len(tickers)} tickers from event loop, concurrency: {self._concurrency}")
+        exchange = create_async_exchange(self._exchange_id)
+        await asyncio.to_thread(load_opened_positions, time.monotonic() + RETRY_CYCLE_BUDGET)
+        try:
+            await exchange.load_markets(True)
+            semaphore = asyncio.Semaphore(self._concurrency)
+            entry_lock = asyncio.Lock()
+            # ticker tasks copy the context with the deadline when gathered
+            with retry_deadline(time.monotonic() + RETRY_CYCLE_BUDGET):
+                return await asyncio.gather(
+                    *(self.trade_ticker(exchange, ticker, semaphore, entry_lock) for ticker in tickers)
+                )
+        finally:
+            await exchange.close()
+
+    def run(self, tickers: List[str]) -> List[TickerSessionResult]:
+        return asyncio.run(self.run_async(tickers))
+
+
+def log_session_summary(results: List[TickerSessionResult]):
+    lines = [f"{r.ticker:<10} {r.elapsed:8.2f}s  {'OK' if r.ok else 'FAILED: ' + r.error}"
+             for r in sorted(results, key=lambda r: r.elapsed, reverse=True)]
+    _logger.info("\n============== TRADE SESSION SUMMARY ==============\n" + "\n".join(lines))
@@ -0,0 +1,198 @@
+from collections import deque
+
+import pandas as pd
+
+from config import ATR_PERIOD, TURTLE_ENTRY_DAYS, TURTLE_EXIT_DAYS
+from ohlc_cache import OHLC_COLUMNS
+
+
+class RollingExtreme:
+    """Rolling max (or min) over the last `window` values using a monotonic deque, O(1) amortized per value"""
+
+    def __init__(self, window: int, is_max: bool = True):
+        self.window = window
+        self.is_max = is_max
+        self.index = -1
+        self._deque = deque()  # (index, value), values monotonic from the front
+
+    def _dominates(self, a, b):
+        return a >= b if self.is_max else a <= b
+
+    def push(self, value):
+        self.index += 1
+        while self._deque and self._dominates(value, self._deque[-1][1]):
+            self._deque.pop()
+        self._deque.append((self.index, value))
+        if self._deque[0][0] <= self.index - self.window:
+            self._deque.popleft()
+
+    @property
+    def value(self):
+        return self._deque[0][1] if self._deque else None
+
+    def value_with(self, value):
+        """Extreme of the window if `value` was pushed, the state is not changed"""
+        oldest_kept = self.index - self.window + 2
+        for idx, candidate in self._deque:
+            if idx >= oldest_kept:
+                return candidate if self._dominates(candidate, value) else value
+        return value
+
+    def to_dict(self):
+        return {'index': self.index, 'deque': list(self._deque)}
+
+    def load(self, state):
+        self.index = state['index']
+        self._deque = deque(tuple(item) for item in state['deque'])
+
+
+class RollingMean:
+    """Rolling mean over the last `window` values with min_periods=1, O(1) per value"""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._values = deque()
+        self._sum = 0.0
+        self._pushed = 0
+
+    def push(self, value):
+        self._values.append(value)
+        self._sum += value
+        if len(self._values) > self.window:
+            self._sum -= self._values.popleft()
+        self._pushed += 1
+        # re-sum once per window to keep the floating point drift of the running sum bounded
+        if self._pushed % self.window == 0:
+            self._sum = sum(self._values)
+
+    @property
+    def value(self):
+        return self._sum / len(self._values) if self._values else None
+
+    def value_with(self, value):
+        """Mean of the window if `value` was pushed, the state is not changed"""
+        total, count = self._sum + value, len(self._values) + 1
+        if count > self.window:
+            total -= self._values[0]
+            count -= 1
+        return total / count
+
+    def to_dict(self):
+        return {'values': list(self._values), 'sum': self._sum, 'pushed': self._pushed}
+
+    def load(self, state):
+        self._values = deque(state['values'])
+        self._sum = state['sum']
+        self._pushed = state['pushed']
+
+
+class TurtleIndicators:
+    """
+    Streaming ATR and Donchian channels for the turtle strategy.
+
+    `update` commits one closed candle in constant time, `peek` evaluates the running
+    candle without committing it. Both return the fields of CurrMarketConditions with
+    the same values the pandas reference (benchmarks/reference_indicators.py) gives for the last row.
+    A candle is a (timeframe, O, H, L, C, V) sequence.
+    """
+
+    def __init__(self,
+                 atr_period: int = ATR_PERIOD,
+                 entry_days: int = TURTLE_ENTRY_DAYS,
+                 exit_days: int = TURTLE_EXIT_DAYS):
+        self.atr_period = atr_period
+        self.entry_days = entry_days
+        self.exit_days = exit_days
+
+        self._atr = RollingMean(atr_period)
+        self._entry_high = RollingExtreme(entry_days, is_max=True)
+        self._entry_low = RollingExtreme(entry_days, is_max=False)
+        self._exit_high = RollingExtreme(exit_days, is_max=True)
+        self._exit_low = RollingExtreme(exit_days, is_max=False)
+        self.last_timestamp = None
+        self._prev_close = None
+
+    @classmethod
+    def from_ohlc(cls, ohlc: pd.DataFrame, **kwargs):
+        """Indicators with all candles of the ohlc DataFrame committed"""
+        indicators = cls(**kwargs)
+        for candle in ohlc[OHLC_COLUMNS].itertuples(index=False, name=None):
+            indicators.update(candle)
+        return indicators
+
+    def _true_range(self, high, low):
+        if self._prev_close is None:
+            return high - low
+        return max(high - low, abs(high - self._prev_close), abs(low - self._prev_close))
+
+    def _conditions(self, candle, atr, d20_high, d20_low, d10_high, d10_low):
+        timeframe, o, h, l, c, v = candle
+        has_prev = self._prev_close is not None
+        return {
+            'timeframe': timeframe,
+            'O': o,
+            'H': h,
+            'L': l,
+            'C': c,
+            'V': v,
+            'datetime': pd.Timestamp(timeframe, unit='ms'),
+            'ATR': atr,
+            'd20_High': d20_high,
+            'd20_Low': d20_low,
+            'd10_High': d10_high,
+            'd10_Low': d10_low,
+            'Long_Entry': has_prev and h > self._entry_high.value,
+            'Short_Entry': has_prev and l < self._entry_low.value,
+            'Long_Exit': has_prev and l < self._exit_low.value,
+            'Short_Exit': has_prev and h > self._exit_high.value,
+        }
+
+    def peek(self, candle) -> dict:
+        _, _, high, low, _, _ = candle
+        return self._conditions(
+            candle,
+            atr=self._atr.value_with(self._true_range(high, low)),
+            d20_high=self._entry_high.value_with(high),
+            d20_low=self._entry_low.value_with(low),
+            d10_high=self._exit_high.value_with(high),
+            d10_low=self._exit_low.value_with(low),
+        )
+
+    def update(self, candle) -> dict:
+        conditions = self.peek(candle)
+        timeframe, _, high, low, close, _ = candle
+
+        self._atr.push(self._true_range(high, low))
+        self._entry_high.push(high)
+        self._entry_low.push(low)
+        self._exit_high.push(high)
+        self._exit_low.push(low)
+        self._prev_close = close
+        self.last_timestamp = timeframe
+        return conditions
+
+    def to_dict(self) -> dict:
+        return {
+            'atr_period': self.atr_period,
+            'entry_days': self.entry_days,
+            'exit_days': self.exit_days,
+            'last_timestamp': self.last_timestamp,
+            'prev_close': self._prev_close,
+            'atr': self._atr.to_dict(),
+            'entry_high': self._entry_high.to_dict(),
+            'entry_low': self._entry_low.to_dict(),
+            'exit_high': self._exit_high.to_dict(),
+            'exit_low': self._exit_low.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict):
+        indicators = cls(state['atr_period'], state['entry_days'], state['exit_days'])
+        indicators.last_timestamp = state['last_timestamp']
+        indicators._prev_close = state['prev_close']
+        indicators._atr.load(state['atr'])
+        indicators._entry_high.load(state['entry_high'])
+        indicators._entry_low.load(state['entry_low'])
+        indicators._exit_high.load(state['exit_high'])
+        indicators._exit_low.load(state['exit_low'])
+        return indicators
@@ -1,14 +1,11 @@
 import logging
+import threading
 import uuid
 from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Tuple
 
 import pandas as pd
-import pandas.io.sql as sqlio
-from database_tools.adapters.postgresql import PostgresqlAdapter
-from retrying import retry
-from slack_bot.notifications import SlackNotifier
-from sqlalchemy import func
 from sqlalchemy.exc import OperationalError, TimeoutError
 
 from config import (TRADE_RISK_ALLOCATION,
@@ -22,13 +19,22 @@ from config import (TRADE_RISK_ALLOCATION,
                     AGGRESSIVE_PYRAMID_ATR_PRICE_RATIO_LIMIT,
                     SLACK_URL)
 from exchange_adapter import ExchangeAdapter
-from src.model import trader_database
+from ohlc_cache import OHLC_COLUMNS
+from position_store import LastOpenedPosition, get_position_store
+from src.model import trader_database, pl_summary
+from src.model.database import PooledDatabase
 from src.model.turtle_model import Order
+from src.schemas.order_mapper import load_order
 from src.schemas.turtle_schema import OrderSchema
-from src.utils.utils import save_json_to_file, get_adjusted_amount
+from src.utils.metrics import span
+from src.utils.notifier import QueuedNotifier
+from src.utils.order_journal import get_order_journal
+from src.utils.retry_policy import RetryPolicy
+from src.utils.utils import get_adjusted_amount
+from turtle_indicators import TurtleIndicators
 
 _logger = logging.getLogger(__name__)
-_notifier = SlackNotifier(SLACK_URL, __name__, __name__)
+_notifier = QueuedNotifier(SLACK_URL, __name__, __name__)
 
 
 class AssetAllocationOverRiskLimit(Exception):
@@ -44,31 +50,32 @@ def retry_if_sqlalchemy_transient_error(exception):
     return isinstance(exception, (OperationalError, TimeoutError))
 
 
-@dataclass
-class LastOpenedPosition:
-    id: str
-    agg_trade_id: str
-    action: str
-    price: float
-    cost: float
-    stop_loss_price: float
-    atr: float
-    free_balance: float
-    pl: float
-
-    def is_long(self):
-        return self.action == 'long'
-
-    def get_atr_price_ratio(self):
-        return self.atr / self.price
-
-    def get_atr_for_pyramid(self):
-        # lower atr for entry to half for pyramid trade
-        # if atr/price ration is lower than 2% (less volatile market)
-        atr_ratio = self.get_atr_price_ratio()
-        if atr_ratio < AGGRESSIVE_PYRAMID_ATR_PRICE_RATIO_LIMIT:
-            return self.atr * 0.5
-        return self.atr
+DB_POLICY = RetryPolicy(retry_on=retry_if_sqlalchemy_transient_error, base_delay=2)
+
+_entry_locks = {}
+_entry_locks_lock = threading.Lock()
+
+
+def get_entry_lock(exchange_id: str) -> threading.Lock:
+    """
+    Entries on one exchange account run one at a time. Concurrent tickers share the free balance,
+    an entry sizes its position from the balance fetched after the previous entry's order.
+    """
+    with _entry_locks_lock:
+        if exchange_id not in _entry_locks:
+            _entry_locks[exchange_id] = threading.Lock()
+        return _entry_locks[exchange_id]
+
+
+@dataclass(frozen=True)
+class TurtleParams:
+    """Strategy knobs, defaults are read from config (environment)"""
+    atr_period: int = ATR_PERIOD
+    entry_days: int = TURTLE_ENTRY_DAYS
+    exit_days: int = TURTLE_EXIT_DAYS
+    stop_loss_atr_multipl: float = STOP_LOSS_ATR_MULTIPL
+    pyramiding_limit: int = PYRAMIDING_LIMIT
+    aggressive_pyramid_atr_price_ratio_limit: float = AGGRESSIVE_PYRAMID_ATR_PRICE_RATIO_LIMIT
 
 
 @dataclass
@@ -97,85 +104,26 @@ class CurrMarketConditions:
                      f'SHORT EXIT cond: {self.Short_Exit}')
 
 
-def calculate_atr(df, period=ATR_PERIOD):
-    """
-    Calculate the Average True Range (ATR) for given OHLCV DataFrame.
-
-    Parameters:
-    - df: pandas DataFrame with columns 'H', 'L', and 'C'.
-    - period: the period over which to calculate the ATR.
-
-    Returns:
-    - A pandas Series representing the ATR.
-    """
-    # Calculate true ranges
-    df['High-Low'] = df['H'] - df['L']
-    df['High-PrevClose'] = abs(df['H'] - df['C'].shift(1))
-    df['Low-PrevClose'] = abs(df['L'] - df['C'].shift(1))
-
-    # Find the max of the true ranges
-    df['TrueRange'] = df[['High-Low', 'High-PrevClose', 'Low-PrevClose']].max(axis=1)
-
-    # Calculate the ATR
-    df['ATR'] = df['TrueRange'].rolling(window=period, min_periods=1).mean()
-
-    # Clean up the DataFrame by removing the intermediate columns
-    df.drop(['High-Low', 'High-PrevClose', 'Low-PrevClose', 'TrueRange'], axis=1, inplace=True)
-
-    return df
-
-
-def turtle_trading_signals_adjusted(df):
-    """
-    Identify Turtle Trading entry and exit signals for both long and short positions, adjusting for early rows.
-
-    Parameters:
-    - df: pandas DataFrame with at least 'High' and 'Low' columns.
-
-    Adds columns to df:
-    - 'd20_High': Highest high over the previous 20 days, adjusting for early rows.
-    - 'd20_Low': Lowest low over the previous 20 days, adjusting for early rows.
-    - 'd10_High': Highest high over the previous 10 days, adjusting for early rows.
-    - 'd10_Low': Lowest low over the previous 10 days, adjusting for early rows.
-    - 'Long_Entry': Signal for entering a long position.
-    - 'Long_Exit': Signal for exiting a long position.
-    - 'Short_Entry': Signal for entering a short position.
-    - 'Short_Exit': Signal for exiting a short position.
-    """
-    df['datetime'] = pd.to_datetime(df['timeframe'], unit='ms')
-    # Calculate rolling max/min for the required windows with min_periods=1
-    df['d20_High'] = df['H'].rolling(window=TURTLE_ENTRY_DAYS, min_periods=1).max()
-    df['d20_Low'] = df['L'].rolling(window=TURTLE_ENTRY_DAYS, min_periods=1).min()
-    df['d10_High'] = df['H'].rolling(window=TURTLE_EXIT_DAYS, min_periods=1).max()
-    df['d10_Low'] = df['L'].rolling(window=TURTLE_EXIT_DAYS, min_periods=1).min()
-
-    # Entry signals
-    df['Long_Entry'] = df['H'] > df['d20_High'].shift(1)
-    df['Short_Entry'] = df['L'] < df['d20_Low'].shift(1)
-
-    # Exit signals
-    df['Long_Exit'] = df['L'] < df['d10_Low'].shift(1)
-    df['Short_Exit'] = df['H'] > df['d10_High'].shift(1)
-
-    return df
-
-
 class TurtleTrader:
 
     def __init__(self,
                  exchange: ExchangeAdapter,
-                 db: PostgresqlAdapter = None,
-                 testing_file_path: bool = False
+                 db: PooledDatabase = None,
+                 testing_file_path: bool = False,
+                 load_state: bool = True,
+                 params: TurtleParams = None
                  ):
         self._exchange = exchange
         self._database = trader_database if not db else db
+        self.params = params if params else TurtleParams()
 
         self.opened_positions = None
         self.last_opened_position: LastOpenedPosition = None
         self.curr_market_conditions: CurrMarketConditions = None
 
-        self.get_opened_positions()
-        self.get_curr_market_conditions(testing_file_path)
+        if load_state:
+            self.get_opened_positions()
+            self.get_curr_market_conditions(testing_file_path)
 
     @property
     def n_of_opened_positions(self):
@@ -184,107 +132,88 @@ class TurtleTrader:
     @property
     def opened_positions_ids(self):
         if self.opened_positions is not None:
-            return self.opened_positions['id'].to_list()
+            return [position.id for position in self.opened_positions]
         return None
 
-    @retry(retry_on_exception=retry_if_sqlalchemy_transient_error,
-           stop_max_attempt_number=5,
-           wait_exponential_multiplier=2000)
     def get_opened_positions(self):
+        """Opened positions of the market from the process wide store (one query for all symbols)"""
         _logger.info('Getting opened positions')
-        with self._database.get_session() as session:
-            df = sqlio.read_sql(
-                session.query(
-                    Order.id,
-                    Order.agg_trade_id,
-                    Order.action,
-                    Order.price,
-                    Order.cost,
-                    Order.stop_loss_price,
-                    Order.atr,
-                    Order.free_balance,
-                    Order.pl
-                ).filter(
-                    Order.position_status == 'opened',
-                    Order.symbol == self._exchange.market_futures
-                ).order_by(
-                    Order.timestamp
-                ).statement,
-                session.bind
-            )
+        self.set_opened_positions(get_position_store(self._database).opened(self._exchange.market_futures))
 
-        if df.empty:
+    def set_opened_positions(self, positions: Tuple[LastOpenedPosition, ...]):
+        if not positions:
             _logger.info('No opened positions')
             self.opened_positions = None
             self.last_opened_position = None
         else:
             _logger.info(f'There are opened positions')
-            self.opened_positions = df
-            last_opened_position = df.iloc[-1].to_dict()
-            self.last_opened_position = LastOpenedPosition(**last_opened_position)
+            self.opened_positions = tuple(positions)
+            self.last_opened_position = positions[-1]
 
-    @retry(retry_on_exception=retry_if_sqlalchemy_transient_error,
-           stop_max_attempt_number=5,
-           wait_exponential_multiplier=2000)
+    @DB_POLICY.retry('db.get_pl')
     def get_pl(self):
         _logger.info('Getting positions summary')
         with self._database.get_session() as session:
-            # Query for the sum of P&L for opened positions with the specific symbol
-            asset_pl = session.query(
-                func.sum(Order.pl).label('filtered_total_pl')
-            ).filter(
-                Order.symbol == self._exchange.market_futures
-            ).scalar()
-
-            # Query for the sum of P&L for all positions
-            total_pl = session.query(
-                func.sum(Order.pl).label('total_pl')
-            ).scalar()
-
-            # If there are no records matching the filters, set the values to 0.0
-            asset_pl = 0.0 if asset_pl is None else float(asset_pl)
-            total_pl = 0.0 if total_pl is None else float(total_pl)
-
-        return asset_pl, total_pl
+            return pl_summary.query_pl(session, self._exchange.market_futures)
 
     def log_total_pl(self):
         asset_pl, total_pl = self.get_pl()
+        self.report_pl(asset_pl, total_pl)
+
+    def report_pl(self, asset_pl, total_pl):
+        total_balance = self._exchange.total_balance
+        if self._exchange.balance_stale:
+            total_balance = f'{total_balance} (stale, refresh failed)'
         _logger.info(f'\n==={self._exchange.market}===\n'
                      f'P/L = {asset_pl}\n'
                      f'Total P/L = {total_pl}\n'
-                     f'Total balance: {self._exchange.total_balance}')
+                     f'Total balance: {total_balance}')
         _notifier.info(f'\n==={self._exchange.market}===\n'
                        f'P/L = {asset_pl}\n'
                        f'Total P/L = {total_pl}\n'
-                       f'Total balance: {self._exchange.total_balance}')
+                       f'Total balance: {total_balance}')
+
+    @property
+    def opened_positions_cost(self):
+        return sum(position.cost for position in self.opened_positions)
 
     def calculate_pl(self, close_order: OrderSchema):
         if self.last_opened_position.is_long():
-            total_cost = self.opened_positions.cost.sum()
+            total_cost = self.opened_positions_cost
             total_revenue = close_order.cost
         else:
             total_cost = close_order.cost
-            total_revenue = self.opened_positions.cost.sum()
+            total_revenue = self.opened_positions_cost
 
         pl = total_revenue - total_cost
         pl_percent = (pl / total_cost) * 100
 
         return round(pl, 2), round(pl_percent, 2)
 
-    def get_curr_market_conditions(self, testing_file_path: str = None):
+    @staticmethod
+    def ohlc_since_timestamp():
         n_days_ago = datetime.now() - timedelta(days=OHLC_HISTORY_W_BUFFER_DAYS)
-        since_timestamp_ms = int(n_days_ago.timestamp() * 1000)
+        return int(n_days_ago.timestamp() * 1000)
 
+    def get_curr_market_conditions(self, testing_file_path: str = None):
         if testing_file_path:
             ohlc = pd.read_csv(testing_file_path)
         else:
-            ohlc = self._exchange.fetch_ohlc(since=since_timestamp_ms)
+            ohlc = self._exchange.fetch_ohlc(since=self.ohlc_since_timestamp())
 
-        ohlc = calculate_atr(ohlc, period=ATR_PERIOD)
-        ohlc = turtle_trading_signals_adjusted(ohlc)
+        self.set_curr_market_conditions(ohlc)
 
-        curr_market_con = ohlc.iloc[-1].to_dict()
-        self.curr_market_conditions = CurrMarketConditions(**curr_market_con)
+    def set_curr_market_conditions(self, ohlc: pd.DataFrame):
+        # all candles but the last one are committed, the last (running) candle is evaluated
+        with span('indicators'):
+            indicators = TurtleIndicators.from_ohlc(ohlc.iloc[:-1],
+                                                    atr_period=self.params.atr_period,
+                                                    entry_days=self.params.entry_days,
+                                                    exit_days=self.params.exit_days)
+            running_candle = next(ohlc.iloc[-1:][OHLC_COLUMNS].itertuples(index=False, name=None))
+            conditions = indicators.peek(running_candle)
+
+        self.curr_market_conditions = CurrMarketConditions(**conditions)
         self.curr_market_conditions.log_current_market_conditions()
 
     def create_agg_trade_id(self):
@@ -313,7 +242,7 @@ class TurtleTrader:
                              '-> setting balance to last open position free balance')
                 free_balance = last_pos_free_balance
 
-            actual_asset_allocation = self.opened_positions.cost.sum() / total_balance
+            actual_asset_allocation = self.opened_positions_cost / total_balance
             if actual_asset_allocation > MAX_ONE_ASSET_RISK_ALLOCATION:
                 _logger.warning(f'This trade would excess max capital allocation into one asset')
                 raise AssetAllocationOverRiskLimit
@@ -322,9 +251,7 @@ class TurtleTrader:
         else:
             return free_balance
 
-    @retry(retry_on_exception=retry_if_sqlalchemy_transient_error,
-           stop_max_attempt_number=5,
-           wait_exponential_multiplier=2000)
+    @DB_POLICY.retry('db.update_closed_orders')
     def update_closed_orders(self):
         _logger.info('Updating closed orders in db')
         with self._database.session_manager() as session:
@@ -332,50 +259,92 @@ class TurtleTrader:
                 {"position_status": "closed"},
                 synchronize_session=False  # Use 'fetch' if objects are being used in the session
             )
+        get_position_store(self._database).close(self._exchange.market_futures, self.opened_positions_ids)
         _logger.info('Closed orders successfully updated')
 
-    @retry(retry_on_exception=retry_if_sqlalchemy_transient_error,
-           stop_max_attempt_number=5,
-           wait_exponential_multiplier=2000)
+    @DB_POLICY.retry('db.commit_order_to_db')
     def commit_order_to_db(self, order_object: OrderSchema):
+        # read before the commit, the committed object may be expired and detached
+        symbol = order_object.symbol
+        position = LastOpenedPosition.from_order(order_object) if order_object.position_status == 'opened' else None
         with self._database.session_manager() as session:
             session.add(order_object)
+        if position is not None:
+            get_position_store(self._database).add(symbol, position)
         _logger.info('Order successfully saved')
 
-    def save_order(self, order, action, position_status='opened'):
-        _logger.info('Saving order to file and DB')
+    @DB_POLICY.retry('db.commit_close_order')
+    def commit_close_order(self, order_object: OrderSchema):
+        """
+        Unit of work of a position exit. In one transaction the close order is inserted,
+        the positions it closes are marked closed, the P/L summary is updated
+        and the P/L including the close order is read.
+        :return: asset P/L, total P/L
+        """
+        _logger.info('Saving close order and updating closed orders in db')
+        closed_positions = order_object.closed_positions
+        with self._database.session_manager() as session:
+            session.add(order_object)
+            session.flush()
+            session.query(Order).filter(Order.id.in_(closed_positions)).update(
+                {"position_status": "closed"},
+                synchronize_session=False
+            )
+            if order_object.pl is not None:
+                pl_summary.add_pl(session, order_object.symbol, order_object.pl, order_object.timestamp)
+            asset_pl, total_pl = pl_summary.query_pl(session, self._exchange.market_futures)
+        get_position_store(self._database).close(self._exchange.market_futures, closed_positions)
+        _logger.info('Close order saved and closed orders updated')
+
+        return asset_pl, total_pl
+
+    def save_raw_order(self, order):
         try:
-            save_json_to_file(order, f"order_{order['id']}")
+            with span('journal.append'):
+                get_order_journal().append(order)
         except Exception as exc:
-            _logger.error(f"Cannot save json file, skipp. {exc}")
-            _notifier.error(f"Cannot save json file, skipp. {exc}")
-
-        self._exchange.fetch_balance()
+            _logger.error(f"Cannot save order to journal, skipp. {exc}")
+            _notifier.error(f"Cannot save order to journal, skipp. {exc}")
 
-        order_object = OrderSchema().load(order)
+    def build_order_object(self, order, action, position_status='opened'):
+        order_object = load_order(order)
         order_object.atr = self.curr_market_conditions.ATR
         order_object.action = action
         order_object.free_balance = self._exchange.free_balance
         order_object.total_balance = self._exchange.total_balance
+        if self._exchange.balance_stale:
+            _logger.warning(f"Order {order_object.id} is saved with the balance from before the order, "
+                            f"balance refresh failed")
         order_object.position_status = position_status
         order_object.agg_trade_id = self.create_agg_trade_id()
-        atr2 = STOP_LOSS_ATR_MULTIPL * order_object.atr
+        atr2 = self.params.stop_loss_atr_multipl * order_object.atr
         order_object.stop_loss_price = self.get_stop_loss_price(action, atr2)
 
         if action == 'close':
             order_object.closed_positions = self.opened_positions_ids
             order_object.pl, order_object.pl_percent = self.calculate_pl(order_object)
 
+        return order_object
+
+    def save_order(self, order, action, position_status='opened'):
+        _logger.info('Saving order to file and DB')
+        self.save_raw_order(order)
+        # the order is placed, an old balance in its record is better than losing the record
+        self._exchange.fetch_balance(allow_stale=True)
+        order_object = self.build_order_object(order, action, position_status)
         self.commit_order_to_db(order_object)
 
-    def entry_position(self, action):
-        self._exchange.fetch_balance()
+    def calc_entry_amount(self):
+        """Position size from the last fetched balance, None if the trade should be skipped"""
         free_balance = self._exchange.free_balance
         total_balance = self._exchange.total_balance
+        if self._exchange.balance_stale:
+            _logger.warning("Balance is stale, SKIPPING ticker")
+            return
         free_balance = self.recalc_limited_free_entry_balance(free_balance, total_balance)
 
         trade_risk_cap = free_balance * TRADE_RISK_ALLOCATION
-        amount = trade_risk_cap / (STOP_LOSS_ATR_MULTIPL * self.curr_market_conditions.ATR)
+        amount = trade_risk_cap / (self.params.stop_loss_atr_multipl * self.curr_market_conditions.ATR)
         _logger.info(f"Amount before rounding: {amount}")
         amount = get_adjusted_amount(amount, self._exchange.amount_precision)
         _logger.info(f"Amount after precision rounding: {amount}")
@@ -388,9 +357,19 @@ class TurtleTrader:
                             f"SKIPPING ticker")
             return
 
-        _logger.info(f'Creating {action} order. '
-                     f'Adjusted Amount with Precision {self._exchange.amount_precision}: {amount}')
-        order = self._exchange.order(action, amount)
+        return amount
+
+    def entry_position(self, action):
+        # the order invalidates the shared balance, the next entry waiting for the lock fetches it again
+        with get_entry_lock(self._exchange._exchange_id):
+            self._exchange.fetch_balance()
+            amount = self.calc_entry_amount()
+            if amount is None:
+                return
+
+            _logger.info(f'Creating {action} order. '
+                         f'Adjusted Amount with Precision {self._exchange.amount_precision}: {amount}')
+            order = self._exchange.order(action, amount)
 
         if order:
             self.save_order(order, action)
@@ -399,37 +378,47 @@ class TurtleTrader:
         action = 'close'
         order = self._exchange.order(action)
         if order:
-            self.save_order(order, action, position_status='closed')
-            self.update_closed_orders()
-            self.log_total_pl()
+            _logger.info('Saving close order to file and DB')
+            self.save_raw_order(order)
+            self._exchange.fetch_balance(allow_stale=True)
+            order_object = self.build_order_object(order, action, position_status='closed')
+            self.report_pl(*self.commit_close_order(order_object))
+
+    def pyramid_price(self):
+        """Price of the opened position that triggers the next pyramid trade"""
+        pyramid_atr = self.last_opened_position.get_atr_for_pyramid(
+            self.params.aggressive_pyramid_atr_price_ratio_limit
+        )
+        if self.last_opened_position.is_long():
+            return self.last_opened_position.price + pyramid_atr
+        return self.last_opened_position.price - pyramid_atr
 
-    def process_opened_position(self):
+    @property
+    def pyramid_stop(self):
+        # check if number of pyramid trade is over limit
+        return self.n_of_opened_positions > self.params.pyramiding_limit
+
+    def opened_position_action(self):
         _logger.info('Processing opened positions')
 
         curr_mar_cond = self.curr_market_conditions
         last_stop_loss = self.last_opened_position.stop_loss_price
-
-        # set trigger price for pyramid trade
-        pyramid_atr = self.last_opened_position.get_atr_for_pyramid()
-        long_pyramid_price = self.last_opened_position.price + pyramid_atr
-        short_pyramid_price = self.last_opened_position.price - pyramid_atr
-
-        # check if number of pyramid trade is over limit
-        pyramid_stop = self.n_of_opened_positions > PYRAMIDING_LIMIT
+        pyramid_price = self.pyramid_price()
+        pyramid_stop = self.pyramid_stop
 
         if self.last_opened_position.is_long():
             # exit position
             if curr_mar_cond.Long_Exit:
                 _logger.info('Exiting long position/s')
-                self.exit_position()
+                return 'close'
             # add to position -> pyramiding
-            elif curr_mar_cond.C >= long_pyramid_price and not pyramid_stop:
+            elif curr_mar_cond.C >= pyramid_price and not pyramid_stop:
                 _logger.info(f'Adding to long position -> pyramid')
-                self.entry_position('long')
+                return 'long'
             # exit position -> stop loss
             elif curr_mar_cond.C <= last_stop_loss:
                 _logger.info('Initiating long stop-loss')
-                self.exit_position()
+                return 'close'
             else:
                 _logger.info('Staying in position '
                              '-> no condition for opened position is met')
@@ -437,33 +426,48 @@ class TurtleTrader:
             # exit position
             if curr_mar_cond.Short_Exit:
                 _logger.info('Exiting short position/s')
-                self.exit_position()
+                return 'close'
             # add to position -> pyramiding
-            elif curr_mar_cond.C <= short_pyramid_price and not pyramid_stop:
+            elif curr_mar_cond.C <= pyramid_price and not pyramid_stop:
                 _logger.info(f'Adding to short position -> pyramid')
-                self.entry_position('short')
+                return 'short'
             # exit position -> stop loss
             elif curr_mar_cond.C >= last_stop_loss:
                 _logger.info('Initiating short stop-loss')
-                self.exit_position()
+                return 'close'
             else:
                 _logger.info('Staying in position '
                              '-> no condition for opened position is met')
 
-    def trade(self):
+    def entry_action(self):
+        curr_cond = self.curr_market_conditions
+        # entry long
+        if curr_cond.Long_Entry and not curr_cond.Long_Exit:  # safety
+            _logger.info('Long cond is met -> entering long position')
+            return 'long'
+        # entry short
+        elif curr_cond.Short_Entry and not curr_cond.Short_Exit:  # safety
+            _logger.info('Short cond is met -> entering short position')
+            return 'short'
+        # do nothing
+        else:
+            _logger.info('No opened positions and no condition is met for entry -> SKIPPING')
+
+    def next_action(self):
+        """Decide 'long', 'short', 'close' or None from current market conditions and opened positions"""
         if self.opened_positions is None:
-            curr_cond = self.curr_market_conditions
-            # entry long
-            if curr_cond.Long_Entry and not curr_cond.Long_Exit:  # safety
-                _logger.info('Long cond is met -> entering long position')
-                self.entry_position('long')
-            # entry short
-            elif curr_cond.Short_Entry and not curr_cond.Short_Exit:  # safety
-                _logger.info('Short cond is met -> entering short position')
-                self.entry_position('short')
-            # do nothing
-            else:
-                _logger.info('No opened positions and no condition is met for entry -> SKIPPING')
+            return self.entry_action()
         # work with opened position
-        else:
-            self.process_opened_position()
+        return self.opened_position_action()
+
+    def execute_action(self, action):
+        if action == 'close':
+            self.exit_position()
+        elif action:
+            self.entry_position(action)
+
+    def process_opened_position(self):
+        self.execute_action(self.opened_position_action())
+
+    def trade(self):
+        self.execute_action(self.next_action())
@@ -0,0 +1,253 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict
+
+from src.config import METRICS_ENABLED, METRICS_DIR
+
+_logger = logging.getLogger(__name__)
+
+SPAN_LABELS = ('stage', 'exchange', 'ticker', 'attempt', 'status')
+RETRY_LABELS = ('stage', 'exchange', 'ticker')
+PROMETHEUS_FILE = 'trading.prom'
+
+_tags = contextvars.ContextVar('metrics_tags', default={})
+_null_span = nullcontext()
+
+
+class SpanStats:
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+
+class RetryStats:
+    __slots__ = ('retries', 'sleep')
+
+    def __init__(self):
+        self.retries = 0
+        self.sleep = 0.0
+
+
+class MetricsRegistry:
+    """
+    Span timings and retry counters of the process.
+
+    Every stat is kept twice: process totals exported in Prometheus text format and
+    the current run, written as a JSON summary and cleared by `start_run`.
+    Nothing is recorded while `enabled` is False.
+    Gauges (e.g. connection pool health) are not recorded, their sources are read on export.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._spans, self._run_spans = {}, {}
+        self._retries, self._run_retries = {}, {}
+        self._gauges = {}
+        self.run_started = time.time()
+
+    def register_gauges(self, source: str, collect: Callable[[], Dict[str, float]], descriptions: Dict[str, str]):
+        """`collect` returns the current values of `source` by metric name, names ending _total are counters"""
+        with self._lock:
+            self._gauges[source] = (collect, descriptions)
+
+    def gauges(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            sources = dict(self._gauges)
+        return {source: collect() for source, (collect, _) in sources.items()}
+
+    def start_run(self):
+        with self._lock:
+            self._run_spans, self._run_retries = {}, {}
+            self.run_started = time.time()
+
+    def add_span(self, stage: str, seconds: float, error: bool, attempt: int = None):
+        tags = _tags.get()
+        key = (stage, tags.get('exchange', ''), tags.get('ticker', ''),
+               '' if attempt is None else str(attempt), 'error' if error else 'ok')
+        with self._lock:
+            for spans in (self._spans, self._run_spans):
+                stats = spans.get(key)
+                if stats is None:
+                    stats = spans[key] = SpanStats()
+                stats.add(seconds)
+
+    def add_retry(self, stage: str, sleep: float):
+        tags = _tags.get()
+        key = (stage, tags.get('exchange', ''), tags.get('ticker', ''))
+        with self._lock:
+            for retries in (self._retries, self._run_retries):
+                stats = retries.get(key)
+                if stats is None:
+                    stats = retries[key] = RetryStats()
+                stats.retries += 1
+                stats.sleep += sleep
+
+    def summary(self) -> dict:
+        """Current run: totals per stage and every span key, slowest first"""
+        with self._lock:
+            spans = [dict(zip(SPAN_LABELS, key), count=stats.count, total=stats.total, max=stats.max)
+                     for key, stats in self._run_spans.items()]
+            retries = [dict(zip(RETRY_LABELS, key), retries=stats.retries, sleep=stats.sleep)
+                       for key, stats in self._run_retries.items()]
+
+        stages = {}
+        for span in spans:
+            stage = stages.setdefault(span['stage'], dict(count=0, errors=0, total=0.0, max=0.0,
+                                                          retries=0, retry_sleep=0.0))
+            stage['count'] += span['count']
+            stage['errors'] += span['count'] if span['status'] == 'error' else 0
+            stage['total'] += span['total']
+            stage['max'] = max(stage['max'], span['max'])
+        for retry in retries:
+            stage = stages.setdefault(retry['stage'], dict(count=0, errors=0, total=0.0, max=0.0,
+                                                           retries=0, retry_sleep=0.0))
+            stage['retries'] += retry['retries']
+            stage['retry_sleep'] += retry['sleep']
+
+        return {
+            'started_at': self.run_started,
+            'finished_at': time.time(),
+            'stages': dict(sorted(stages.items(), key=lambda item: item[1]['total'], reverse=True)),
+            'spans': sorted(spans, key=lambda span: span['total'], reverse=True),
+            'retries': sorted(retries, key=lambda retry: retry['sleep'], reverse=True),
+            'gauges': self.gauges(),
+        }
+
+    def prometheus(self) -> str:
+        """Process totals in Prometheus text exposition format"""
+        with self._lock:
+            spans = [(labels(SPAN_LABELS, key), stats.count, stats.total, stats.max)
+                     for key, stats in self._spans.items()]
+            retries = [(labels(RETRY_LABELS, key), stats.retries, stats.sleep)
+                       for key, stats in self._retries.items()]
+            descriptions = {name: description for _, source_descriptions in self._gauges.values()
+                            for name, description in source_descriptions.items()}
+        gauges = self.gauges()
+
+        lines = ['# HELP trading_span_seconds Time spent in a trading cycle stage.',
+                 '# TYPE trading_span_seconds summary']
+        for label, count, total, _ in spans:
+            lines.append(f"trading_span_seconds_count{{{label}}} {count}")
+            lines.append(f"trading_span_seconds_sum{{{label}}} {total:.6f}")
+        lines += ['# HELP trading_span_seconds_max Longest span of a trading cycle stage.',
+                  '# TYPE trading_span_seconds_max gauge']
+        lines += [f"trading_span_seconds_max{{{label}}} {maximum:.6f}" for label, _, _, maximum in spans]
+        lines += ['# HELP trading_retries_total Failed attempts followed by a retry.',
+                  '# TYPE trading_retries_total counter']
+        lines += [f"trading_retries_total{{{label}}} {count}" for label, count, _ in retries]
+        lines += ['# HELP trading_retry_sleep_seconds_total Time slept in retry backoff.',
+                  '# TYPE trading_retry_sleep_seconds_total counter']
+        lines += [f"trading_retry_sleep_seconds_total{{{label}}} {sleep:.6f}" for label, _, sleep in retries]
+        for name, description in descriptions.items():
+            lines += [f'# HELP trading_{name} {description}',
+                      f"# TYPE trading_{name} {'counter' if name.endswith('_total') else 'gauge'}"]
+            lines += [f'trading_{name}{{source="{escape(source)}"}} {values[name]}'
+                      for source, values in gauges.items() if name in values]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, metrics_dir: str = METRICS_DIR) -> str:
+        """Write the Prometheus textfile and the JSON summary of the run, returns the summary path"""
+        os.makedirs(metrics_dir, exist_ok=True)
+        summary = self.summary()
+        summary_path = os.path.join(
+            metrics_dir, f"run-{time.strftime('%Y%m%dT%H%M%S', time.gmtime(summary['started_at']))}.json")
+        write_atomic(summary_path, json.dumps(summary, indent=4))
+        # textfile collector reads *.prom, never let it see a half written file
+        write_atomic(os.path.join(metrics_dir, PROMETHEUS_FILE), self.prometheus())
+        return summary_path
+
+
+def labels(names, values) -> str:
+    return ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values) if value != '')
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_atomic(path: str, text: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as ff:
+        ff.write(text)
+    os.replace(tmp_path, path)
+
+
+registry = MetricsRegistry()
+
+
+def enable(enabled: bool = True):
+    registry.enabled = enabled
+
+
+@contextmanager
+def tagged(**tags):
+    """Tag spans recorded in this context (thread or asyncio task), e.g. exchange and ticker"""
+    token = _tags.set({**_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+@contextmanager
+def _span(stage: str, attempt: int = None):
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        registry.add_span(stage, time.perf_counter() - start, error, attempt)
+
+
+def span(stage: str, attempt: int = None):
+    """Time the block as `stage`, a shared no-op context manager when metrics are disabled"""
+    if not registry.enabled:
+        return _null_span
+    return _span(stage, attempt)
+
+
+def record_retry(stage: str, sleep: float):
+    """Count a retry of `stage` followed by `sleep` seconds of backoff"""
+    if registry.enabled:
+        registry.add_retry(stage, sleep)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = registry.prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        _logger.debug(format % args)
+
+
+def serve(port: int) -> ThreadingHTTPServer:
+    """Serve the process totals for Prometheus scraping from a daemon thread"""
+    server = ThreadingHTTPServer(('', port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    _logger.info(f"Serving metrics on port {port}")
+    return server
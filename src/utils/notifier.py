@@ -0,0 +1,141 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from slack_bot.notifications import SlackNotifier
+
+from src.config import NOTIFY_QUEUE_SIZE, NOTIFY_BATCH_WINDOW, NOTIFY_MAX_MESSAGE_CHARS, NOTIFY_FLUSH_TIMEOUT
+from src.utils.metrics import span
+
+_logger = logging.getLogger(__name__)
+
+
+def chunk_messages(messages, max_chars):
+    """Join messages with blank lines into chunks of at most max_chars (a longer single message stays whole)"""
+    chunk, size = [], 0
+    for message in messages:
+        if chunk and size + len(message) + 2 > max_chars:
+            yield '\n\n'.join(chunk)
+            chunk, size = [], 0
+        chunk.append(message)
+        size += len(message) + 2
+    if chunk:
+        yield '\n\n'.join(chunk)
+
+
+class NotificationDispatcher:
+    """
+    Sends notifications from a background thread.
+
+    `submit` never blocks: messages go to a bounded queue, when it is full the message
+    is dropped and counted. The sender waits `batch_window` seconds after the first message
+    of a burst and sends the collected messages joined per notifier and level.
+    Pending messages are flushed on interpreter exit.
+    """
+
+    def __init__(self,
+                 maxsize: int = NOTIFY_QUEUE_SIZE,
+                 batch_window: float = NOTIFY_BATCH_WINDOW,
+                 max_chars: int = NOTIFY_MAX_MESSAGE_CHARS):
+        self.batch_window = batch_window
+        self.max_chars = max_chars
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize)
+        self._flushing = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='notifications', daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def submit(self, notifier, level: str, message: str):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((notifier, level, message))
+        except queue.Full:
+            self.dropped += 1
+            _logger.warning(f"Notification queue full, dropped {self.dropped} messages so far")
+
+    def _collect(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if self._flushing.is_set() or remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                return batch
+
+    def _send(self, batch: list):
+        groups = {}
+        for notifier, level, message in batch:
+            groups.setdefault((notifier, level), []).append(message)
+
+        for (notifier, level), messages in groups.items():
+            for text in chunk_messages(messages, self.max_chars):
+                try:
+                    with span('notifier.send'):
+                        getattr(notifier.slack, level)(text)
+                except Exception as exc:
+                    _logger.error(f"Cannot send notification: {exc}")
+
+    def _run(self):
+        while True:
+            batch = self._collect(self._queue.get())
+            try:
+                self._send(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self, timeout: float = NOTIFY_FLUSH_TIMEOUT):
+        """Wait until queued messages are sent, at most timeout seconds"""
+        if self._thread is None:
+            return
+        self._flushing.set()
+        deadline = time.monotonic() + timeout
+        try:
+            with self._queue.all_tasks_done:
+                while self._queue.unfinished_tasks:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        _logger.warning(f"Notifications not flushed in {timeout}s, "
+                                        f"{self._queue.unfinished_tasks} messages lost")
+                        return
+                    self._queue.all_tasks_done.wait(remaining)
+        finally:
+            self._flushing.clear()
+
+
+_dispatcher = NotificationDispatcher()
+
+
+class QueuedNotifier:
+    """SlackNotifier with the same interface whose messages are sent by the background dispatcher"""
+
+    def __init__(self, *args, dispatcher: NotificationDispatcher = None, **kwargs):
+        self.slack = SlackNotifier(*args, **kwargs)
+        self._dispatcher = dispatcher if dispatcher else _dispatcher
+
+    def info(self, message):
+        self._dispatcher.submit(self, 'info', message)
+
+    def warning(self, message):
+        self._dispatcher.submit(self, 'warning', message)
+
+    def error(self, message):
+        self._dispatcher.submit(self, 'error', message)
+
+
+def flush_notifications(timeout: float = NOTIFY_FLUSH_TIMEOUT):
+    _dispatcher.flush(timeout)
@@ -0,0 +1,258 @@
+import fcntl
+import glob
+import gzip
+import json
+import logging
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Iterator, NamedTuple, Tuple
+
+from src.config import ORDER_JOURNAL_DIR, ORDER_JOURNAL_SEGMENT_BYTES, ORDER_JOURNAL_FSYNC
+
+_logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.tsv'
+LOCK_FILE = 'journal.lock'
+SCAN_CHUNK_BYTES = 64 * 1024
+
+
+class IndexEntry(NamedTuple):
+    segment: str
+    offset: int
+    length: int
+
+
+def scan_members(path: str, start: int = 0) -> Iterator[Tuple[int, int, bytes]]:
+    """(offset, length, data) of the complete gzip members of a segment from `start`, stops at a torn member"""
+    with open(path, 'rb') as ff:
+        ff.seek(start)
+        offset, pending = start, b''
+        while True:
+            decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+            data, length = [], 0
+            while not decompressor.eof:
+                chunk = pending or ff.read(SCAN_CHUNK_BYTES)
+                pending = b''
+                if not chunk:
+                    return
+                try:
+                    data.append(decompressor.decompress(chunk))
+                except zlib.error:
+                    return
+                pending = decompressor.unused_data
+                length += len(chunk) - len(pending)
+            yield offset, length, b''.join(data)
+            offset += length
+
+
+class OrderJournal:
+    """
+    Append-only journal of raw exchange orders.
+
+    Every order is one JSON line compressed as its own gzip member and appended to the
+    current segment (orders-<n>.jsonl.gz), segments rotate at `segment_bytes`. A segment is
+    a regular gzip file, `zcat` prints its orders. The index (id, segment, offset, length per line)
+    is loaded into a dict, so `get` decompresses a single member. Appends are serialized
+    by a file lock, several processes can write to one journal.
+
+    Segments are the source of truth, only they are synced. Before an append the tail of the
+    segments after the last index line is scanned: records whose index line was lost in a crash
+    are indexed again and a record torn by a crash is cut, so the next one is not written after it.
+    """
+
+    def __init__(self,
+                 journal_dir: str = ORDER_JOURNAL_DIR,
+                 segment_bytes: int = ORDER_JOURNAL_SEGMENT_BYTES,
+                 fsync: bool = ORDER_JOURNAL_FSYNC):
+        self.journal_dir = journal_dir
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        os.makedirs(journal_dir, exist_ok=True)
+
+        self._index_path = os.path.join(journal_dir, INDEX_FILE)
+        self._lock_path = os.path.join(journal_dir, LOCK_FILE)
+        self._thread_lock = threading.RLock()
+        self._index = {}
+        self._index_read_pos = 0
+        self._last_entry: IndexEntry = None
+        self._refresh_index()
+
+    def _refresh_index(self):
+        """Read index lines appended since the last read (also by other processes)"""
+        if not os.path.exists(self._index_path):
+            return
+        with open(self._index_path) as ff:
+            ff.seek(self._index_read_pos)
+            for line in ff:
+                if not line.endswith('\n'):
+                    break  # line being written
+                order_id, segment, offset, length = line.rstrip('\n').split('\t')
+                self._index[order_id] = self._last_entry = IndexEntry(segment, int(offset), int(length))
+                self._index_read_pos += len(line.encode())
+
+    def _write_index(self, order_id: str, entry: IndexEntry):
+        line = f"{order_id}\t{entry.segment}\t{entry.offset}\t{entry.length}\n"
+        with open(self._index_path, 'a') as ff:
+            ff.write(line)
+        self._index[order_id] = self._last_entry = entry
+        self._index_read_pos += len(line.encode())
+
+    def _recover(self):
+        """Index records written after the last index line and cut a torn record, under the lock after _refresh_index"""
+        if os.path.exists(self._index_path) and os.path.getsize(self._index_path) > self._index_read_pos:
+            _logger.warning(f"Cutting a torn line at the end of {self._index_path}")
+            os.truncate(self._index_path, self._index_read_pos)
+
+        last = self._last_entry
+        for segment_path in self.segments():
+            segment = os.path.basename(segment_path)
+            if last is not None and segment < last.segment:
+                continue
+            end = last.offset + last.length if last is not None and segment == last.segment else 0
+            if os.path.getsize(segment_path) == end:
+                continue
+            for offset, length, data in scan_members(segment_path, end):
+                order_id = str(json.loads(data)['id'])
+                if order_id not in self._index:
+                    _logger.warning(f"Indexing order {order_id} missing in {INDEX_FILE}")
+                    self._write_index(order_id, IndexEntry(segment, offset, length))
+                end = offset + length
+            if os.path.getsize(segment_path) > end:
+                _logger.warning(f"Cutting a torn record at {end} of {segment_path}")
+                os.truncate(segment_path, end)
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock, open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.journal_dir, 'orders-*.jsonl.gz')))
+
+    def _current_segment(self, size: int) -> str:
+        segments = self.segments()
+        if segments and os.path.getsize(segments[-1]) + size <= self.segment_bytes:
+            return segments[-1]
+        number = int(os.path.basename(segments[-1])[7:13]) + 1 if segments else 1
+        return os.path.join(self.journal_dir, f"orders-{number:06d}.jsonl.gz")
+
+    def append(self, order: dict) -> bool:
+        """Append an order, returns False if an order with the same id is already journaled"""
+        order_id = str(order['id'])
+        member = gzip.compress((json.dumps(order, ensure_ascii=False) + '\n').encode())
+
+        with self._locked():
+            self._refresh_index()
+            self._recover()
+            if order_id in self._index:
+                return False
+
+            segment_path = self._current_segment(len(member))
+            with open(segment_path, 'ab') as ff:
+                offset = ff.tell()
+                ff.write(member)
+                ff.flush()
+                if self.fsync:
+                    os.fsync(ff.fileno())
+            # not synced, a lost index line is rebuilt from the segment
+            self._write_index(order_id, IndexEntry(os.path.basename(segment_path), offset, len(member)))
+        return True
+
+    def get(self, order_id) -> dict:
+        """Order by id, KeyError if it is not journaled"""
+        order_id = str(order_id)
+        with self._thread_lock:
+            if order_id not in self._index:
+                self._refresh_index()
+            if order_id not in self._index:
+                with self._locked():
+                    self._refresh_index()
+                    self._recover()
+            entry = self._index[order_id]
+
+        with open(os.path.join(self.journal_dir, entry.segment), 'rb') as ff:
+            ff.seek(entry.offset)
+            return json.loads(gzip.decompress(ff.read(entry.length)))
+
+    def __contains__(self, order_id) -> bool:
+        with self._thread_lock:
+            self._refresh_index()
+            return str(order_id) in self._index
+
+    def __len__(self) -> int:
+        with self._thread_lock:
+            self._refresh_index()
+            return len(self._index)
+
+    def __iter__(self) -> Iterator[dict]:
+        """All indexed orders in the order they were journaled, bytes of torn records are never read"""
+        with self._thread_lock:
+            self._refresh_index()
+            entries = sorted(self._index.values())
+        ff = None
+        try:
+            for entry in entries:
+                if ff is None or os.path.basename(ff.name) != entry.segment:
+                    if ff is not None:
+                        ff.close()
+                    ff = open(os.path.join(self.journal_dir, entry.segment), 'rb')
+                ff.seek(entry.offset)
+                yield json.loads(gzip.decompress(ff.read(entry.length)))
+        finally:
+            if ff is not None:
+                ff.close()
+
+    def iter_orders(self, since: int = None, symbol: str = None) -> Iterator[dict]:
+        """Orders for replay and audit, optionally from timestamp (ms) and of one symbol"""
+        for order in self:
+            if since is not None and (order.get('timestamp') or 0) < since:
+                continue
+            if symbol is not None and order.get('symbol') != symbol:
+                continue
+            yield order
+
+
+def pack_order_files(journal: OrderJournal, source_dir: str, remove: bool = False) -> int:
+    """Move order_<id>.json files into the journal (oldest first), returns number of packed orders"""
+    paths = sorted(glob.glob(os.path.join(source_dir, 'order_*.json')), key=os.path.getmtime)
+    packed = 0
+    # one sync for the whole migration instead of one per order, files are removed only after it
+    fsync, journal.fsync = journal.fsync, False
+    try:
+        for path in paths:
+            try:
+                with open(path) as ff:
+                    order = json.load(ff)
+            except (OSError, ValueError) as exc:
+                _logger.error(f"Cannot read {path}, skipping: {exc}")
+                continue
+            if journal.append(order):
+                packed += 1
+        os.sync()
+    finally:
+        journal.fsync = fsync
+
+    if remove:
+        for path in paths:
+            if os.path.basename(path)[6:-5] in journal:
+                os.remove(path)
+    _logger.info(f"Packed {packed} of {len(paths)} order files into {journal.journal_dir}")
+    return packed
+
+
+_order_journal = None
+_order_journal_lock = threading.Lock()
+
+
+def get_order_journal() -> OrderJournal:
+    global _order_journal
+    with _order_journal_lock:
+        if _order_journal is None:
+            _order_journal = OrderJournal()
+        return _order_journal
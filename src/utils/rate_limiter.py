@@ -0,0 +1,200 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import ccxt
+
+from src.config import (RATE_LIMIT_ENABLED,
+                        RATE_LIMIT_SAFETY,
+                        RATE_LIMIT_STATE_DIR,
+                        RATE_LIMIT_WINDOW,
+                        USED_WEIGHT_HEADERS)
+
+_logger = logging.getLogger(__name__)
+
+
+class WeightLimiter:
+    """
+    Token bucket of request weight shared by every exchange object of one exchange id.
+
+    The bucket holds `capacity` weight (ccxt endpoint costs) of one `window` and refills evenly,
+    so bursts are allowed until the budget is used and calls are then spread over the window.
+    Used weight reported by the exchange (X-MBX-USED-WEIGHT-1M on binance) caps the tokens,
+    weight used by other clients of the same IP is accounted too. A 429/418 blocks all calls
+    for Retry-After seconds (a whole window without the header).
+
+    With `state_path` the bucket lives in a flock-ed file and is shared by all processes using the path.
+    """
+
+    def __init__(self,
+                 capacity: float,
+                 window: float = RATE_LIMIT_WINDOW,
+                 header: str = None,
+                 header_limit: float = None,
+                 safety: float = RATE_LIMIT_SAFETY,
+                 state_path: str = None):
+        self.capacity = capacity * safety
+        self.rate = self.capacity / window
+        self.window = window
+        self.header = header.lower() if header else None
+        self.header_limit = header_limit
+        self.safety = safety
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self._state = {'tokens': self.capacity, 'updated': time.time(), 'blocked_until': 0.0}
+
+    @contextmanager
+    def _locked_state(self):
+        with self._lock:
+            if self.state_path is None:
+                yield self._state
+                return
+
+            # r+ on a file created if missing, writes of 'a' mode would always append
+            with os.fdopen(os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o644), 'r+') as ff:
+                fcntl.flock(ff, fcntl.LOCK_EX)
+                try:
+                    content = ff.read()
+                    state = json.loads(content) if content else dict(self._state)
+                    yield state
+                    ff.seek(0)
+                    ff.truncate()
+                    ff.write(json.dumps(state))
+                    ff.flush()
+                finally:
+                    fcntl.flock(ff, fcntl.LOCK_UN)
+
+    def _refill(self, state: dict, now: float):
+        elapsed = max(0.0, now - state['updated'])
+        state['tokens'] = min(self.capacity, state['tokens'] + elapsed * self.rate)
+        state['updated'] = now
+
+    def reserve(self, cost: float) -> float:
+        """Take `cost` tokens and return 0, or return seconds to wait before asking again"""
+        # a call costlier than the whole bucket waits for a full bucket
+        cost = min(cost, self.capacity)
+        with self._locked_state() as state:
+            now = time.time()
+            self._refill(state, now)
+            if now < state['blocked_until']:
+                return state['blocked_until'] - now
+            if state['tokens'] >= cost:
+                state['tokens'] -= cost
+                return 0.0
+            return (cost - state['tokens']) / self.rate
+
+    def throttle(self, cost: float = None):
+        while True:
+            wait = self.reserve(cost or 1)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def async_throttle(self, cost: float = None):
+        while True:
+            wait = self.reserve(cost or 1)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def observe(self, headers):
+        """Cap the tokens by the weight the exchange says is used in its current window"""
+        used = header_value(headers, self.header) if self.header and self.header_limit else None
+        if used is None:
+            return
+        remaining = self.capacity - used / self.header_limit * self.capacity / self.safety
+        with self._locked_state() as state:
+            self._refill(state, time.time())
+            state['tokens'] = min(state['tokens'], remaining)
+
+    def block(self, headers):
+        """The exchange rejected us for request rate, stop all calls for Retry-After (or a window)"""
+        retry_after = header_value(headers, 'retry-after')
+        seconds = retry_after if retry_after is not None else self.window
+        with self._locked_state() as state:
+            state['blocked_until'] = max(state['blocked_until'], time.time() + seconds)
+            state['tokens'] = 0.0
+        _logger.warning(f"Rate limited by exchange, all requests blocked for {seconds:.0f}s")
+
+
+def header_value(headers, name: str):
+    if not headers or not name:
+        return None
+    for key, value in headers.items():
+        if key.lower() == name:
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def attach_rate_limiter(exchange, limiter: WeightLimiter):
+    """
+    Route the throttling of a ccxt (sync or async) exchange object through the shared limiter
+    and feed it the response headers. ccxt keeps computing the per-endpoint costs.
+    """
+    fetch = exchange.fetch
+    rate_limit_errors = (ccxt.RateLimitExceeded, ccxt.DDoSProtection)
+
+    if asyncio.iscoroutinefunction(fetch):
+        async def limited_fetch(*args, **kwargs):
+            try:
+                response = await fetch(*args, **kwargs)
+            except rate_limit_errors:
+                limiter.block(exchange.last_response_headers)
+                raise
+            limiter.observe(exchange.last_response_headers)
+            return response
+
+        exchange.throttle = limiter.async_throttle
+    else:
+        def limited_fetch(*args, **kwargs):
+            try:
+                response = fetch(*args, **kwargs)
+            except rate_limit_errors:
+                limiter.block(exchange.last_response_headers)
+                raise
+            limiter.observe(exchange.last_response_headers)
+            return response
+
+        exchange.throttle = limiter.throttle
+
+    exchange.fetch = limited_fetch
+    exchange.enableRateLimit = True
+    return exchange
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(exchange_id: str, rate_limit_ms: float) -> WeightLimiter:
+    """
+    Limiter of the exchange id, created on first use from the exchange's ccxt rateLimit
+    (ms per unit of cost), so the budget is the one ccxt keeps for a single instance
+    """
+    with _limiters_lock:
+        if exchange_id not in _limiters:
+            header, header_limit = USED_WEIGHT_HEADERS.get(exchange_id, (None, None))
+            state_path = None
+            if RATE_LIMIT_STATE_DIR:
+                os.makedirs(RATE_LIMIT_STATE_DIR, exist_ok=True)
+                state_path = os.path.join(RATE_LIMIT_STATE_DIR, f"{exchange_id}.json")
+            _limiters[exchange_id] = WeightLimiter(RATE_LIMIT_WINDOW * 1000 / rate_limit_ms,
+                                                   header=header,
+                                                   header_limit=header_limit,
+                                                   state_path=state_path)
+        return _limiters[exchange_id]
+
+
+def share_rate_limit(exchange_id: str, exchange):
+    """Attach the process (or host, see RATE_LIMIT_STATE_DIR) wide limiter to a new exchange object"""
+    if not RATE_LIMIT_ENABLED or not getattr(exchange, 'rateLimit', None):
+        return exchange
+    return attach_rate_limiter(exchange, get_rate_limiter(exchange_id, exchange.rateLimit))
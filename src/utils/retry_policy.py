@@ -0,0 +1,233 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Tuple, Type, Union
+
+from src.config import (RETRY_MAX_DELAY,
+                        RETRY_JITTER,
+                        CIRCUIT_FAILURE_THRESHOLD,
+                        CIRCUIT_RESET_TIMEOUT)
+from src.utils.metrics import span, record_retry
+
+_logger = logging.getLogger(__name__)
+
+# monotonic time the current cycle (thread or task) has to finish its retries by
+_deadline = contextvars.ContextVar('retry_deadline', default=None)
+
+
+class CircuitOpenError(Exception):
+    """Endpoint failed too many times in a row, calls fail fast until the circuit resets"""
+
+
+@contextmanager
+def retry_deadline(deadline: float):
+    """Retries in this context (thread or asyncio task) stop at `deadline` (time.monotonic), None for no limit"""
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> float:
+    deadline = _deadline.get()
+    return float('inf') if deadline is None else deadline - time.monotonic()
+
+
+class CircuitBreaker:
+    """
+    Consecutive transient failures of one endpoint.
+
+    After `failure_threshold` failures the circuit opens and calls raise CircuitOpenError
+    for `reset_timeout` seconds, then a single trial call is let through (half open):
+    its success closes the circuit, its failure opens it again. A trial ending without
+    an outcome (cancelled, interrupted) is released, the next call is the trial.
+    """
+
+    def __init__(self,
+                 name: str,
+                 failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+            if retry_in > 0 or self._trial:
+                raise CircuitOpenError(f"{self.name} circuit open after {self.failures} failures, "
+                                       f"next trial in {max(0.0, retry_in):.0f}s")
+            self._trial = True
+
+    def success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                _logger.info(f"{self.name} circuit closed")
+            self.failures, self.opened_at, self._trial = 0, None, False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or (self.opened_at is None and self.failures >= self.failure_threshold):
+                _logger.warning(f"{self.name} circuit opened after {self.failures} failures")
+                self.opened_at, self._trial = time.monotonic(), False
+
+    def abandon(self):
+        """The call ended without success or failure"""
+        with self._lock:
+            self._trial = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+ExceptionMatcher = Union[Tuple[Type[BaseException], ...], Callable[[BaseException], bool]]
+
+
+def matches(matcher: ExceptionMatcher, exc: BaseException) -> bool:
+    if isinstance(matcher, tuple):
+        return isinstance(exc, matcher)
+    return matcher(exc)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    How a call is retried.
+
+    Waits grow exponentially from `base_delay` up to `max_delay` and are jittered
+    (each wait is drawn from [1 - jitter, 1] of the exponential one), so workers failing
+    together do not retry together. A retry is given up when its wait would pass the
+    cycle deadline (see retry_deadline). `retry_on` is a tuple of exception types or a predicate.
+
+    Policies of non idempotent calls (orders) retry only errors the exchange raises before
+    executing the request, e.g. rate limits, a timeout may hide a filled order.
+    `failure_on` are the errors counted by the endpoint circuit breaker, `retry_on` by default.
+    """
+    retry_on: ExceptionMatcher
+    attempts: int = 5
+    base_delay: float = 1.0
+    max_delay: float = RETRY_MAX_DELAY
+    jitter: float = RETRY_JITTER
+    failure_on: ExceptionMatcher = None
+    circuit_breaker: bool = True
+
+    def should_retry(self, exc: BaseException) -> bool:
+        return matches(self.retry_on, exc)
+
+    def is_failure(self, exc: BaseException) -> bool:
+        return matches(self.failure_on if self.failure_on is not None else self.retry_on, exc)
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait after the failed attempt number `attempt` (from 1)"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    def _next_delay(self, stage: str, attempt: int, exc: BaseException):
+        """Seconds to wait before the next attempt, None if the error has to be raised"""
+        if not self.should_retry(exc) or attempt >= self.attempts:
+            return None
+        delay = self.delay(attempt)
+        if delay > remaining_budget():
+            _logger.warning(f"{stage} attempt {attempt} failed: {exc}, cycle retry budget exhausted")
+            return None
+        _logger.warning(f"{stage} attempt {attempt} failed: {exc}, retrying in {delay:.2f} seconds")
+        record_retry(stage, delay)
+        return delay
+
+    def _breaker(self, stage: str, args: tuple):
+        if not self.circuit_breaker:
+            return None
+        # methods of exchange adapters get a breaker per exchange, an outage of one venue does not block others
+        exchange_id = getattr(args[0], '_exchange_id', None) if args else None
+        return get_circuit_breaker(f"{exchange_id}:{stage}" if exchange_id else stage)
+
+    def retry(self, stage: str):
+        """Decorator running a function or a coroutine function under this policy, `stage` names the endpoint"""
+
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    breaker = self._breaker(stage, args)
+                    attempt = 1
+                    while True:
+                        if breaker:
+                            breaker.before_call()
+                        try:
+                            with span(stage, attempt):
+                                result = await func(*args, **kwargs)
+                        except Exception as exc:
+                            if breaker:
+                                # other errors are answers of a working endpoint
+                                breaker.failure() if self.is_failure(exc) else breaker.success()
+                            delay = self._next_delay(stage, attempt, exc)
+                            if delay is None:
+                                raise
+                            await asyncio.sleep(delay)
+                            attempt += 1
+                            continue
+                        except BaseException:
+                            # cancelled or interrupted, a half open trial is released
+                            if breaker:
+                                breaker.abandon()
+                            raise
+                        if breaker:
+                            breaker.success()
+                        return result
+
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                breaker = self._breaker(stage, args)
+                attempt = 1
+                while True:
+                    if breaker:
+                        breaker.before_call()
+                    try:
+                        with span(stage, attempt):
+                            result = func(*args, **kwargs)
+                    except Exception as exc:
+                        if breaker:
+                            # other errors are answers of a working endpoint
+                            breaker.failure() if self.is_failure(exc) else breaker.success()
+                        delay = self._next_delay(stage, attempt, exc)
+                        if delay is None:
+                            raise
+                        time.sleep(delay)
+                        attempt += 1
+                        continue
+                    except BaseException:
+                        # interrupted, a half open trial is released
+                        if breaker:
+                            breaker.abandon()
+                        raise
+                    if breaker:
+                        breaker.success()
+                    return result
+
+            return wrapper
+
+        return decorator
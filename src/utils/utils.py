@@ -1,8 +1,11 @@
 import json
+import logging
 import os
 
 from src.config import TRADING_DATA_DIR
 
+_logger = logging.getLogger(__name__)
+
 
 def significant_round(num, places):
     """
@@ -40,3 +43,4 @@ def get_adjusted_amount(amount, precision):
         return max(1, round(amount))
     else:
         return round(amount, precision)
+
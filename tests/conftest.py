@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# modules of src import each other by module name, like the trader run from src
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'src')]
@@ -0,0 +1,32 @@
+import glob
+import os
+
+import pandas as pd
+import pytest
+
+from benchmarks.reference_indicators import reference_indicators
+from config import ATR_PERIOD, TURTLE_ENTRY_DAYS, TURTLE_EXIT_DAYS
+from turtle_indicators import TurtleIndicators
+
+FIXTURES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'data', 'test_ohlc_*.csv')))
+# (atr_period, entry_days, exit_days), the configured ones and short windows filled within the fixtures
+PARAMS = [(ATR_PERIOD, TURTLE_ENTRY_DAYS, TURTLE_EXIT_DAYS), (5, 7, 3)]
+FIELDS = ['ATR', 'd20_High', 'd20_Low', 'd10_High', 'd10_Low']
+SIGNALS = ['Long_Entry', 'Short_Entry', 'Long_Exit', 'Short_Exit']
+
+
+@pytest.mark.parametrize('atr_period, entry_days, exit_days', PARAMS)
+@pytest.mark.parametrize('fixture', FIXTURES, ids=os.path.basename)
+def test_peek_matches_pandas_reference(fixture, atr_period, entry_days, exit_days):
+    ohlc = pd.read_csv(fixture)
+    expected = reference_indicators(ohlc, atr_period, entry_days, exit_days)
+    kwargs = dict(atr_period=atr_period, entry_days=entry_days, exit_days=exit_days)
+
+    for row in range(len(ohlc)):
+        indicators = TurtleIndicators.from_ohlc(ohlc.iloc[:row], **kwargs)
+        conditions = indicators.peek(tuple(ohlc.iloc[row][['timeframe', 'O', 'H', 'L', 'C', 'V']]))
+        for field in FIELDS:
+            assert conditions[field] == pytest.approx(expected[field].iloc[row]), (row, field)
+        for signal in SIGNALS:
+            assert conditions[signal] == expected[signal].iloc[row], (row, signal)
+        assert conditions['datetime'] == expected['datetime'].iloc[row]